@@ -1,29 +1,144 @@
 # --- imports (deduped) ---
 import os
-import requests
+import click
 from functools import wraps
-from flask import Flask, render_template, request, redirect, url_for, session, flash, abort
-
-import uuid
-from datetime import datetime
+from flask import (Flask, Response, before_render_template, g, render_template, request, redirect,
+                   stream_with_context, template_rendered, url_for, session, flash, abort)
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+
+import json
+import math
+import queue
+import sys
+import threading
+import time
+from itertools import islice
+from datetime import date, datetime, timedelta
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
 
+from assets import AssetManifest
+from gallery import GalleryCatalog
+from history import RANGES, sparkline, zone
+from media import OFFLOAD_MODES, send_media
+from metrics import Registry
+from pagecache import PageCache
+from ratelimit import AdmissionGate, RateLimiter, client_ip, parse_networks, parse_rate
+from recaptcha import GOOGLE_VERIFY_URL, RecaptchaVerifier
+from records import new_id
+from scheduler import ReminderScheduler
+from storage import ALL, KINDS, ConflictError, Derived, SQLiteStore, flag, open_store
+from thumbnails import ThumbnailPipeline
+from transfer import BATCH, export_lines, import_lines
+from uploads import UploadRequest, blob_path, set_aside, store_blob
+
 
 # ----------------- app config -----------------
 app = Flask(__name__)
+app.request_class = UploadRequest
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "replace-with-a-strong-secret-key")
 
 UPLOAD_FOLDER = os.path.join(app.static_folder, "uploads")
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 ALLOWED_UPLOADS = {".pdf", ".png", ".jpg", ".jpeg", ".webp"}
+# Larger request bodies get a 413 before any of the body is read.
+app.config["MAX_CONTENT_LENGTH"] = int(os.getenv("UPLOAD_MAX_BYTES", str(16 * 1024 * 1024)))
+UploadRequest.upload_endpoints = {"patient_upload"}
+UploadRequest.upload_tmp_dir = os.path.join(UPLOAD_FOLDER, ".tmp")
+
+
+# Registered first: every other hook may need what create_app() (see
+# "startup" below) sets up, e.g. the store behind the rate limiter.
+@app.before_request
+def _ensure_started():
+    if _started_pid != os.getpid():
+        create_app()
+
+# ----------------- async serving -----------------
+# GUNICORN_WORKER_CLASS=gevent (gunicorn.conf.py) runs every request in a
+# greenlet, so a login waiting on reCAPTCHA, an upload still arriving or a
+# media file going out holds a socket, not a worker thread. The worker
+# patches the stdlib before importing this module (requests, time.sleep and
+# queue waits all yield); GREEN tells the pieces that care.
+def _gevent_patched():
+    monkey = sys.modules.get("gevent.monkey")
+    return monkey is not None and monkey.is_module_patched("socket")
+
+
+GREEN = _gevent_patched()
 
 # reCAPTCHA keys (use env in prod)
 RECAPTCHA_SITE_KEY = os.getenv("RECAPTCHA_SITE_KEY", "6LfwdfwrAAAAAESV51neAuSLo-zsjhRPdpJhyITC")
 RECAPTCHA_SECRET_KEY = os.getenv("RECAPTCHA_SECRET_KEY", "6LfwdfwrAAAAAGOwW00J_Ki2xr7ugpericDScek-")
+# Point RECAPTCHA_VERIFY_URL at a local stub for load tests. While the
+# verifier is down the breaker answers with RECAPTCHA_FAIL_OPEN (default: reject).
+RECAPTCHA = RecaptchaVerifier(
+    RECAPTCHA_SECRET_KEY,
+    url=os.getenv("RECAPTCHA_VERIFY_URL", GOOGLE_VERIFY_URL),
+    timeout=(float(os.getenv("RECAPTCHA_CONNECT_TIMEOUT", "1")), float(os.getenv("RECAPTCHA_READ_TIMEOUT", "3"))),
+    fail_open=os.getenv("RECAPTCHA_FAIL_OPEN", "0") == "1",
+    failure_threshold=int(os.getenv("RECAPTCHA_BREAKER_FAILURES", "5")),
+    reset_after=float(os.getenv("RECAPTCHA_BREAKER_RESET", "30")),
+    # Kept-alive connections; under gevent many logins verify at once.
+    pool_size=int(os.getenv("RECAPTCHA_POOL_SIZE", "100" if GREEN else "10")),
+)
+
+# ----------------- metrics -----------------
+# Served as Prometheus text at /admin/metrics. Workers share snapshots
+# through METRICS_DIR (set it empty to report this process only).
+METRICS = Registry(share_dir=os.getenv("METRICS_DIR", os.path.join(app.instance_path, "metrics")),
+                   share_interval=float(os.getenv("METRICS_SHARE_INTERVAL", "5")))
+HTTP_LATENCY = METRICS.histogram("http_request_duration_seconds", "Time spent in the view, per route.",
+                                 ("endpoint", "method", "status"))
+HTTP_RESPONSE_BYTES = METRICS.counter("http_response_bytes_total", "Response body bytes (when known up front).",
+                                      ("endpoint",))
+ACTION_LATENCY = METRICS.histogram("patient_action_duration_seconds",
+                                   "Patient actions; form: whole transaction, batch: the op's handler.",
+                                   ("action", "via"))
+TEMPLATE_LATENCY = METRICS.histogram("template_render_duration_seconds", "Jinja rendering.", ("template",))
+CALL_LATENCY = METRICS.histogram("call_duration_seconds",
+                                 "Outbound calls and filesystem work done for a request.", ("call",))
+PAGE_CACHE_REQUESTS = METRICS.counter("page_cache_requests_total", "Cached pages served, by outcome.",
+                                      ("endpoint", "result"))
+UPLOADS = METRICS.counter("patient_uploads_total", "Patient uploads by outcome.", ("result",))
+UPLOAD_BYTES = METRICS.counter("patient_upload_bytes_total", "Bytes of accepted patient uploads.")
+# Label values must come from fixed sets; any other method a client sends is "other".
+HTTP_METHODS = frozenset({"GET", "HEAD", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"})
+
+
+@app.before_request
+def _start_timer():
+    g.t0 = time.perf_counter()
+
+
+@app.after_request
+def _observe_request(response):
+    t0 = g.pop("t0", None)
+    if t0 is not None:
+        endpoint = request.endpoint or "unmatched"
+        method = request.method if request.method in HTTP_METHODS else "other"
+        HTTP_LATENCY.observe(time.perf_counter() - t0, endpoint, method, response.status_code)
+        if response.content_length:
+            HTTP_RESPONSE_BYTES.inc(endpoint, amount=response.content_length)
+        METRICS.maybe_share()
+    return response
+
+
+@before_render_template.connect_via(app)
+def _start_render(sender, template, context, **extra):
+    g.setdefault("render_t0", []).append(time.perf_counter())
+
+
+@template_rendered.connect_via(app)
+def _observe_render(sender, template, context, **extra):
+    starts = g.get("render_t0")
+    if starts:
+        TEMPLATE_LATENCY.observe(time.perf_counter() - starts.pop(), template.name or "?")
+
 
 # Demo users (username -> {password, role})  roles: admin | patient | caretaker
 DEMO_USERS = {
-    "patient":  {"password": "pass123",  "role": "patient"},
+    "patient":  {"password": "pass123",  "role": "patient", "caretaker": "caretaker"},
     "admin":  {"password": "admin123", "role": "admin"},
     "caretaker":  {"password": "guest",    "role": "caretaker"},
 }
@@ -32,57 +147,347 @@ DEMO_USERS = {
 IMAGE_ROOT = os.path.join(app.static_folder, "customer_images")
 ALLOWED_IMAGE_EXTS = {".png", ".jpg", ".jpeg", ".gif", ".webp"}
 AUDIO_EXTS_PREFERENCE = [".mp3", ".m4a", ".ogg", ".wav", ".mp4", ".mov"]
-
-# ----------------- In-memory Patient "DB" -----------------
+# Indexed once here; revalidated against directory mtimes at most every
+# GALLERY_CHECK_INTERVAL seconds, so gallery requests don't hit the disk.
+GALLERY = GalleryCatalog(IMAGE_ROOT, ALLOWED_IMAGE_EXTS, AUDIO_EXTS_PREFERENCE,
+                         check_interval=float(os.getenv("GALLERY_CHECK_INTERVAL", "2")))
+# Resized WebP/fallback variants under static/derived, built in the background
+# (THUMBNAIL_WORKERS=0 turns that off; pre-warm with `flask warm-thumbnails`).
+# Their manifest is read by create_app().
+THUMBS = ThumbnailPipeline(app.static_folder, workers=int(os.getenv("THUMBNAIL_WORKERS", "2")))
+GALLERY.subscribe(lambda catalog: THUMBS.submit([it["img"] for it in catalog.all_images()]))
+
+# Pages that don't depend on patient data (landing, login, gallery) are
+# rendered once and served from memory with ETags; see cached_page below.
+PAGE_CACHE_ENABLED = os.getenv("PAGE_CACHE", "1") == "1"
+PAGE_CACHE = PageCache(max_bytes=int(os.getenv("PAGE_CACHE_MAX_BYTES", str(32 * 1024 * 1024))))
+GALLERY.subscribe(lambda catalog: PAGE_CACHE.invalidate("gallery"))
+
+# url_for('static') emits content-fingerprinted names (app.<hash>.js) that are
+# served with a one-year immutable Cache-Control, text assets precompressed.
+# The hashes are cached in ASSET_CACHE_DIR; `flask build-assets` fills it
+# ahead of a deploy. STATIC_FINGERPRINT=0 keeps plain /static URLs.
+STATIC_FINGERPRINT = os.getenv("STATIC_FINGERPRINT", "1") == "1"
+ASSETS = AssetManifest(app.static_folder, os.getenv("ASSET_CACHE_DIR", os.path.join(app.instance_path, "assets")),
+                       exclude=("uploads/",), content_addressed=("derived/",))
+if STATIC_FINGERPRINT:
+    GALLERY.subscribe(lambda catalog: ASSETS.load())
+
+
+@app.url_defaults
+def _fingerprint_static(endpoint, values):
+    if endpoint == "static" and STATIC_FINGERPRINT and "filename" in values:
+        values["filename"] = ASSETS.url(values["filename"])
+
+
+def _send_static(filename):
+    return ASSETS.send(request, app.response_class, filename, app.send_static_file)
+
+
+if STATIC_FINGERPRINT:
+    app.view_functions["static"] = _send_static
+
+
+def _gallery_version():
+    """Changes whenever a gallery page would render differently."""
+    return GALLERY.checked_version(), THUMBS.version
+
+# Gallery audio/video goes through /media (Range, strong ETags, 304s).
+# MEDIA_OFFLOAD=x-accel (nginx) or x-sendfile hands the bytes to the proxy.
+MEDIA_OFFLOAD = os.getenv("MEDIA_OFFLOAD", "")
+if MEDIA_OFFLOAD not in OFFLOAD_MODES:
+    raise RuntimeError(f"MEDIA_OFFLOAD must be one of {OFFLOAD_MODES}")
+MEDIA_ACCEL_PREFIX = os.getenv("MEDIA_ACCEL_PREFIX", "/_media/")
+MEDIA_MAX_AGE = int(os.getenv("MEDIA_MAX_AGE", "86400"))
+
+# ----------------- Patient "DB" -----------------
 # {username: {tasks, meds, notes, appts, files, mood, reminders, activities}}
-PATIENT_DB = {}
+# PATIENT_STORE=sqlite (default, durable) | memory (process-local, for tests)
+PATIENT_STORE = os.getenv("PATIENT_STORE", "sqlite")
+PATIENT_DB_PATH = os.getenv("PATIENT_DB_PATH", os.path.join(app.instance_path, "patients.db"))
 
-def _ensure_patient(username):
-    if username not in PATIENT_DB:
-        PATIENT_DB[username] = {
-            "tasks": [
-                {"id": str(uuid.uuid4()), "title": "Morning walk", "done": False},
-                {"id": str(uuid.uuid4()), "title": "Breakfast", "done": False},
-            ],
-            "meds": [
-                {"id": str(uuid.uuid4()), "name": "Vitamin B12", "time": "09:00", "taken_today": False},
-            ],
-            "notes": [],
-            "appts": [],
-            "files": [],
-            "mood": "🙂 Calm",
-            # NEW: memory reminders & activities for hub pages
-            "reminders": [
-                {"id": str(uuid.uuid4()), "title": "Call grandson Aarav",
-                 "dt": datetime.now().isoformat(timespec="minutes"), "kind": "family", "active": True},
-            ],
-            "activities": [
-                {"id": str(uuid.uuid4()), "title": "Listen to favorite song", "done_today": False},
-                {"id": str(uuid.uuid4()), "title": "5-min breathing", "done_today": False},
-            ],
-        }
 
+def _med_key(m):
+    """Sort key "HH:MM:00" for a med's daily time; None if it can't be parsed."""
+    try:
+        hh, mm = m["time"].split(":")
+        return datetime.min.replace(hour=int(hh), minute=int(mm)).strftime("%H:%M:%S")
+    except Exception:
+        return None
+
+def _dt_sort_key(x):
+    """Sortable ISO timestamp; unparsable dates sort last."""
+    try:
+        return datetime.fromisoformat(x["dt"]).strftime("%Y-%m-%dT%H:%M:%S")
+    except Exception:
+        return "~"
+
+def _reminder_key(r):
+    return _dt_sort_key(r) if r.get("active") else None
+
+def _caretaker_summary(tx):
+    """(caretaker, row) kept by the store so /caretaker never loads a patient.
+
+    Only what changes on a write is stored; anything that depends on the
+    clock (today's adherence, overdue meds, next reminder) is worked out
+    from it when the page is rendered. So every reminder still to come is
+    kept, not just the next few: those can all pass before the patient's
+    next write.
+    """
+    fields = tx.fields()
+    now = datetime.now(_patient_tz(fields))
+    taken = {d: n for d, n in tx.counters().get("meds_taken", {}).items() if d != ALL}
+    return fields.get("caretaker"), {
+        "mood": fields.get("mood"),
+        "tz": fields.get("tz"),
+        "meds": tx.count("meds"),
+        "taken": taken,
+        "med_times": [[_med_key(m)[:5], m.get("taken_day") if m.get("taken_today") else None]
+                      for m in tx.iter_sorted("meds")],
+        "reminders": [[r["dt"], r.get("title")]
+                      for r in tx.iter_sorted("reminders", now.strftime("%Y-%m-%dT%H:%M:%S"))],
+    }
+
+# taken_today / done_today are stored with the patient-local day they were
+# set on (taken_day / done_day) and only count on that day, so midnight needs
+# no reset job over every patient. A patient's zone is fields["tz"] (IANA
+# name); PATIENT_DEFAULT_TZ, or server local time, when unset.
+DAY_FLAGS = {"meds": ("taken_today", "taken_day"), "activities": ("done_today", "done_day")}
+PATIENT_DEFAULT_TZ = zone(os.getenv("PATIENT_DEFAULT_TZ"))
+
+def _day_flag(kind):
+    """Counter function: groups set flags by the day they were set on."""
+    flag_field, day_field = DAY_FLAGS[kind]
+    return lambda rec: rec.get(day_field) if rec.get(flag_field) else None
+
+# Kept up to date by the store on every write, so the dashboard never has to
+# walk a patient's whole history. Bump version when a function changes.
+PATIENT_DERIVED = Derived(
+    counters={
+        "tasks_done": ("tasks", flag("done")),
+        "meds_taken": ("meds", _day_flag("meds")),
+        "reminders_active": ("reminders", flag("active")),
+        "reminders_kind": ("reminders", lambda r: r.get("kind") or "general"),
+        "activities_done": ("activities", _day_flag("activities")),
+    },
+    sort_keys={
+        "meds": _med_key,
+        "appts": _dt_sort_key,
+        "reminders": _reminder_key,
+        "notes": lambda n: str(n.get("ts", "")),
+    },
+    summary=_caretaker_summary,
+    search={"notes": lambda n: n.get("text"), "reminders": lambda r: r.get("title")},
+    version=5,
+)
+# Opened by create_app() (_open_patient_db), along with the scheduler and
+# the rate limiter built on it; None until then.
+PATIENT_DB = None
+
+# Due reminders / med times are pushed to open patient pages over SSE
+# (/patient/events). Streams end after EVENTS_MAX_AGE seconds and the
+# browser reconnects. An open stream holds its connection the whole time,
+# which only a gevent worker can afford: under gthread a few patient tabs
+# would take every thread. So the stream (and the script that opens it)
+# is only on under gevent unless PATIENT_EVENTS says otherwise; off, the
+# endpoint answers 204, which tells EventSource not to reconnect.
+PATIENT_EVENTS = os.getenv("PATIENT_EVENTS", "1" if GREEN else "0") == "1"
+app.add_template_global(PATIENT_EVENTS, "patient_events")
+SCHEDULER = None
+SCHEDULER_CHECK_INTERVAL = float(os.getenv("SCHEDULER_CHECK_INTERVAL", "10"))
+EVENTS_HEARTBEAT = float(os.getenv("EVENTS_HEARTBEAT", "15"))
+EVENTS_MAX_AGE = float(os.getenv("EVENTS_MAX_AGE", "300"))
+
+# ----------------- admission control -----------------
+# POST /login (an outbound reCAPTCHA call) and /patient/upload (disk writes)
+# are limited per client IP and per user by token buckets kept in the
+# patient store, so every worker shares them, and at most
+# EXPENSIVE_MAX_INFLIGHT of them run at once in a worker. Anything over is
+# answered with a bare 429 and Retry-After before any real work.
+# ADMISSION_CONTROL=0 turns both off (benchmarks of the handlers themselves).
+# TRUSTED_PROXIES: comma-separated addresses/CIDRs of our reverse proxies;
+# X-Forwarded-For is only believed for hops they added.
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "1") == "1"
+TRUSTED_PROXIES = parse_networks(os.getenv("TRUSTED_PROXIES", ""))
+LIMITER = None
+EXPENSIVE = AdmissionGate(int(os.getenv("EXPENSIVE_MAX_INFLIGHT", "200" if GREEN else "4")))
+# endpoint -> (per-IP rate, per-user rate, the user a request counts against)
+RATE_LIMITS = {
+    "login": (parse_rate(os.getenv("LOGIN_RATE_PER_IP", "30/minute")),
+              parse_rate(os.getenv("LOGIN_RATE_PER_USER", "10/minute")),
+              lambda: request.form.get("username", "").strip()),
+    "patient_upload": (parse_rate(os.getenv("UPLOAD_RATE_PER_IP", "60/minute")),
+                       parse_rate(os.getenv("UPLOAD_RATE_PER_USER", "30/minute")),
+                       lambda: session.get("user")),
+}
+RATE_LIMITED = METRICS.counter("rate_limited_total", "Requests refused with 429, by endpoint and reason.",
+                               ("endpoint", "reason"))
+
+
+@app.before_request
+def _admit():
+    limits = RATE_LIMITS.get(request.endpoint)
+    if limits is None or request.method != "POST" or not ADMISSION_CONTROL:
+        return None
+    if not EXPENSIVE.enter():
+        return _too_many("busy", 1)
+    g.admitted = True
+    ip_rate, user_rate, user_of = limits
+    reason = "ip"
+    wait = LIMITER.hit(f"{request.endpoint}:ip:{client_ip(request.environ, TRUSTED_PROXIES)}", *ip_rate)
+    if not wait:
+        user = user_of()
+        if user:
+            reason = "user"
+            wait = LIMITER.hit(f"{request.endpoint}:user:{user}", *user_rate)
+    return _too_many(reason, wait) if wait else None
+
+
+@app.teardown_request
+def _leave_gate(_exc):
+    if g.pop("admitted", False):
+        EXPENSIVE.leave()
+
+
+def _too_many(reason, wait):
+    RATE_LIMITED.inc(request.endpoint, reason)
+    return Response("Too many requests, please try again shortly.\n", status=429, mimetype="text/plain",
+                    headers={"Retry-After": str(max(1, math.ceil(wait)))})
+
+# Time series kept per patient (see history.py): mood on every save, med
+# adherence (% of today's doses taken) on every toggle.
+MOOD_SCORES = {"😀 Cheerful": 5, "🙂 Calm": 4, "😐 Okay": 3, "😴 Tired": 2, "🙁 Low": 1}
+TREND_TITLES = {"7d": "7-Day", "30d": "30-Day", "1y": "1-Year"}
+TREND_LABELS = {
+    "7d": ["6d ago", "5d", "4d", "3d", "2d", "1d", "Today"],
+    "30d": ["29d ago", "3w", "2w", "1w", "Today"],
+    "1y": ["1y ago", "9mo", "6mo", "3mo", "This week"],
+}
+
+def _record_adherence(tx):
+    total = tx.count("meds")
+    if total:
+        now = _patient_now(tx)
+        tx.record("adherence", now, 100 * tx.count("meds_taken", now.date().isoformat()) / total)
+
+# ----------------- Patient days -----------------
+def _patient_tz(fields):
+    return zone(fields.get("tz"), PATIENT_DEFAULT_TZ)
+
+def _patient_now(tx):
+    return datetime.now(_patient_tz(tx.fields()))
+
+def _flag_is_set(kind, rec, today):
+    flag_field, day_field = DAY_FLAGS[kind]
+    return bool(rec.get(flag_field)) and rec.get(day_field) == today
+
+def _toggle_day_flag(tx, kind, rid):
+    rec = tx.get(kind, rid)
+    if rec is None:
+        return None
+    flag_field, day_field = DAY_FLAGS[kind]
+    today = _patient_now(tx).date().isoformat()
+    return tx.update(kind, rid, **{flag_field: not _flag_is_set(kind, rec, today), day_field: today})
+
+def _load_patient(username, skip=()):
+    """Patient data as the templates expect it: flags from earlier days read False.
+
+    Kinds in ``skip`` come back empty (pages that show them one page at a time).
+    """
+    data = PATIENT_DB.load(username, skip=skip)
+    today = datetime.now(_patient_tz(data)).date().isoformat()
+    for kind, (flag_field, _) in DAY_FLAGS.items():
+        for rec in data[kind]:
+            rec[flag_field] = _flag_is_set(kind, rec, today)
+    return data
+
+def _all_kinds_but(*kinds):
+    """``skip`` for a page that only shows ``kinds``."""
+    return tuple(k for k in KINDS if k not in kinds)
+
+_DAY_SEEN = {}  # username -> (tz name, day) this process has rolled over to
+
+def _forget_day(username, tx):
+    if tx.fields_changed:  # the time zone may have changed
+        _DAY_SEEN.pop(username, None)
+
+def _roll_day(username):
+    """Close the patient's last active day, once per day and O(1).
+
+    Before its flags stop counting, that day's final adherence (and 0% for
+    days without a visit since, up to a year) goes into the history.
+    """
+    seen = _DAY_SEEN.get(username)
+    if seen and datetime.now(zone(seen[0], PATIENT_DEFAULT_TZ)).date().isoformat() == seen[1]:
+        return
+    with PATIENT_DB.transaction(username) as tx:
+        fields = tx.fields()
+        tz = _patient_tz(fields)
+        today = datetime.now(tz).date()
+        last = fields.get("day")
+        if last is None or last < today.isoformat():
+            total = tx.count("meds")
+            if last is not None and total:
+                skipped = min((today - date.fromisoformat(last)).days - 1, 366)
+                days = [date.fromisoformat(last)] + [today - timedelta(days=i) for i in range(skipped, 0, -1)]
+                ends = [datetime(d.year, d.month, d.day, 23, 59, 59, tzinfo=tz) for d in days]
+                tx.record_many("adherence", ends, [100 * tx.count("meds_taken", last) / total] + [0.0] * skipped)
+            tx.set_fields(day=today.isoformat())
+    _DAY_SEEN[username] = (fields.get("tz"), today.isoformat())
+
+def _ensure_patient(username):
+    if PATIENT_DB.exists(username):
+        _roll_day(username)
+        return
+    PATIENT_DB.create(username, {
+        "tasks": [
+            {"id": new_id(), "title": "Morning walk", "done": False},
+            {"id": new_id(), "title": "Breakfast", "done": False},
+        ],
+        "meds": [
+            {"id": new_id(), "name": "Vitamin B12", "time": "09:00", "taken_today": False},
+        ],
+        "notes": [],
+        "appts": [],
+        "files": [],
+        "mood": "🙂 Calm",
+        "caretaker": DEMO_USERS.get(username, {}).get("caretaker"),
+        # NEW: memory reminders & activities for hub pages
+        "reminders": [
+            {"id": new_id(), "title": "Call grandson Aarav",
+             "dt": datetime.now().isoformat(timespec="minutes"), "kind": "family", "active": True},
+        ],
+        "activities": [
+            {"id": new_id(), "title": "Listen to favorite song", "done_today": False},
+            {"id": new_id(), "title": "5-min breathing", "done_today": False},
+        ],
+    })
+
+@app.template_filter("dt_pretty")
 def _dt_pretty(dt_str):
     try:
         return datetime.fromisoformat(dt_str).strftime("%b %d, %Y · %I:%M %p")
     except Exception:
         return dt_str
 
+# Notes and reminders are shown a page at a time, newest first; ?cursor=
+# continues after the last one shown and ?q= searches the store's index.
+NOTES_PAGE_SIZE = int(os.getenv("NOTES_PAGE_SIZE", "20"))
+REMINDERS_PAGE_SIZE = int(os.getenv("REMINDERS_PAGE_SIZE", "25"))
+
+def _record_page(username, kind, size):
+    query = request.args.get("q", "").strip()
+    cursor = request.args.get("cursor", type=int)
+    with PATIENT_DB.transaction(username, readonly=True) as tx:
+        items, next_cursor = tx.search(kind, query, size, cursor) if query else tx.page(kind, size, cursor)
+    return {"records": items, "next": next_cursor, "query": query, "first": cursor is None}
+
 
 # ----------------- helpers -----------------
 def verify_recaptcha(response_token, remote_ip=None):
     """Return True/False based on Google reCAPTCHA verification."""
-    if not RECAPTCHA_SECRET_KEY:
-        return True
-    payload = {"secret": RECAPTCHA_SECRET_KEY, "response": response_token}
-    if remote_ip:
-        payload["remoteip"] = remote_ip
-    try:
-        r = requests.post("https://www.google.com/recaptcha/api/siteverify", data=payload, timeout=5)
-        data = r.json()
-        return bool(data.get("success"))
-    except Exception:
-        return False
+    with CALL_LATENCY.time("recaptcha"):
+        return RECAPTCHA.verify(response_token, remote_ip)
 
 
 def login_required(view_fn):
@@ -110,6 +515,35 @@ def role_required(*roles):
     return decorator
 
 
+def cached_page(params=(), version=None, tags=()):
+    """Serve GETs of a view from PAGE_CACHE (under the auth decorators).
+
+    The key is the endpoint, the query ``params`` the page uses, the
+    session's user and role (the navbar shows them) and ``version()`` if
+    given. Pages with flash messages waiting are rendered, not cached.
+    """
+    def decorator(view_fn):
+        @wraps(view_fn)
+        def wrapped(*args, **kwargs):
+            if not PAGE_CACHE_ENABLED or request.method != "GET" or "_flashes" in session:
+                return view_fn(*args, **kwargs)
+            user = session.get("user")
+            key = (request.endpoint, tuple(request.args.get(p) for p in params), user, session.get("role"),
+                   version() if version else None)
+            entry = PAGE_CACHE.get(key)
+            if entry is None:
+                rv = app.make_response(view_fn(*args, **kwargs))
+                if rv.status_code != 200 or rv.is_streamed:
+                    return rv
+                entry = PAGE_CACHE.put(key, rv.get_data(), rv.content_type, tags)
+                PAGE_CACHE_REQUESTS.inc(request.endpoint, "miss")
+            else:
+                PAGE_CACHE_REQUESTS.inc(request.endpoint, "hit")
+            return PAGE_CACHE.respond(request, entry, app.response_class, private=user is not None)
+        return wrapped
+    return decorator
+
+
 def user_roles_map():
     """Expose username -> role for optional UI hints on login page."""
     return {u: info["role"] for u, info in DEMO_USERS.items()}
@@ -121,8 +555,16 @@ def forbidden(_):
     return render_template("403.html"), 403
 
 
+@app.errorhandler(413)
+def too_large(_):
+    limit_mb = app.config["MAX_CONTENT_LENGTH"] / (1024 * 1024)
+    flash(f"That file is too large (limit {limit_mb:.0f} MB).", "danger")
+    return redirect(url_for("patient_hub"))
+
+
 # ----------------- PUBLIC: content-first landing -----------------
 @app.route("/")
+@cached_page()
 def landing():
     """Public, content-focused page about dementia; tiny Sign in link only."""
     return render_template("landing.html")
@@ -130,11 +572,12 @@ def landing():
 
 # ----------------- Auth -----------------
 @app.route("/login", methods=["GET", "POST"])
+@cached_page()
 def login():
     if request.method == "POST":
         # 1) Verify CAPTCHA
         recaptcha_token = request.form.get("g-recaptcha-response", "")
-        user_ip = request.headers.get("X-Forwarded-For", request.remote_addr)
+        user_ip = client_ip(request.environ, TRUSTED_PROXIES)
         if not verify_recaptcha(recaptcha_token, user_ip):
             flash("CAPTCHA verification failed. Please try again.", "danger")
             return redirect(url_for("login"))
@@ -183,39 +626,36 @@ def home():
 
 # ---- Gallery helpers (used by /customer and patient gallery) ----
 def list_categories():
-    if not os.path.isdir(IMAGE_ROOT):
-        return []
-    return sorted(
-        [d for d in os.listdir(IMAGE_ROOT) if os.path.isdir(os.path.join(IMAGE_ROOT, d))],
-        key=str.lower
-    )
+    with CALL_LATENCY.time("gallery_categories"):
+        return GALLERY.categories()
 
 
 def list_images(category):
-    cat_dir = os.path.join(IMAGE_ROOT, category)
-    if not os.path.isdir(cat_dir):
-        return []
-    items = []
-    for f in os.listdir(cat_dir):
-        base, ext = os.path.splitext(f)
-        if ext.lower() in ALLOWED_IMAGE_EXTS:
-            audio_rel = None
-            for aext in AUDIO_EXTS_PREFERENCE:
-                candidate = os.path.join(cat_dir, base + aext)
-                if os.path.isfile(candidate):
-                    audio_rel = f"customer_images/{category}/{base}{aext}"
-                    break
-            items.append({
-                "img": f"customer_images/{category}/{f}",
-                "audio": audio_rel,
-                "name": f
-            })
-    return sorted(items, key=lambda x: x["name"].lower())
+    with CALL_LATENCY.time("gallery_images"):
+        return [THUMBS.decorate(item) for item in GALLERY.images(category)]
+
+
+def gallery_grid(template, category, images):
+    """The image grid for one category, rendered once for everybody."""
+    return Markup(PAGE_CACHE.fragment(
+        (template, category, _gallery_version()),
+        lambda: render_template(template, images=images), tags=("gallery",)))
+
+
+@app.route("/media/<path:filename>")
+def gallery_media(filename):
+    """Gallery audio/video; ``filename`` is relative to static/ like url_for('static')."""
+    path = safe_join(app.static_folder, filename)
+    if path is None or not path.startswith(IMAGE_ROOT + os.sep) or not os.path.isfile(path):
+        abort(404)
+    return send_media(request, app.response_class, path, filename, offload=MEDIA_OFFLOAD,
+                      accel_prefix=MEDIA_ACCEL_PREFIX, max_age=MEDIA_MAX_AGE)
 
 
 # ----------------- Existing gallery page (any logged-in user) -----------------
 @app.route("/customer")
 @login_required
+@cached_page(params=("category",), version=_gallery_version, tags=("gallery",))
 def customer():
     categories = list_categories()
     selected = request.args.get("category") or (categories[0] if categories else None)
@@ -226,7 +666,8 @@ def customer():
         role=session.get("role"),
         categories=categories,
         selected_category=selected,
-        images=images
+        images=images,
+        grid=gallery_grid("_customer_gallery_grid.html", selected, images) if images else ""
     )
 
 
@@ -237,6 +678,21 @@ def admin_home():
     return render_template("admin.html", user=session.get("user"), role=session.get("role"))
 
 
+@app.route("/admin/metrics")
+@role_required("admin")
+def admin_metrics():
+    return Response(METRICS.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/admin/export")
+@role_required("admin")
+def admin_export():
+    """Every patient as NDJSON, streamed as it is read (see transfer.py)."""
+    name = f"patients-{datetime.now().strftime('%Y%m%d-%H%M%S')}.ndjson"
+    return Response(stream_with_context(export_lines(PATIENT_DB)), mimetype="application/x-ndjson",
+                    headers={"Content-Disposition": f"attachment; filename={name}"})
+
+
 # === PATIENT: Hub + Feature Pages ===
 @app.route("/patient")
 @role_required("patient")
@@ -249,10 +705,9 @@ def patient_redirect_to_hub():
 def patient_home():
     username = session.get("user")
     _ensure_patient(username)
-    data = PATIENT_DB[username]
-    for a in data["appts"]:
-        a["dt_pretty"] = _dt_pretty(a.get("dt", ""))
-    return render_template("patient.html", user=username, role=session.get("role"), data=data)
+    data = _load_patient(username, skip=("notes",))
+    notes = _record_page(username, "notes", NOTES_PAGE_SIZE)
+    return render_template("patient.html", user=username, role=session.get("role"), data=data, notes=notes)
 
 
 @app.route("/patient/hub", methods=["GET"])
@@ -264,20 +719,22 @@ def patient_hub():
 
 @app.route("/patient/gallery", methods=["GET"])
 @role_required("patient")
+@cached_page(params=("category",), version=_gallery_version, tags=("gallery",))
 def patient_gallery():
     categories = list_categories()
     selected = request.args.get("category") or (categories[0] if categories else None)
     images = list_images(selected) if selected else []
     return render_template("patient_gallery.html",
                            user=session.get("user"), role=session.get("role"),
-                           categories=categories, selected_category=selected, images=images)
+                           categories=categories, selected_category=selected,
+                           grid=gallery_grid("_patient_gallery_grid.html", selected, images))
 
 @app.route("/patient/meds", methods=["GET"])
 @role_required("patient")
 def patient_meds():
     username = session.get("user")
     _ensure_patient(username)
-    data = PATIENT_DB[username]
+    data = _load_patient(username, skip=_all_kinds_but("meds"))
     return render_template("patient_meds.html", user=username, role=session.get("role"), data=data)
 
 @app.route("/patient/mood", methods=["GET"])
@@ -285,28 +742,60 @@ def patient_meds():
 def patient_mood():
     username = session.get("user")
     _ensure_patient(username)
-    data = PATIENT_DB[username]
-    return render_template("patient_mood.html", user=username, role=session.get("role"), data=data)
+    notes = _record_page(username, "notes", NOTES_PAGE_SIZE)
+    with PATIENT_DB.transaction(username, readonly=True) as tx:
+        mood = tx.fields().get("mood")
+    return render_template("patient_mood.html", user=username, role=session.get("role"),
+                           notes=notes, mood=mood, moods=list(MOOD_SCORES))
 
 @app.route("/patient/memory")
 @role_required("patient")
 def patient_memory():
     username = session.get("user")
     _ensure_patient(username)
-    data = PATIENT_DB[username]
-    for r in data.get("reminders", []):
-        r["dt_pretty"] = _dt_pretty(r.get("dt", ""))
-    return render_template("patient_memory.html",
-                           user=username, role=session.get("role"), data=data)
+    reminders = _record_page(username, "reminders", REMINDERS_PAGE_SIZE)
+    with PATIENT_DB.transaction(username, readonly=True) as tx:
+        stats = {"total": tx.count("reminders"), "active": tx.count("reminders_active"),
+                 "faces": tx.count("reminders_kind", "face")}
+        next_item = next(tx.iter_sorted("reminders"), None)
+    return render_template("patient_memory.html", user=username, role=session.get("role"),
+                           reminders=reminders, stats=stats, next_item=next_item)
 
 @app.route("/patient/activities", methods=["GET"])
 @role_required("patient")
 def patient_activities():
     username = session.get("user")
     _ensure_patient(username)
-    data = PATIENT_DB[username]
+    data = _load_patient(username, skip=_all_kinds_but("activities"))
     return render_template("patient_activities.html", user=username, role=session.get("role"), data=data)
 
+@app.route("/patient/events", methods=["GET"])
+@role_required("patient")
+def patient_events():
+    """Server-Sent Events: one ``due`` event per reminder/med as it falls due."""
+    if not PATIENT_EVENTS:
+        return Response(status=204)
+    username = session.get("user")
+    _ensure_patient(username)
+    q = SCHEDULER.open_stream(username)
+
+    def stream():
+        try:
+            yield "retry: 5000\n\n"
+            deadline = time.monotonic() + EVENTS_MAX_AGE
+            while time.monotonic() < deadline:
+                try:
+                    event = q.get(timeout=EVENTS_HEARTBEAT)
+                except queue.Empty:
+                    yield ": ping\n\n"  # also notices closed connections
+                    continue
+                yield f"event: due\ndata: {json.dumps(event)}\n\n"
+        finally:
+            SCHEDULER.close_stream(username, q)
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.route("/patient/games", methods=["GET"])
 @role_required("patient")
 def patient_games():
@@ -317,68 +806,43 @@ def patient_games():
 def patient_dashboard():
     username = session.get("user")
     _ensure_patient(username)
-    d = PATIENT_DB[username]
-
-    # --- core counts
-    tasks_total = len(d["tasks"]); tasks_done = sum(1 for t in d["tasks"] if t["done"])
-    meds_total = len(d["meds"]); meds_taken = sum(1 for m in d["meds"] if m["taken_today"])
-    notes_count = len(d["notes"]); appts_count = len(d["appts"])
-    reminders_active = sum(1 for r in d["reminders"] if r.get("active"))
-    activities_done = sum(1 for a in d["activities"] if a["done_today"])
-    mood = d["mood"]
-
-    # --- next medication (today)
-    from datetime import time as _time
-    now = datetime.now().time()
-    def _parse_hhmm(s):
-        try:
-            hh, mm = s.split(":")
-            return _time(int(hh), int(mm))
-        except Exception:
-            return None
-    future_meds = []
-    for m in d["meds"]:
-        t = _parse_hhmm(m["time"])
-        if t:
-            future_meds.append((t, m))
-    future_meds.sort(key=lambda x: x[0])
-    next_med = None
-    for t, m in future_meds:
-        if t >= now and not m["taken_today"]:
-            next_med = {"name": m["name"], "time": t.strftime("%I:%M %p")}
-            break
-
-    # --- upcoming (next 3) appointments & reminders
-    def _dt_key(x):  # safe sort key
-        try:
-            return datetime.fromisoformat(x["dt"])
-        except Exception:
-            return datetime.max
-    appts_upcoming = sorted(d["appts"], key=_dt_key)[:3]
-    rem_upcoming = sorted([r for r in d["reminders"] if r.get("active")], key=_dt_key)[:3]
-    # pretty
-    for a in appts_upcoming:
-        a["dt_pretty"] = _dt_pretty(a["dt"])
-    for r in rem_upcoming:
-        r["dt_pretty"] = _dt_pretty(r["dt"])
-
-    # --- simple 7-day trends (demo-friendly, deterministic)
-    # meds adherence today:
-    today_adherence = round(100 * meds_taken / meds_total, 1) if meds_total else 0.0
-    # smooth historical pattern anchored to today
-    base = [72, 81, 65, 90, 76, 84]
-    meds_trend = base + [today_adherence]
-
-    # mood score mapping for sparkline
-    mood_map = {"😀 Cheerful": 5, "🙂 Calm": 4, "😐 Okay": 3, "😴 Tired": 2, "🙁 Low": 1}
-    today_mood_score = mood_map.get(mood, 3)
-    mood_trend = [3, 4, 3, 5, 2, 4, today_mood_score]
-
-    # --- today metrics
-    today_str = datetime.now().strftime("%Y-%m-%d")
-    notes_today = sum(1 for n in d["notes"] if str(n.get("ts", "")).startswith(today_str))
-    files_count = len(d["files"])
+    trend_range = request.args.get("range", "7d")
+    if trend_range not in RANGES:
+        trend_range = "7d"
+    with PATIENT_DB.transaction(username, readonly=True) as tx:
+        fields = tx.fields()
+        now = datetime.now(_patient_tz(fields))
+        today_str = now.strftime("%Y-%m-%d")
+        # --- core counts (maintained by the store, no scans)
+        tasks_total, tasks_done = tx.count("tasks"), tx.count("tasks_done")
+        meds_total, meds_taken = tx.count("meds"), tx.count("meds_taken", today_str)
+        notes_count, appts_count = tx.count("notes"), tx.count("appts")
+        reminders_active = tx.count("reminders_active")
+        activities_total, activities_done = tx.count("activities"), tx.count("activities_done", today_str)
+        mood = fields.get("mood")
+        notes_today = tx.count_sorted("notes", today_str, today_str + "~")
+        files_count = tx.count("files")
+        recent_files = tx.head("files", 5)
+
+        # --- next medication (today): walk the time index from now on
+        next_med = None
+        for m in tx.iter_sorted("meds", now.strftime("%H:%M:%S")):
+            if not _flag_is_set("meds", m, today_str):
+                t = datetime.strptime(_med_key(m), "%H:%M:%S")
+                next_med = {"name": m["name"], "time": t.strftime("%I:%M %p")}
+                break
 
+        # --- upcoming (next 3) appointments & reminders
+        appts_upcoming = list(islice(tx.iter_sorted("appts"), 3))
+        rem_upcoming = list(islice(tx.iter_sorted("reminders"), 3))
+
+        # --- trends from the recorded history; today's point is the live value
+        today_adherence = round(100 * meds_taken / meds_total, 1) if meds_total else 0.0
+        today_mood_score = MOOD_SCORES.get(mood, 3)
+        meds_trend = sparkline(tx, "adherence", "last", trend_range, now, 0.0)
+        mood_trend = sparkline(tx, "mood", "mean", trend_range, now, 3)
+        if RANGES[trend_range][0] == "d":
+            meds_trend[-1], mood_trend[-1] = today_adherence, today_mood_score
     stats = {
         "tasks": (tasks_done, tasks_total),
         "meds": (meds_taken, meds_total),
@@ -386,22 +850,26 @@ def patient_dashboard():
         "appts": appts_count,
         "reminders_active": reminders_active,
         "activities_done": activities_done,
+        "activities": activities_total,
         "mood": mood,
         "notes_today": notes_today,
         "files_count": files_count,
     }
 
     viz = {
-        "adherence_trend": meds_trend,   # 7 numbers (0–100)
-        "mood_trend": mood_trend,        # 7 ints (1–5)
-        "today_adherence": today_adherence
+        "adherence_trend": meds_trend,   # 7/30 days or 52 weeks (0–100)
+        "mood_trend": mood_trend,        # same points (1–5)
+        "today_adherence": today_adherence,
+        "range": trend_range,
+        "range_title": TREND_TITLES[trend_range],
+        "labels": TREND_LABELS[trend_range],
     }
 
     context = {
         "user": username,
         "role": session.get("role"),
         "stats": stats,
-        "data": d,
+        "recent_files": recent_files,
         "next_med": next_med,
         "appts_upcoming": appts_upcoming,
         "rem_upcoming": rem_upcoming,
@@ -411,149 +879,229 @@ def patient_dashboard():
 
 
 # === PATIENT: Actions & Uploads ===
+# Each action reads its fields from ``p`` (the form, or one op of a JSON
+# batch), writes through ``tx`` and returns a (category, message) to flash.
+
+# -------- Tasks --------
+def _add_task(tx, p):
+    title = p.get("task_title", "").strip()
+    if title:
+        tx.add("tasks", {"id": new_id(), "title": title, "done": False})
+        return "success", "Task added."
+
+def _toggle_task(tx, p):
+    tx.toggle("tasks", p.get("task_id"), "done")
+
+def _delete_task(tx, p):
+    tx.delete("tasks", p.get("task_id"))
+
+# -------- Meds --------
+def _add_med(tx, p):
+    name = p.get("med_name", "").strip()
+    tm = p.get("med_time", "").strip()
+    if name and tm:
+        tx.add("meds", {"id": new_id(), "name": name, "time": tm, "taken_today": False})
+        return "success", "Medication added."
+
+def _toggle_med(tx, p):
+    if _toggle_day_flag(tx, "meds", p.get("med_id")):
+        _record_adherence(tx)
+
+def _delete_med(tx, p):
+    tx.delete("meds", p.get("med_id"))
+
+# -------- Mood & Notes --------
+def _set_mood_and_note(tx, p):
+    note = p.get("note", "").strip()
+    mood = p.get("mood", "").strip() or tx.fields()["mood"]
+    now = _patient_now(tx)
+    tx.set_fields(mood=mood)
+    tx.record("mood", now, MOOD_SCORES.get(mood, 3))
+    if note:
+        tx.add("notes", {"id": new_id(), "mood": mood, "text": note,
+                         "ts": now.strftime("%Y-%m-%d %H:%M")})
+    return "success", "Mood & note saved." if note else "Mood saved."
+
+def _delete_note(tx, p):
+    tx.delete("notes", p.get("note_id"))
+
+# -------- Appointments (shown on hub or dashboard) --------
+def _add_appt(tx, p):
+    title = p.get("appt_title", "").strip()
+    dt = p.get("appt_dt", "").strip()
+    if title and dt:
+        tx.add("appts", {"id": new_id(), "title": title, "dt": dt})
+        return "success", "Appointment added."
+
+def _delete_appt(tx, p):
+    tx.delete("appts", p.get("appt_id"))
+
+# -------- Files (delete from list & disk) --------
+def _delete_file(tx, p):
+    rec = tx.delete("files", p.get("file_id") or p.get("file_name", ""))
+    if rec:
+        _release_upload(tx, rec)
+    return "info", "File removed."
+
+# -------- Memory reminders --------
+def _add_reminder(tx, p):
+    title = p.get("rem_title", "").strip()
+    dt = p.get("rem_dt", "").strip()
+    kind = p.get("rem_kind", "general").strip()
+    active = bool(p.get("rem_active"))
+    if title and dt:
+        tx.add("reminders", {"id": new_id(), "title": title,
+                             "dt": dt, "kind": kind, "active": active})
+        return "success", "Reminder added."
+
+def _toggle_reminder(tx, p):
+    tx.toggle("reminders", p.get("rem_id"), "active")
+
+def _delete_reminder(tx, p):
+    tx.delete("reminders", p.get("rem_id"))
+
+# -------- Activities --------
+def _add_activity(tx, p):
+    title = p.get("act_title", "").strip()
+    if title:
+        tx.add("activities", {"id": new_id(), "title": title, "done_today": False})
+        return "success", "Activity added."
+
+def _toggle_activity(tx, p):
+    _toggle_day_flag(tx, "activities", p.get("act_id"))
+
+def _delete_activity(tx, p):
+    tx.delete("activities", p.get("act_id"))
+
+# -------- Settings --------
+def _set_timezone(tx, p):
+    name = p.get("tz", "").strip()
+    if zone(name) is None:
+        return "warning", "Unknown time zone."
+    if tx.fields().get("tz") != name:
+        tx.set_fields(tz=name)
+
+# action -> (handler, page to return to, whether the referrer wins)
+PATIENT_ACTIONS = {
+    "add_task": (_add_task, "patient_hub", True),
+    "toggle_task": (_toggle_task, "patient_hub", True),
+    "delete_task": (_delete_task, "patient_hub", True),
+    "add_med": (_add_med, "patient_meds", True),
+    "toggle_med": (_toggle_med, "patient_meds", True),
+    "delete_med": (_delete_med, "patient_meds", True),
+    "set_mood_and_note": (_set_mood_and_note, "patient_mood", True),
+    "delete_note": (_delete_note, "patient_mood", True),
+    "add_appt": (_add_appt, "patient_hub", True),
+    "delete_appt": (_delete_appt, "patient_hub", True),
+    "delete_file": (_delete_file, "patient_hub", True),
+    "add_reminder": (_add_reminder, "patient_memory", False),
+    "toggle_reminder": (_toggle_reminder, "patient_memory", False),
+    "delete_reminder": (_delete_reminder, "patient_memory", False),
+    "add_activity": (_add_activity, "patient_activities", False),
+    "toggle_activity": (_toggle_activity, "patient_activities", False),
+    "delete_activity": (_delete_activity, "patient_activities", False),
+    "set_timezone": (_set_timezone, "patient_hub", True),
+}
+MAX_BATCH_OPS = int(os.getenv("MAX_BATCH_OPS", "100"))
+
 @app.route("/patient/action", methods=["POST"])
 @role_required("patient")
 def patient_action():
     username = session.get("user")
     _ensure_patient(username)
-    data = PATIENT_DB[username]
     action = request.form.get("action", "")
     ref = request.referrer
+    if action not in PATIENT_ACTIONS:
+        flash("Unknown action.", "warning")
+        return redirect(url_for("patient_hub"))
+    handler, endpoint, follow_ref = PATIENT_ACTIONS[action]
 
-    # -------- Tasks --------
-    if action == "add_task":
-        title = request.form.get("task_title", "").strip()
-        if title:
-            data["tasks"].append({"id": str(uuid.uuid4()), "title": title, "done": False})
-            flash("Task added.", "success")
-        return redirect(ref or url_for("patient_hub"))
-
-    if action == "toggle_task":
-        tid = request.form.get("task_id")
-        for t in data["tasks"]:
-            if t["id"] == tid:
-                t["done"] = not t["done"]
-                break
-        return redirect(ref or url_for("patient_hub"))
-
-    if action == "delete_task":
-        tid = request.form.get("task_id")
-        data["tasks"] = [t for t in data["tasks"] if t["id"] != tid]
-        return redirect(ref or url_for("patient_hub"))
-
-    # -------- Meds --------
-    if action == "add_med":
-        name = request.form.get("med_name", "").strip()
-        tm = request.form.get("med_time", "").strip()
-        if name and tm:
-            data["meds"].append({"id": str(uuid.uuid4()), "name": name, "time": tm, "taken_today": False})
-            flash("Medication added.", "success")
-        return redirect(ref or url_for("patient_meds"))
-
-    if action == "toggle_med":
-        mid = request.form.get("med_id")
-        for m in data["meds"]:
-            if m["id"] == mid:
-                m["taken_today"] = not m["taken_today"]
-                break
-        return redirect(ref or url_for("patient_meds"))
-
-    if action == "delete_med":
-        mid = request.form.get("med_id")
-        data["meds"] = [m for m in data["meds"] if m["id"] != mid]
-        return redirect(ref or url_for("patient_meds"))
-
-    # -------- Mood & Notes --------
-    if action == "set_mood_and_note":
-        mood = request.form.get("mood", "").strip() or data["mood"]
-        note = request.form.get("note", "").strip()
-        data["mood"] = mood
-        if note:
-            data["notes"].insert(0, {"id": str(uuid.uuid4()), "mood": mood, "text": note,
-                                     "ts": datetime.now().strftime("%Y-%m-%d %H:%M")})
-            flash("Mood & note saved.", "success")
-        else:
-            flash("Mood saved.", "success")
-        return redirect(ref or url_for("patient_mood"))
-
-    if action == "delete_note":
-        nid = request.form.get("note_id")
-        data["notes"] = [n for n in data["notes"] if n["id"] != nid]
-        return redirect(ref or url_for("patient_mood"))
-
-    # -------- Appointments (shown on hub or dashboard) --------
-    if action == "add_appt":
-        title = request.form.get("appt_title", "").strip()
-        dt = request.form.get("appt_dt", "").strip()
-        if title and dt:
-            data["appts"].append({"id": str(uuid.uuid4()), "title": title, "dt": dt})
-            flash("Appointment added.", "success")
-        return redirect(ref or url_for("patient_hub"))
-
-    if action == "delete_appt":
-        aid = request.form.get("appt_id")
-        data["appts"] = [a for a in data["appts"] if a["id"] != aid]
+    # Optional optimistic concurrency: a client that sends the version it
+    # rendered from gets a conflict instead of overwriting a newer change.
+    expected = request.form.get("version", type=int)
+    try:
+        with ACTION_LATENCY.time(action, "form"), \
+                PATIENT_DB.transaction(username, expected_version=expected) as tx:
+            msg = handler(tx, request.form)
+    except ConflictError:
+        flash("This was changed elsewhere in the meantime. Please check and try again.", "warning")
         return redirect(ref or url_for("patient_hub"))
+    if msg:
+        flash(msg[1], msg[0])
+    return redirect((ref if follow_ref else None) or url_for(endpoint))
+
+
+# Form fields posted as checkboxes: present ("on") when ticked.
+CHECKBOX_FIELDS = {"rem_active"}
+
+def _op_params(op):
+    """An op's fields as the form-like strings the handlers expect.
+
+    Numbers are stringified, null is "" and booleans only count for
+    checkbox fields; anything else raises ValueError naming the field.
+    """
+    params = {}
+    for k, v in op.items():
+        if isinstance(v, bool):
+            if k not in CHECKBOX_FIELDS:
+                raise ValueError(k)
+            v = "on" if v else ""
+        elif v is None:
+            v = ""
+        elif isinstance(v, (int, float)):
+            v = str(v)
+        elif not isinstance(v, str):
+            raise ValueError(k)
+        params[k] = v
+    return params
+
+@app.route("/patient/actions", methods=["POST"])
+@role_required("patient")
+def patient_actions():
+    """Apply a batch of actions in one transaction (all or nothing).
 
-    # -------- Files (delete from list & disk) --------
-    if action == "delete_file":
-        fname = request.form.get("file_name", "")
-        data["files"] = [f for f in data["files"] if f["name"] != fname]
+    Body: {"version": <optional int>, "ops": [{"action": "toggle_task", "task_id": ...}, ...]}
+    using the same action and field names as the form posts. Replies with
+    the new version and only the records that changed.
+    """
+    username = session.get("user")
+    _ensure_patient(username)
+    body = request.get_json(silent=True)
+    ops = body.get("ops") if isinstance(body, dict) else None
+    if not isinstance(ops, list) or not 0 < len(ops) <= MAX_BATCH_OPS:
+        return {"ok": False, "error": f"expected {{\"ops\": [...]}} with 1-{MAX_BATCH_OPS} entries"}, 400
+    params = []
+    for i, op in enumerate(ops):
+        action = op.get("action") if isinstance(op, dict) else None
+        if not isinstance(action, str) or action not in PATIENT_ACTIONS:
+            return {"ok": False, "error": "unknown action", "op": i}, 400
         try:
-            os.remove(os.path.join(UPLOAD_FOLDER, fname))
-        except Exception:
-            pass
-        flash("File removed.", "info")
-        return redirect(ref or url_for("patient_hub"))
-
-    # -------- Memory reminders --------
-    if action == "add_reminder":
-        title = request.form.get("rem_title", "").strip()
-        dt = request.form.get("rem_dt", "").strip()
-        kind = request.form.get("rem_kind", "general").strip()
-        active = bool(request.form.get("rem_active"))
-        if title and dt:
-            data["reminders"].insert(0, {"id": str(uuid.uuid4()), "title": title,
-                                         "dt": dt, "kind": kind, "active": active})
-            flash("Reminder added.", "success")
-        return redirect(url_for("patient_memory"))
-
-    if action == "toggle_reminder":
-        rid = request.form.get("rem_id")
-        for r in data["reminders"]:
-            if r["id"] == rid:
-                r["active"] = not r["active"]
-                break
-        return redirect(url_for("patient_memory"))
-
-    if action == "delete_reminder":
-        rid = request.form.get("rem_id")
-        data["reminders"] = [r for r in data["reminders"] if r["id"] != rid]
-        return redirect(url_for("patient_memory"))
-
-    # -------- Activities --------
-    if action == "add_activity":
-        title = request.form.get("act_title", "").strip()
-        if title:
-            data["activities"].append({"id": str(uuid.uuid4()), "title": title, "done_today": False})
-            flash("Activity added.", "success")
-        return redirect(url_for("patient_activities"))
-
-    if action == "toggle_activity":
-        aid = request.form.get("act_id")
-        for a in data["activities"]:
-            if a["id"] == aid:
-                a["done_today"] = not a["done_today"]
-                break
-        return redirect(url_for("patient_activities"))
-
-    if action == "delete_activity":
-        aid = request.form.get("act_id")
-        data["activities"] = [a for a in data["activities"] if a["id"] != aid]
-        return redirect(url_for("patient_activities"))
+            params.append(_op_params(op))
+        except ValueError as e:
+            return {"ok": False, "error": f"field {e} must be a string or a number", "op": i}, 400
+    expected = body.get("version")
+    if expected is not None and (not isinstance(expected, int) or isinstance(expected, bool)):
+        return {"ok": False, "error": "version must be an integer"}, 400
 
-    flash("Unknown action.", "warning")
-    return redirect(url_for("patient_hub"))
+    try:
+        with PATIENT_DB.transaction(username, expected_version=expected) as tx:
+            messages = []
+            for op, p in zip(ops, params):
+                with ACTION_LATENCY.time(op["action"], "batch"):
+                    msg = PATIENT_ACTIONS[op["action"]][0](tx, p)
+                if msg:
+                    messages.append({"category": msg[0], "message": msg[1]})
+            out = {
+                "ok": True,
+                "version": tx.version,
+                "changed": [{"kind": kind, "id": rid, "record": rec} for (kind, rid), rec in tx.changes.items()],
+                "messages": messages,
+            }
+            if tx.fields_changed:
+                out["fields"] = tx.fields()
+    except ConflictError as e:
+        return {"ok": False, "error": "conflict", "version": e.actual}, 409
+    return out
 
 
 @app.route("/patient/upload", methods=["POST"])
@@ -561,27 +1109,263 @@ def patient_action():
 def patient_upload():
     username = session.get("user")
     _ensure_patient(username)
+    # Temp files the parse opens are discarded when the request closes
+    # (uploads.UploadRequest), whatever happens from here on.
     f = request.files.get("file")
     if not f or f.filename == "":
         flash("No file selected.", "warning")
         return redirect(url_for("patient_hub"))
     ext = os.path.splitext(f.filename)[1].lower()
     if ext not in ALLOWED_UPLOADS:
+        UPLOADS.inc("rejected")
         flash("Unsupported file type.", "danger")
         return redirect(url_for("patient_hub"))
-
-    safe = secure_filename(f"{username}_{uuid.uuid4().hex}{ext}")
-    f.save(os.path.join(UPLOAD_FOLDER, safe))
-    PATIENT_DB[username]["files"].insert(0, {"name": safe})
-    flash("File uploaded.", "success")
+    UPLOAD_BYTES.inc(amount=f.stream.size)
+
+    # The body was hashed while werkzeug spooled it (uploads.UploadRequest).
+    digest = f.stream.hexdigest()
+    rel = blob_path(digest, ext)
+    with PATIENT_DB.transaction(username) as tx:
+        # One record per patient and content: uploading it again changes nothing.
+        if tx.get("files", digest):
+            f.stream.discard()
+            result = "duplicate"
+        else:
+            store_blob(f.stream, UPLOAD_FOLDER, rel)
+            tx.adjust_ref("upload:" + rel, +1)
+            tx.add("files", {"id": digest, "name": secure_filename(f.filename) or digest + ext,
+                             "path": rel, "size": f.stream.size})
+            result = "stored"
+    UPLOADS.inc(result)
+    if result == "duplicate":
+        flash("You have already uploaded this file.", "info")
+    else:
+        flash("File uploaded.", "success")
     return redirect(url_for("patient_hub"))
 
 
+def _release_upload(tx, rec):
+    """Drop a patient's file record's claim on its blob; delete the blob if unused."""
+    if "path" not in rec:  # uploaded before content addressing: one file per record
+        rel = rec["name"]
+    elif tx.adjust_ref("upload:" + rec["path"], -1) == 0:
+        rel = rec["path"]
+    else:
+        return
+    # Moved aside now, under the write lock (see uploads.py); removed once
+    # the delete commits, put back if the batch rolls back.
+    moved = set_aside(UPLOAD_FOLDER, rel, UploadRequest.upload_tmp_dir)
+    if moved:
+        drop, restore = moved
+        tx.on_commit(drop)
+        tx.on_rollback(restore)
+
+
 # ----------------- Caretaker -----------------
+# Patients are assigned with `flask assign-caretaker PATIENT CARETAKER`
+# (fields["caretaker"]); the list is built from the store's per-patient
+# summaries, one indexed read per page whatever the number of patients.
+CARETAKER_PAGE_SIZE = int(os.getenv("CARETAKER_PAGE_SIZE", "25"))
+
+def _caretaker_clock(s, clocks):
+    """(today, "HH:MM", "YYYY-MM-DDTHH:MM") in the patient's zone, once per zone."""
+    tz = s.get("tz")
+    if tz not in clocks:
+        now = datetime.now(zone(tz, PATIENT_DEFAULT_TZ))
+        clocks[tz] = (now.date().isoformat(), now.strftime("%H:%M"), now.strftime("%Y-%m-%dT%H:%M"))
+    return clocks[tz]
+
+def _summary_adherence(s, clock):
+    return round(100 * s["taken"].get(clock[0], 0) / s["meds"]) if s["meds"] else None
+
+def _summary_overdue(s, clock):
+    today, hhmm, _ = clock
+    return sum(1 for t, day in s["med_times"] if t < hhmm and day != today)
+
+def _summary_next(s, clock):
+    return next((r for r in s["reminders"] if r[0] >= clock[2]), None)
+
+# Sort keys see (username, summary, clock); only the page shown is fully built.
+CARETAKER_SORTS = {
+    "name": lambda u, s, c: u,
+    "adherence": lambda u, s, c: -1 if not s["meds"] else _summary_adherence(s, c),
+    "mood": lambda u, s, c: MOOD_SCORES.get(s["mood"], 0),
+    "overdue": lambda u, s, c: _summary_overdue(s, c),
+    "next": lambda u, s, c: (_summary_next(s, c) or ["~"])[0],
+}
+
+def _caretaker_row(username, s, clock):
+    taken, nxt = s["taken"].get(clock[0], 0), _summary_next(s, clock)
+    return {
+        "username": username,
+        "mood": s["mood"],
+        "adherence": _summary_adherence(s, clock),
+        "taken": (taken, s["meds"]),
+        "overdue": _summary_overdue(s, clock),
+        "next_reminder": nxt and (_dt_pretty(nxt[0]), nxt[1]),
+    }
+
 @app.route("/caretaker")
 @role_required("caretaker")
 def caretaker_home():
-    return render_template("caretaker.html", user=session.get("user"), role=session.get("role"))
+    sort = request.args.get("sort", "name")
+    if sort not in CARETAKER_SORTS:
+        sort = "name"
+    desc = request.args.get("dir") == "desc"
+    try:
+        page = max(1, int(request.args.get("page", 1)))
+    except ValueError:
+        page = 1
+    clocks, key = {}, CARETAKER_SORTS[sort]
+    rows = PATIENT_DB.summaries(session.get("user"))
+    rows.sort(key=lambda r: key(r[0], r[1], _caretaker_clock(r[1], clocks)), reverse=desc)
+    pages = max(1, -(-len(rows) // CARETAKER_PAGE_SIZE))
+    page = min(page, pages)
+    start = (page - 1) * CARETAKER_PAGE_SIZE
+    shown = [_caretaker_row(u, s, _caretaker_clock(s, clocks)) for u, s in rows[start:start + CARETAKER_PAGE_SIZE]]
+    return render_template("caretaker.html", user=session.get("user"), role=session.get("role"),
+                           patients=shown, total=len(rows),
+                           sort=sort, desc=desc, page=page, pages=pages)
+
+
+# ----------------- startup -----------------
+# Importing this module touches neither the disk nor the network;
+# create_app() does that, once per process: the upload folder, the patient
+# store (with the scheduler and rate limiter on it), the Jinja bytecode
+# cache (compiled templates kept in JINJA_CACHE_DIR, shared by every worker
+# and restart; empty turns it off), the thumbnail and asset manifests. With WARM_UP=1 (default) it also compiles every
+# template, scans the gallery and opens this worker's store and reCAPTCHA
+# connections, so the first requests after a (re)start, e.g. a worker
+# recycled by max_requests, don't pay for them. gunicorn.conf.py calls it
+# before a worker accepts connections; otherwise (flask run, the test
+# client) the first request does.
+JINJA_CACHE_DIR = os.getenv("JINJA_CACHE_DIR", os.path.join(app.instance_path, "jinja"))
+WARM_UP = os.getenv("WARM_UP", "1") == "1"
+STARTUP_LATENCY = METRICS.histogram("startup_duration_seconds", "create_app() steps, once per worker.", ("step",))
+_START_LOCK = threading.Lock()
+_started_pid = None
+
+
+def create_app(warm=None):
+    """The app, with its startup done in this process (idempotent)."""
+    global _started_pid
+    with _START_LOCK:
+        if _started_pid == os.getpid():
+            return app
+        with STARTUP_LATENCY.time("setup"):
+            os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+            if JINJA_CACHE_DIR:
+                os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+                app.jinja_env.bytecode_cache = FileSystemBytecodeCache(JINJA_CACHE_DIR)
+            if SCHEDULER is None:
+                _open_patient_db()
+            THUMBS.load()
+        if STATIC_FINGERPRINT:
+            with STARTUP_LATENCY.time("assets"):
+                ASSETS.load()
+        if warm is None:
+            warm = WARM_UP
+        if warm:
+            warm_up()
+        _started_pid = os.getpid()
+    return app
+
+
+def _open_patient_db():
+    """Open the store (unless a bench or test has put one in place) and
+    hang the per-process subscribers off it."""
+    global PATIENT_DB, SCHEDULER, LIMITER
+    if PATIENT_DB is None:
+        PATIENT_DB = open_store(PATIENT_STORE, PATIENT_DB_PATH, PATIENT_DERIVED, cooperative=GREEN)
+    PATIENT_DB.subscribe(_forget_day)
+    SCHEDULER = ReminderScheduler(PATIENT_DB, default_tz=PATIENT_DEFAULT_TZ, check_interval=SCHEDULER_CHECK_INTERVAL)
+    LIMITER = RateLimiter(PATIENT_DB)
+
+
+def warm_up():
+    """Do now what the first requests of a fresh worker would otherwise wait for."""
+    with STARTUP_LATENCY.time("templates"):
+        for name in app.jinja_env.list_templates(extensions=("html",)):
+            app.jinja_env.get_template(name)
+    with STARTUP_LATENCY.time("gallery"):
+        GALLERY.refresh()
+    with STARTUP_LATENCY.time("store"):
+        PATIENT_DB.usernames(limit=1)
+    with STARTUP_LATENCY.time("recaptcha"):
+        RECAPTCHA.warm()
+
+
+# ----------------- CLI -----------------
+@app.cli.command("warm-thumbnails")
+@click.option("--workers", type=int, default=None, help="Processes to use (default: one per CPU).")
+@click.option("--force", is_flag=True, help="Re-derive even images that look unchanged.")
+def warm_thumbnails(workers, force):
+    """Pre-build gallery thumbnails for the whole catalog."""
+    create_app(warm=False)
+    GALLERY.refresh(force=True)
+    rels = [it["img"] for it in GALLERY.all_images()]
+    built, failed = THUMBS.warm(rels, workers=workers, force=force,
+                                progress=lambda done, total: click.echo(f"\r{done}/{total}", nl=False))
+    click.echo(f"\n{built} derived, {failed} failed, {len(rels) - built - failed} already up to date")
+
+
+@app.cli.command("build-assets")
+def build_assets():
+    """Hash (and precompress) everything under static/ into the asset manifest."""
+    files, hashed = ASSETS.load()
+    click.echo(f"{files} files, {hashed} hashed, {files - hashed} unchanged")
+
+
+@app.cli.command("migrate-store")
+def migrate_store():
+    """Create or upgrade the patient store; rebuilds derived data if PATIENT_DERIVED changed."""
+    if PATIENT_STORE != "sqlite":
+        click.echo(f"{PATIENT_STORE} store: nothing to migrate")
+        return
+    started = time.perf_counter()
+    rebuilt = SQLiteStore(PATIENT_DB_PATH, PATIENT_DERIVED, migrate=False).migrate()
+    click.echo(f"{PATIENT_DB_PATH}: {'derived data rebuilt' if rebuilt else 'up to date'}, "
+               f"{time.perf_counter() - started:.1f} s")
+
+
+@app.cli.command("assign-caretaker")
+@click.argument("patient")
+@click.argument("caretaker", required=False)
+def assign_caretaker(patient, caretaker):
+    """Assign PATIENT to CARETAKER (omit CARETAKER to unassign)."""
+    create_app(warm=False)
+    _ensure_patient(patient)
+    PATIENT_DB.set_fields(patient, caretaker=caretaker or None)
+    click.echo(f"{patient} -> {caretaker or '(none)'}")
+
+
+def _upload_refs(kind, rec):
+    """Reference counts a record holds; restored on import."""
+    return ["upload:" + rec["path"]] if kind == "files" and "path" in rec else []
+
+
+@app.cli.command("export-patients")
+@click.argument("dest", type=click.File("w", encoding="utf-8"), default="-")
+def export_patients(dest):
+    """Write every patient to DEST as NDJSON (default: stdout)."""
+    create_app(warm=False)
+    for line in export_lines(PATIENT_DB):
+        dest.write(line)
+
+
+@app.cli.command("import-patients")
+@click.argument("src", type=click.File("rb"), default="-")
+@click.option("--batch", type=int, default=BATCH, help="Patients per write transaction.")
+def import_patients(src, batch):
+    """Create the patients in an NDJSON export (SRC, default: stdin) that don't exist yet."""
+    create_app(warm=False)
+    started = time.perf_counter()
+    progress = lambda seen, made: click.echo(f"\r{seen} patients read, {made} created", nl=False, err=True)
+    try:
+        created, skipped = import_lines(PATIENT_DB, src, batch=batch, refs=_upload_refs, progress=progress)
+    except ValueError as exc:
+        raise click.ClickException(str(exc))
+    click.echo(f"\n{created} created, {skipped} already present, {time.perf_counter() - started:.1f} s", err=True)
 
 
 # ----------------- main -----------------
@@ -0,0 +1,218 @@
+"""Content-fingerprinted static files, served with immutable caching.
+
+``AssetManifest`` knows the SHA-256 of every file under static/, and
+``url`` turns ``app.js`` into ``app.<hash>.js``. A fingerprinted URL always
+means the same bytes, so ``send`` answers it with ``Cache-Control: public,
+max-age=31536000, immutable`` and browsers never revalidate; a deploy that
+changes the file changes its URL. Text assets (css, js, svg, ...) also get
+gzip (and, with the ``brotli`` package, brotli) copies, written once per
+hash under ``cache_dir`` and sent to clients that accept them.
+
+The manifest is saved in ``cache_dir`` with each file's (size, mtime), so a
+restart only stats the tree and hashes what changed. Files that appear
+later are hashed the first time a URL is built for them.
+
+Prefixes in ``exclude`` (patient uploads) keep plain URLs and Flask's
+normal caching; prefixes in ``content_addressed`` (thumbnails, already
+named by hash) keep their URLs but are served as immutable.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import stat
+import threading
+
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+FINGERPRINT_LEN = 12
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+COMPRESSIBLE = {".css", ".js", ".mjs", ".map", ".json", ".svg", ".txt", ".html", ".xml"}
+
+_HASH_NAMED = re.compile(r"(^|/)[0-9a-f]{32,}[^/]*$")
+_FINGERPRINTED = re.compile(r"^(?P<stem>.+)\.(?P<fp>[0-9a-f]{%d})(?P<ext>\.[^./]+)?$" % FINGERPRINT_LEN)
+
+
+def fingerprint(rel, digest):
+    """``css/site.css`` -> ``css/site.<digest[:12]>.css``."""
+    stem, ext = os.path.splitext(rel)
+    return f"{stem}.{digest[:FINGERPRINT_LEN]}{ext}"
+
+
+class AssetManifest:
+    def __init__(self, root, cache_dir, exclude=(), content_addressed=(), min_compress=1024):
+        self.root = root
+        self.cache_dir = cache_dir
+        self.exclude = tuple(exclude)
+        self.content_addressed = tuple(content_addressed)
+        self.min_compress = min_compress
+        self._path = os.path.join(cache_dir, "manifest.json")
+        self._files = {}  # rel -> [size, mtime_ns, sha256 hex]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._files)
+
+    # ---- building ----
+    def load(self):
+        """Scan ``root``, hashing only new or changed files. Returns (files, hashed)."""
+        try:
+            with open(self._path, encoding="utf-8") as fh:
+                cached = json.load(fh)
+        except (OSError, ValueError):
+            cached = {}
+        files, hashed = {}, 0
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            prefix = os.path.relpath(dirpath, self.root).replace(os.sep, "/")
+            prefix = "" if prefix == "." else prefix + "/"
+            dirnames[:] = [d for d in dirnames if not d.startswith(".") and not self._skip(prefix + d + "/")]
+            for name in filenames:
+                rel = prefix + name
+                if name.startswith(".") or self._skip(rel):
+                    continue
+                old = cached.get(rel)
+                entry = self._entry(rel, old)
+                if entry is None:
+                    continue
+                files[rel] = entry
+                hashed += entry is not old
+        with self._lock:
+            self._files = files
+        if hashed or len(files) != len(cached):
+            self._save(files)
+        return len(files), hashed
+
+    def _skip(self, rel):
+        return rel.startswith(self.exclude) or rel.startswith(self.content_addressed)
+
+    def _entry(self, rel, old=None):
+        """``old`` if the file still matches it, else a freshly hashed entry
+        (None if gone or not a regular file)."""
+        path = os.path.join(self.root, rel)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        if old and old[0] == st.st_size and old[1] == st.st_mtime_ns:
+            return old
+        h = hashlib.sha256()
+        compress = os.path.splitext(rel)[1].lower() in COMPRESSIBLE and st.st_size >= self.min_compress
+        with open(path, "rb") as fh:
+            data = fh.read() if compress else None
+            if data is not None:
+                h.update(data)
+            else:
+                for chunk in iter(lambda: fh.read(1 << 20), b""):
+                    h.update(chunk)
+        digest = h.hexdigest()
+        if compress:
+            self._precompress(digest, data)
+        return [st.st_size, st.st_mtime_ns, digest]
+
+    def _variant_path(self, digest, coding):
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.{coding}")
+
+    def _precompress(self, digest, data):
+        variants = {"gzip": lambda: gzip.compress(data, 9, mtime=0)}
+        if brotli is not None:
+            variants["br"] = lambda: brotli.compress(data, quality=11)
+        for coding, build in variants.items():
+            path = self._variant_path(digest, coding)
+            if os.path.exists(path):
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}"
+            with open(tmp, "wb") as fh:
+                fh.write(build())
+            os.replace(tmp, path)
+
+    def _save(self, files):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = f"{self._path}.{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(files, fh)
+        os.replace(tmp, self._path)
+
+    def _refresh(self, rel, old=None):
+        entry = self._entry(rel, old)
+        with self._lock:
+            if entry is None:
+                self._files.pop(rel, None)
+            else:
+                self._files[rel] = entry
+        return entry
+
+    # ---- request path ----
+    def url(self, filename):
+        """Fingerprinted name for ``filename`` (itself if excluded or missing)."""
+        entry = self._files.get(filename)
+        if entry is None:
+            if self._skip(filename) or safe_join(self.root, filename) is None:
+                return filename
+            entry = self._refresh(filename)
+            if entry is None:
+                return filename
+        return fingerprint(filename, entry[2])
+
+    def resolve(self, filename):
+        """(rel, fingerprint) for a fingerprinted name, else (None, None)."""
+        if filename in self._files:
+            return None, None
+        m = _FINGERPRINTED.match(filename)
+        if m is None:
+            return None, None
+        return m["stem"] + (m["ext"] or ""), m["fp"]
+
+    def send(self, request, response_class, filename, fallback):
+        """Serve ``filename``; anything that isn't a current fingerprint goes to ``fallback``."""
+        if filename.startswith(self.content_addressed) and _HASH_NAMED.search(filename):
+            path = safe_join(self.root, filename)
+            if path is None or not os.path.isfile(path):
+                return fallback(filename)
+            return self._immutable(request, response_class, path, filename, None, None)
+        rel, fp = self.resolve(filename)
+        if rel is None or self._skip(rel):
+            return fallback(filename)
+        # Only files under root ever get hashed or into the manifest.
+        path = safe_join(self.root, rel)
+        if path is None or not os.path.isfile(path):
+            return fallback(filename)
+        # Re-stat so a file edited in place never goes out under its old hash.
+        entry = self._refresh(rel, self._files.get(rel))
+        if entry is None or entry[2][:FINGERPRINT_LEN] != fp:
+            return fallback(rel)
+        return self._immutable(request, response_class, path, rel, entry[2], entry[1])
+
+    def _immutable(self, request, response_class, path, rel, digest, mtime_ns):
+        mimetype = mimetypes.guess_type(rel)[0] or "application/octet-stream"
+        compressible = digest is not None and os.path.splitext(rel)[1].lower() in COMPRESSIBLE
+        coding = self._pick_coding(request, digest) if compressible else None
+        rv = send_file(self._variant_path(digest, coding) if coding else path, request.environ,
+                       mimetype=mimetype, download_name=os.path.basename(rel), conditional=True,
+                       etag=(f"{digest[:32]}-{coding}" if coding else digest[:32]) if digest else True,
+                       last_modified=mtime_ns / 1e9 if mtime_ns else None,
+                       max_age=IMMUTABLE_MAX_AGE, response_class=response_class)
+        rv.cache_control.public = True
+        rv.cache_control.immutable = True
+        if coding:
+            rv.headers["Content-Encoding"] = coding
+        if compressible:
+            rv.vary.add("Accept-Encoding")
+        return rv
+
+    def _pick_coding(self, request, digest):
+        accept = request.accept_encodings
+        for coding in ("br", "gzip"):
+            if accept[coding] and os.path.exists(self._variant_path(digest, coding)):
+                return coding
+        return None
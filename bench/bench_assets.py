@@ -0,0 +1,94 @@
+"""Asset manifest: startup scan with and without the on-disk cache.
+
+    python bench/bench_assets.py [--files 5000] [--size 20000]
+
+Builds a throwaway static tree of FILES media files (SIZE bytes each) plus a
+few css/js files, then times AssetManifest.load() cold (no manifest: every
+file hashed, text assets gzipped), warm (manifest on disk: stat only) and
+after touching 1% of the files. Also times url() per call and a GET of a
+fingerprinted asset vs. an If-None-Match revalidation a browser no longer
+needs to make.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from flask import Flask, request  # noqa: E402
+
+from assets import AssetManifest  # noqa: E402
+
+
+def build_tree(root, files, size):
+    rnd = os.urandom(size)
+    for i in range(files):
+        d = os.path.join(root, "customer_images", f"cat{i % 20:02d}")
+        os.makedirs(d, exist_ok=True)
+        with open(os.path.join(d, f"img{i:05d}.png"), "wb") as fh:
+            fh.write(rnd[i % 97:] + i.to_bytes(4, "big"))
+    for name in ("style.css", "app.js", "patient-actions.js"):
+        with open(os.path.join(root, name), "w") as fh:
+            fh.write("/* %s */\n" % name + "body { color: #333; }\n" * 400)
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    rv = fn()
+    return (time.perf_counter() - t0) * 1000, rv
+
+
+def run(files, size, n=2000):
+    tmp = tempfile.mkdtemp(prefix="bench-assets-")
+    try:
+        root, cache = os.path.join(tmp, "static"), os.path.join(tmp, "cache")
+        build_tree(root, files, size)
+        for label in ("cold", "warm"):
+            ms, (count, hashed) = timed(AssetManifest(root, cache).load)
+            print(f"load {label:<12} {ms:8.1f} ms   {count} files, {hashed} hashed")
+        touched = [os.path.join(root, "customer_images", f"cat{i % 20:02d}", f"img{i:05d}.png")
+                   for i in range(0, files, 100)]
+        for path in touched:
+            with open(path, "ab") as fh:
+                fh.write(b"!")
+        ms, (count, hashed) = timed(AssetManifest(root, cache).load)
+        print(f"load {'1% changed':<12} {ms:8.1f} ms   {count} files, {hashed} hashed")
+
+        manifest = AssetManifest(root, cache)
+        manifest.load()
+        rels = [f"customer_images/cat{i % 20:02d}/img{i:05d}.png" for i in range(min(files, n))]
+        t0 = time.perf_counter()
+        for rel in rels:
+            manifest.url(rel)
+        print(f"url()             {(time.perf_counter() - t0) / len(rels) * 1e6:8.2f} µs")
+
+        app = Flask(__name__, static_folder=root)
+        app.view_functions["static"] = lambda filename: manifest.send(
+            request, app.response_class, filename, app.send_static_file)
+        client = app.test_client()
+        url = "/static/" + manifest.url("style.css")
+        first = client.get(url, headers={"Accept-Encoding": "gzip"})
+        inm = {"Accept-Encoding": "gzip", "If-None-Match": first.headers["ETag"]}
+        for label, headers in (("GET", {"Accept-Encoding": "gzip"}), ("revalidate", inm)):
+            samples = []
+            for _ in range(5):
+                t0 = time.perf_counter()
+                for _ in range(n // 10):
+                    client.get(url, headers=headers).close()
+                samples.append((time.perf_counter() - t0) / (n // 10) * 1e6)
+            print(f"{label:<17} {statistics.median(samples):8.1f} µs")
+        print(f"style.css {first.headers['Content-Length']} bytes gzip, "
+              f"Cache-Control: {first.headers['Cache-Control']}")
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--files", type=int, default=5000)
+    ap.add_argument("--size", type=int, default=20000)
+    args = ap.parse_args()
+    run(args.files, args.size)
@@ -0,0 +1,139 @@
+"""Logins in flight per core: gthread vs. gevent workers, slow reCAPTCHA verifier.
+
+    python bench/bench_async.py [--logins 400] [--delay 1.0] [--threads 8] [--connections 1000]
+
+Starts bench/stub_recaptcha.py answering after ``--delay`` seconds, then
+gunicorn with ONE worker (one core) of each class in turn, and POSTs
+``--logins`` logins at once, each with a fresh token so none is answered
+from the verifier's cache. Reports login throughput and latency, how many
+logins the worker had in flight on average (throughput x delay), and the
+latency of the landing page fetched while the logins are pending: under
+gthread it queues behind them, under gevent it doesn't. Admission control
+is switched off (ADMISSION_CONTROL=0) so that every login gets in.
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import requests
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stub_recaptcha import start_in_thread  # noqa: E402
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_up(base, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(base + "/", timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise SystemExit("gunicorn did not come up")
+
+
+def _login(base, latencies, failures):
+    t0 = time.perf_counter()
+    try:
+        r = requests.post(base + "/login", allow_redirects=False, timeout=120, data={
+            "username": "caretaker", "password": "guest", "g-recaptcha-response": uuid.uuid4().hex})
+        ok = r.status_code == 302 and r.headers.get("Location", "").endswith("/home")
+    except requests.RequestException:
+        ok = False
+    (latencies if ok else failures).append(time.perf_counter() - t0)
+
+
+def _get_landing(base, samples):
+    t0 = time.perf_counter()
+    try:
+        requests.get(base + "/", timeout=120).raise_for_status()
+    except requests.RequestException:
+        return
+    samples.append(time.perf_counter() - t0)
+
+
+def _probe(base, stop, samples):
+    """Fetch the landing page every 0.25 s until ``stop``, without waiting for answers."""
+    fetches = []
+    while not stop.wait(0.25):
+        fetches.append(threading.Thread(target=_get_landing, args=(base, samples)))
+        fetches[-1].start()
+    for t in fetches:
+        t.join()
+
+
+def run_worker(worker_class, logins, verify_url, delay, threads, connections):
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    tmp = tempfile.mkdtemp(prefix="bench-async-")
+    env = dict(os.environ,
+               GUNICORN_WORKER_CLASS=worker_class, WEB_CONCURRENCY="1",
+               GUNICORN_BIND=f"127.0.0.1:{port}", GUNICORN_TIMEOUT="120",
+               GUNICORN_THREADS=str(threads), GUNICORN_WORKER_CONNECTIONS=str(connections),
+               RECAPTCHA_SECRET_KEY="bench", RECAPTCHA_VERIFY_URL=verify_url,
+               RECAPTCHA_READ_TIMEOUT=str(delay * 10), RECAPTCHA_POOL_SIZE=str(max(threads, connections)),
+               PATIENT_DB_PATH=os.path.join(tmp, "patients.db"), METRICS_DIR="",
+               ASSET_CACHE_DIR=os.path.join(tmp, "assets"), ADMISSION_CONTROL="0")
+    proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "app:app"], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_up(base)
+        latencies, failures, probes, stop = [], [], [], threading.Event()
+        clients = [threading.Thread(target=_login, args=(base, latencies, failures)) for _ in range(logins)]
+        prober = threading.Thread(target=_probe, args=(base, stop, probes))
+        t0 = time.perf_counter()
+        for t in clients:
+            t.start()
+        prober.start()
+        for t in clients:
+            t.join()
+        elapsed = time.perf_counter() - t0
+        stop.set()
+        prober.join()
+        probes.sort()
+    finally:
+        proc.terminate()
+        proc.wait()
+    latencies.sort()
+    rate = len(latencies) / elapsed
+    print(f"{worker_class:<8} {len(latencies):>6} {len(failures):>6} {elapsed:8.1f} s {rate:8.1f}/s "
+          f"{rate * delay:9.0f} {statistics.median(latencies):8.2f} s "
+          f"{latencies[int(0.95 * (len(latencies) - 1))]:8.2f} s "
+          f"{statistics.median(probes) * 1000 if probes else float('nan'):9.0f} ms "
+          f"{probes[-1] * 1000 if probes else float('nan'):9.0f} ms")
+
+
+def run(logins, delay, threads, connections):
+    server, url = start_in_thread(delay=delay)
+    try:
+        print(f"{logins} concurrent logins, verifier delay {delay:.2f} s, one worker each")
+        print(f"{'worker':<8} {'ok':>6} {'failed':>6} {'wall':>10} {'logins':>10} {'in flight':>9} "
+              f"{'p50':>10} {'p95':>10} {'landing p50':>12} {'max':>12}")
+        for worker_class in ("gthread", "gevent"):
+            run_worker(worker_class, logins, url, delay, threads, connections)
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--logins", type=int, default=400)
+    ap.add_argument("--delay", type=float, default=1.0)
+    ap.add_argument("--threads", type=int, default=8, help="gthread threads per worker")
+    ap.add_argument("--connections", type=int, default=1000, help="gevent connections per worker")
+    args = ap.parse_args()
+    run(args.logins, args.delay, args.threads, args.connections)
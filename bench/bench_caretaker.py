@@ -0,0 +1,89 @@
+"""Caretaker page generation vs. number of patients.
+
+    python bench/bench_caretaker.py [--patients 10000] [--per-caretaker 50] [--reps 20]
+
+Seeds ``--patients`` patients (a few meds and reminders each) split between
+caretakers of ``--per-caretaker`` patients on each backend and times GET
+/caretaker through the Flask test client for one of them; "load" is just
+loading each of that caretaker's patients, what the page would cost without
+summaries. Then every patient is reassigned to that caretaker (timed: each
+write refreshes a summary) and the page is timed again, first page and
+sorted by overdue meds. Times are per page, in ms (target: <100).
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("PATIENT_STORE", "memory")
+os.environ.setdefault("THUMBNAIL_WORKERS", "0")
+import app as webapp  # noqa: E402
+from storage import MemoryStore, SQLiteStore  # noqa: E402
+
+
+def _patient(rnd, caretaker, now):
+    return {
+        "caretaker": caretaker,
+        "mood": rnd.choice(list(webapp.MOOD_SCORES)),
+        "meds": [{"id": str(uuid.uuid4()), "name": f"med {i}", "time": f"{rnd.randrange(24):02d}:00",
+                  "taken_today": rnd.random() < .5, "taken_day": now.date().isoformat()} for i in range(3)],
+        "reminders": [{"id": str(uuid.uuid4()), "title": f"reminder {i}", "active": True,
+                       "dt": (now + timedelta(hours=rnd.uniform(-48, 96))).isoformat(timespec="minutes")}
+                      for i in range(10)],
+    }
+
+
+def _time(fn, reps):
+    samples = []
+    for _ in range(reps):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1e3)
+    return statistics.median(samples)
+
+
+def _page(client, caretaker, query=""):
+    with client.session_transaction() as sess:
+        sess["user"], sess["role"] = caretaker, "caretaker"
+    r = client.get("/caretaker" + query)
+    assert r.status_code == 200, r.status_code
+
+
+def run(n, per, reps):
+    tmp = tempfile.mkdtemp(prefix="bench-caretaker-")
+    client = webapp.app.test_client()
+    print(f"{'backend':<8} {'patients':>8} {'reassign s':>10} {'typical ms':>11} "
+          f"{'all p1 ms':>10} {'all sorted ms':>14} {'load ms':>8}")
+    for name, store in (("memory", MemoryStore(webapp.PATIENT_DERIVED)),
+                        ("sqlite", SQLiteStore(os.path.join(tmp, "p.db"), webapp.PATIENT_DERIVED))):
+        # typical caretakers are seeded first, then everyone moves to one
+        rnd = random.Random(n)
+        now = datetime.now()
+        for i in range(n):
+            store.create(f"p{i:05d}", _patient(rnd, f"c{i // per:04d}", now))
+        group = [u for u, _ in store.summaries("c0000")]
+        webapp.PATIENT_DB = store
+        typical = _time(lambda: _page(client, "c0000"), reps)
+        by_load = _time(lambda: [store.load(u) for u in group], reps)
+        t0 = time.perf_counter()
+        for i in range(per, n):
+            store.set_fields(f"p{i:05d}", caretaker="c0000")
+        reassign = time.perf_counter() - t0
+        all_p1 = _time(lambda: _page(client, "c0000"), reps)
+        all_sorted = _time(lambda: _page(client, "c0000", "?sort=overdue&dir=desc&page=7"), reps)
+        print(f"{name:<8} {n:>8} {reassign:>10.2f} {typical:>11.2f} {all_p1:>10.2f} {all_sorted:>14.2f} {by_load:>8.2f}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--patients", type=int, default=10000)
+    ap.add_argument("--per-caretaker", type=int, default=50)
+    ap.add_argument("--reps", type=int, default=20)
+    args = ap.parse_args()
+    run(args.patients, args.per_caretaker, args.reps)
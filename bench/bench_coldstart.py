@@ -0,0 +1,135 @@
+"""Cold start: time to first request and first-hit latency of a fresh worker.
+
+    python bench/bench_coldstart.py [--handshake 0.1] [--runs 3]
+
+Starts gunicorn with one worker, the way a restart or a worker recycled by
+``max_requests`` comes up, in three setups:
+
+- none: WARM_UP=0 and no Jinja bytecode cache: every template compiles,
+  the gallery is scanned and the verifier connection opened by whichever
+  request needs them first (what each worker did before create_app);
+- warm-up: create_app() does all of that before the worker accepts
+  connections, compiling the templates (and filling an empty bytecode cache);
+- warm-up + cache: the same, with the bytecode cache left by the run before,
+  so templates are loaded rather than compiled.
+
+Reports the time from spawning gunicorn to the first answered request,
+then walks every page once as a patient, a caretaker and an admin:
+the sum and the worst of those first hits, next to a second walk (warm).
+The reCAPTCHA verifier is bench/stub_recaptcha.py, which holds each new
+connection for ``--handshake`` seconds the way a TLS handshake would.
+Times are medians over ``--runs``; the warm-up steps come from the
+worker's own startup_duration_seconds metric.
+"""
+import argparse
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_async import _free_port  # noqa: E402
+from stub_recaptcha import start_in_thread  # noqa: E402
+
+WALKS = {
+    "patient": ("pass123", ["/home", "/patient/hub", "/patient/dashboard", "/patient/meds", "/patient/mood",
+                            "/patient/memory", "/patient/activities", "/patient/games", "/patient/gallery"]),
+    "caretaker": ("guest", ["/caretaker", "/customer"]),
+    "admin": ("admin123", ["/admin"]),
+}
+SETUPS = ("none", "warm-up", "warm-up + cache")
+
+
+def _walk(base):
+    """Latency of each page, logged in as each role in turn (plus / and the login form)."""
+    took = []
+
+    def timed(fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        r = fn(*args, timeout=30, **kwargs)
+        took.append(time.perf_counter() - t0)
+        if r.status_code >= 400:
+            raise SystemExit(f"{args[0]}: {r.status_code}")
+
+    for user, (password, pages) in WALKS.items():
+        s = requests.Session()
+        timed(s.get, base + "/")
+        timed(s.get, base + "/login")
+        timed(s.post, base + "/login", data={"username": user, "password": password,
+                                             "g-recaptcha-response": os.urandom(8).hex()})
+        for page in pages:
+            timed(s.get, base + page)
+    return took, s
+
+
+def _startup_steps(session, base):
+    text = session.get(base + "/admin/metrics", timeout=30).text
+    return {m[1]: float(m[2]) for m in re.finditer(r'startup_duration_seconds_sum\{step="(\w+)"\} (\S+)', text)}
+
+
+def run_once(setup, verify_url, jinja_dir):
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    tmp = tempfile.mkdtemp(prefix="bench-coldstart-")
+    env = dict(os.environ, WEB_CONCURRENCY="1", GUNICORN_BIND=f"127.0.0.1:{port}",
+               RECAPTCHA_SECRET_KEY="bench", RECAPTCHA_VERIFY_URL=verify_url,
+               PATIENT_DB_PATH=os.path.join(tmp, "patients.db"), METRICS_DIR="",
+               ASSET_CACHE_DIR=os.path.join(tmp, "assets"), ADMISSION_CONTROL="0",
+               WARM_UP="0" if setup == "none" else "1",
+               JINJA_CACHE_DIR="" if setup == "none" else jinja_dir)
+    if setup == "warm-up":
+        shutil.rmtree(jinja_dir, ignore_errors=True)
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "app:app"], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                requests.get(base + "/", timeout=30)
+                break
+            except requests.ConnectionError:
+                if proc.poll() is not None or time.perf_counter() - t0 > 60:
+                    raise SystemExit("gunicorn did not come up")
+                time.sleep(0.01)
+        ready = time.perf_counter() - t0
+        first, _ = _walk(base)
+        again, admin = _walk(base)
+        steps = _startup_steps(admin, base)
+    finally:
+        proc.terminate()
+        proc.wait()
+        shutil.rmtree(tmp)
+    return ready, sum(first), max(first), sum(again), steps
+
+
+def run(handshake, runs):
+    server, url = start_in_thread(handshake=handshake)
+    jinja_dir = tempfile.mkdtemp(prefix="bench-coldstart-jinja-")
+    try:
+        n = sum(3 + len(pages) for _, pages in WALKS.values())
+        print(f"one worker; {n} requests per walk; verifier handshake {handshake * 1000:.0f} ms")
+        print(f"{'setup':<16} {'ready':>9} {'first walk':>11} {'worst hit':>10} {'second walk':>12}   warm-up steps (ms)")
+        for setup in SETUPS:
+            rows = [run_once(setup, url, jinja_dir) for _ in range(runs)]
+            med = [statistics.median(r[i] for r in rows) * 1000 for i in range(4)]
+            steps = " ".join(f"{k} {statistics.median(r[4].get(k, 0) for r in rows) * 1000:.0f}"
+                             for k in rows[0][4])
+            print(f"{setup:<16} {med[0]:7.0f}ms {med[1]:9.0f}ms {med[2]:8.0f}ms {med[3]:10.0f}ms   {steps}")
+    finally:
+        server.shutdown()
+        shutil.rmtree(jinja_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--handshake", type=float, default=0.1)
+    ap.add_argument("--runs", type=int, default=3)
+    args = ap.parse_args()
+    run(args.handshake, args.runs)
@@ -0,0 +1,116 @@
+"""Dashboard aggregates: full scan of every record vs. store-maintained ones.
+
+    python bench/bench_dashboard.py [--sizes 1000,10000,100000] [--reps 20]
+
+Each size seeds one patient with N records spread over all kinds, then times
+computing the dashboard numbers (counts, next med, next 3 appointments and
+reminders, notes today, 5 recent files) both ways on each backend. The
+"scan" column is what /patient/dashboard used to do: load everything and
+count/sort in Python. Times are per dashboard, in milliseconds.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from itertools import islice
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("PATIENT_STORE", "memory")
+os.environ.setdefault("THUMBNAIL_WORKERS", "0")
+from app import PATIENT_DERIVED, _med_key  # noqa: E402
+from storage import MemoryStore, SQLiteStore  # noqa: E402
+
+
+def _seed(n):
+    rnd = random.Random(n)
+    now = datetime.now()
+    per = max(1, n // 7)
+
+    def dt(days):
+        return (now + timedelta(days=rnd.uniform(-days, days))).isoformat(timespec="minutes")
+    return {
+        "mood": "🙂 Calm",
+        "tasks": [{"id": str(uuid.uuid4()), "title": f"task {i}", "done": rnd.random() < .5} for i in range(per)],
+        "meds": [{"id": str(uuid.uuid4()), "name": f"med {i}", "time": f"{rnd.randrange(24):02d}:{rnd.randrange(60):02d}",
+                  "taken_today": rnd.random() < .5} for i in range(per)],
+        "notes": [{"id": str(uuid.uuid4()), "text": f"note {i}", "ts": dt(30)[:16].replace("T", " ")} for i in range(per)],
+        "appts": [{"id": str(uuid.uuid4()), "title": f"appt {i}", "dt": dt(365)} for i in range(per)],
+        "files": [{"id": str(uuid.uuid4()), "name": f"f{i}.pdf", "path": f"f{i}.pdf", "size": 1} for i in range(per)],
+        "reminders": [{"id": str(uuid.uuid4()), "title": f"rem {i}", "dt": dt(365), "kind": "family",
+                       "active": rnd.random() < .5} for i in range(per)],
+        "activities": [{"id": str(uuid.uuid4()), "title": f"act {i}", "done_today": rnd.random() < .5} for i in range(per)],
+    }
+
+
+def scan(store, username):
+    d = store.load(username)
+    now = datetime.now()
+    today_str = now.strftime("%Y-%m-%d")
+    stats = (sum(1 for t in d["tasks"] if t["done"]), len(d["tasks"]),
+             sum(1 for m in d["meds"] if m["taken_today"]), len(d["meds"]),
+             len(d["notes"]), len(d["appts"]), sum(1 for r in d["reminders"] if r.get("active")),
+             sum(1 for a in d["activities"] if a["done_today"]), len(d["activities"]),
+             sum(1 for x in d["notes"] if str(x.get("ts", "")).startswith(today_str)), len(d["files"]))
+    meds = sorted((m for m in d["meds"] if _med_key(m)), key=_med_key)
+    next_med = next((m for m in meds if _med_key(m) >= now.strftime("%H:%M:%S") and not m["taken_today"]), None)
+
+    def dt_key(x):
+        try:
+            return datetime.fromisoformat(x["dt"])
+        except Exception:
+            return datetime.max
+    appts = sorted(d["appts"], key=dt_key)[:3]
+    rems = sorted([r for r in d["reminders"] if r.get("active")], key=dt_key)[:3]
+    return stats, next_med, appts, rems, d["files"][:5]
+
+
+def incremental(store, username):
+    now = datetime.now()
+    today_str = now.strftime("%Y-%m-%d")
+    with store.transaction(username, readonly=True) as tx:
+        stats = (tx.count("tasks_done"), tx.count("tasks"), tx.count("meds_taken"), tx.count("meds"),
+                 tx.count("notes"), tx.count("appts"), tx.count("reminders_active"),
+                 tx.count("activities_done"), tx.count("activities"),
+                 tx.count_sorted("notes", today_str, today_str + "~"), tx.count("files"))
+        next_med = next((m for m in tx.iter_sorted("meds", now.strftime("%H:%M:%S")) if not m["taken_today"]), None)
+        appts = list(islice(tx.iter_sorted("appts"), 3))
+        rems = list(islice(tx.iter_sorted("reminders"), 3))
+        return stats, next_med, appts, rems, tx.head("files", 5)
+
+
+def _time(fn, reps):
+    samples = []
+    for _ in range(reps):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1e3)
+    return statistics.median(samples)
+
+
+def run(sizes, reps):
+    tmp = tempfile.mkdtemp(prefix="bench-dashboard-")
+    print(f"{'backend':<8} {'records':>8} {'scan ms':>10} {'incremental ms':>15} {'speedup':>8}")
+    for n in sizes:
+        doc = _seed(n)
+        for name, store in (("memory", MemoryStore(PATIENT_DERIVED)),
+                            ("sqlite", SQLiteStore(os.path.join(tmp, f"{n}.db"), PATIENT_DERIVED))):
+            store.create("u", doc)
+            a, b = scan(store, "u"), incremental(store, "u")
+            assert a[0] == b[0] and a[1] == b[1], "aggregates disagree"
+            assert [x["id"] for x in a[2]] == [x["id"] for x in b[2]], "appointments disagree"
+            t_scan = _time(lambda: scan(store, "u"), max(3, reps // 4) if n >= 100000 else reps)
+            t_inc = _time(lambda: incremental(store, "u"), reps)
+            print(f"{name:<8} {n:>8} {t_scan:>10.2f} {t_inc:>15.3f} {t_scan / t_inc:>7.0f}x")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--sizes", default="1000,10000,100000")
+    ap.add_argument("--reps", type=int, default=20)
+    args = ap.parse_args()
+    run([int(s) for s in args.sizes.split(",")], args.reps)
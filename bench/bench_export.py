@@ -0,0 +1,116 @@
+"""Bulk export/import: throughput, and export memory against patient count.
+
+    python bench/bench_export.py [--patients 1000,10000] [--notes 20] [--days 60] [--batch 200]
+
+Seeds a SQLite store with ``--patients`` patients, each with ``--notes``
+notes, a few tasks and ``--days`` days of mood history, then:
+
+- export: streams ``export_lines`` to a file (lines per second), then
+  again under tracemalloc for the peak Python heap, which should stay the
+  same from the smallest patient count to the largest;
+- import: reads that file into an empty store with ``import_lines``, once
+  one patient per write transaction (``--batch 1``, what a loop over
+  ``store.create`` would cost) and once ``--batch`` per transaction.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from records import new_id  # noqa: E402
+from storage import Derived, SQLiteStore  # noqa: E402
+from transfer import export_lines, import_lines  # noqa: E402
+
+DERIVED = Derived(sort_keys={"notes": lambda n: str(n.get("ts", ""))},
+                  search={"notes": lambda n: n.get("text")})
+START = datetime(2025, 1, 1, 9, tzinfo=timezone.utc)
+
+
+def _doc(i, notes):
+    return {"tz": "UTC", "caretaker": f"carer{i % 50}",
+            "tasks": [{"id": new_id(), "title": t, "done": False} for t in ("Morning walk", "Breakfast")],
+            "notes": [{"id": new_id(), "mood": "🙂 Calm", "ts": f"2025-01-{1 + n % 28:02d} 10:00",
+                       "text": f"walked in the garden, note {n} of patient {i}"} for n in range(notes)]}
+
+
+def seed(store, patients, notes, days):
+    whens = [START + timedelta(days=d, hours=h) for d in range(days) for h in (0, 8)]
+    values = [1 + (k % 5) for k in range(len(whens))]
+
+    def fill(username, tx):
+        tx.record_many("mood", whens, values)
+
+    for lo in range(0, patients, 500):
+        store.create_many([(f"patient{i:06d}", _doc(i, notes)) for i in range(lo, min(lo + 500, patients))], fill)
+
+
+def export(store, path):
+    t0 = time.perf_counter()
+    lines = 0
+    with open(path, "w", encoding="utf-8") as out:
+        for line in export_lines(store):
+            out.write(line)
+            lines += 1
+    return lines, time.perf_counter() - t0
+
+
+def export_peak(store):
+    """Peak heap of a second export pass (tracing slows it down, so it isn't timed)."""
+    tracemalloc.start()
+    for _ in export_lines(store):
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def import_(path, dest, batch):
+    t0 = time.perf_counter()
+    with open(path, "rb") as src:
+        created, _ = import_lines(SQLiteStore(dest, DERIVED), src, batch=batch)
+    return created, time.perf_counter() - t0
+
+
+def run(counts, notes, days, batch):
+    tmp = tempfile.mkdtemp(prefix="bench-export-")
+    try:
+        print(f"{'patients':>9} {'lines':>9} {'MB':>7} {'export':>9} {'lines/s':>9} {'peak heap':>10} "
+              f"{'import b=1':>11} {f'import b={batch}':>13} {'patients/s':>11}")
+        for n in counts:
+            store = SQLiteStore(os.path.join(tmp, f"src-{n}.db"), DERIVED)
+            seed(store, n, notes, days)
+            path = os.path.join(tmp, f"export-{n}.ndjson")
+            lines, took = export(store, path)
+            peak = export_peak(store)
+            mb = os.path.getsize(path) / 1e6
+            # one patient per transaction is slow: time it on at most 2000
+            small = os.path.join(tmp, f"small-{n}.ndjson")
+            with open(path, "rb") as src, open(small, "wb") as out:
+                seen = 0
+                for line in src:
+                    seen += line.startswith(b'{"patient"')
+                    if seen > 2000:
+                        break
+                    out.write(line)
+            made1, took1 = import_(small, os.path.join(tmp, f"one-{n}.db"), 1)
+            made, took_b = import_(path, os.path.join(tmp, f"dst-{n}.db"), batch)
+            assert made == n, (made, n)
+            print(f"{n:>9} {lines:>9} {mb:7.1f} {took:8.1f}s {lines / took:9.0f} {peak / 1e6:8.2f}MB "
+                  f"{made1 / took1:9.0f}/s {took_b:12.1f}s {made / took_b:11.0f}")
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--patients", default="1000,10000")
+    ap.add_argument("--notes", type=int, default=20)
+    ap.add_argument("--days", type=int, default=60)
+    ap.add_argument("--batch", type=int, default=200)
+    args = ap.parse_args()
+    run([int(s) for s in args.patients.split(",")], args.notes, args.days, args.batch)
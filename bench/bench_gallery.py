@@ -0,0 +1,116 @@
+"""Gallery listing and page latency: per-request directory scans vs. the catalog.
+
+    python bench/bench_gallery.py [--categories 100] [--per-category 100] [--requests 200]
+
+Builds a synthetic tree (default 10k images, every other one with an .mp4),
+then times list_categories() + list_images() and a full /patient/gallery
+render through the Flask test client, first with the old os.listdir/isfile
+helpers and then with the cached GalleryCatalog.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+os.environ.setdefault("RECAPTCHA_SECRET_KEY", "")
+os.environ.setdefault("ADMISSION_CONTROL", "0")
+os.environ.setdefault("PATIENT_STORE", "memory")
+
+import app as webapp  # noqa: E402
+from gallery import GalleryCatalog  # noqa: E402
+
+
+def build_tree(root, n_cats, per_cat):
+    for c in range(n_cats):
+        cat_dir = os.path.join(root, f"cat{c:03d}")
+        os.makedirs(cat_dir)
+        for i in range(per_cat):
+            open(os.path.join(cat_dir, f"img{i:04d}.png"), "wb").close()
+            if i % 2 == 0:
+                open(os.path.join(cat_dir, f"img{i:04d}.mp4"), "wb").close()
+
+
+def legacy_helpers(image_root):
+    """The helpers as they were before the catalog: a directory scan per call."""
+    def list_categories():
+        if not os.path.isdir(image_root):
+            return []
+        return sorted(
+            [d for d in os.listdir(image_root) if os.path.isdir(os.path.join(image_root, d))],
+            key=str.lower
+        )
+
+    def list_images(category):
+        cat_dir = os.path.join(image_root, category)
+        if not os.path.isdir(cat_dir):
+            return []
+        items = []
+        for f in os.listdir(cat_dir):
+            base, ext = os.path.splitext(f)
+            if ext.lower() in webapp.ALLOWED_IMAGE_EXTS:
+                audio_rel = None
+                for aext in webapp.AUDIO_EXTS_PREFERENCE:
+                    if os.path.isfile(os.path.join(cat_dir, base + aext)):
+                        audio_rel = f"customer_images/{category}/{base}{aext}"
+                        break
+                items.append({"img": f"customer_images/{category}/{f}", "audio": audio_rel, "name": f})
+        return sorted(items, key=lambda x: x["name"].lower())
+
+    return list_categories, list_images
+
+
+def _p(samples, q):
+    return sorted(samples)[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def _report(label, samples):
+    print(f"  {label:<28} p50 {statistics.median(samples):8.2f} ms   p95 {_p(samples, 0.95):8.2f} ms")
+
+
+def run(n_cats, per_cat, n_requests):
+    root = tempfile.mkdtemp(prefix="bench-gallery-")
+    build_tree(root, n_cats, per_cat)
+    cats = [f"cat{c:03d}" for c in range(n_cats)]
+    picks = [random.choice(cats) for _ in range(n_requests)]
+    print(f"{n_cats} categories x {per_cat} images = {n_cats * per_cat} images, {n_requests} requests")
+
+    legacy = legacy_helpers(root)
+    catalog = GalleryCatalog(root, webapp.ALLOWED_IMAGE_EXTS, webapp.AUDIO_EXTS_PREFERENCE)
+    t0 = time.perf_counter()
+    catalog.refresh()
+    print(f"  catalog build: {(time.perf_counter() - t0) * 1000:.1f} ms")
+
+    client = webapp.app.test_client()
+    client.post("/login", data={"username": "patient", "password": "pass123"})
+
+    for label, (list_categories, list_images) in (
+            ("per-request scan", legacy),
+            ("catalog", (catalog.categories, catalog.images))):
+        webapp.list_categories, webapp.list_images = list_categories, list_images
+        helper, page = [], []
+        for cat in picks:
+            t0 = time.perf_counter()
+            list_categories()
+            list_images(cat)
+            helper.append((time.perf_counter() - t0) * 1000)
+            t0 = time.perf_counter()
+            r = client.get("/patient/gallery", query_string={"category": cat})
+            page.append((time.perf_counter() - t0) * 1000)
+            assert r.status_code == 200
+        print(label)
+        _report("list helpers", helper)
+        _report("/patient/gallery page", page)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--categories", type=int, default=100)
+    ap.add_argument("--per-category", type=int, default=100)
+    ap.add_argument("--requests", type=int, default=200)
+    args = ap.parse_args()
+    run(args.categories, args.per_category, args.requests)
@@ -0,0 +1,78 @@
+"""Sparkline reads from rollups vs. aggregating the raw events.
+
+    python bench/bench_history.py [--years 1,5] [--per-day 20] [--reps 50]
+
+Each run backfills one patient with ``--per-day`` mood events a day for the
+given number of years (grouped with NumPy if installed), then times a
+7-day, 30-day and 1-year sparkline read from the rollups against averaging
+the raw events for the same window. Times are per sparkline, in ms.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import history  # noqa: E402
+from storage import MemoryStore, SQLiteStore  # noqa: E402
+
+
+def raw_sparkline(tx, range_key, today):
+    period, first, count = history.window(range_key, today)
+    if period == history.DAY:
+        first_day, bucket_of = first, lambda d: d
+    else:
+        first_day, bucket_of = first * 7 + 1, history.week_of
+    sums = {}
+    for ts, v in tx.events("mood", first_day, history.day_of(today)):
+        b = bucket_of(datetime.fromtimestamp(ts).toordinal())
+        n, total = sums.get(b, (0, 0.0))
+        sums[b] = (n + 1, total + v)
+    return [round(sums[b][1] / sums[b][0], 1) if b in sums else None for b in range(first, first + count)]
+
+
+def _time(fn, reps):
+    samples = []
+    for _ in range(reps):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1e3)
+    return statistics.median(samples)
+
+
+def run(years, per_day, reps):
+    tmp = tempfile.mkdtemp(prefix="bench-history-")
+    today = datetime.now()
+    print(f"numpy: {'yes' if history.np is not None else 'no'}")
+    print(f"{'backend':<8} {'events':>8} {'backfill s':>10} {'range':>6} {'raw ms':>9} {'rollup ms':>10}")
+    for y in years:
+        rnd = random.Random(y)
+        days = 365 * y
+        whens = [today - timedelta(days=days) + timedelta(seconds=rnd.uniform(0, days * 86400))
+                 for _ in range(days * per_day)]
+        vals = [rnd.randint(1, 5) for _ in whens]
+        for name, store in (("memory", MemoryStore()),
+                            ("sqlite", SQLiteStore(os.path.join(tmp, f"{y}.db")))):
+            store.create("u", {})
+            t0 = time.perf_counter()
+            with store.transaction("u") as tx:
+                tx.record_many("mood", whens, vals)
+            backfill = time.perf_counter() - t0
+            with store.transaction("u", readonly=True) as tx:
+                for key in history.RANGES:
+                    t_raw = _time(lambda: raw_sparkline(tx, key, today), max(3, reps // 10))
+                    t_roll = _time(lambda: history.sparkline(tx, "mood", "mean", key, today, 3), reps)
+                    print(f"{name:<8} {len(whens):>8} {backfill:>10.2f} {key:>6} {t_raw:>9.2f} {t_roll:>10.3f}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--years", default="1,5")
+    ap.add_argument("--per-day", type=int, default=20)
+    ap.add_argument("--reps", type=int, default=50)
+    args = ap.parse_args()
+    run([int(y) for y in args.years.split(",")], args.per_day, args.reps)
@@ -0,0 +1,63 @@
+"""Cost of the request instrumentation (metrics.py).
+
+    python bench/bench_metrics.py [--requests 2000]
+
+Times a bare Histogram.observe / Counter.inc, then GET / (a small public
+page) and GET /login through the Flask test client with the metric hooks
+installed and with them removed. Times are per call / per request, in µs.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("PATIENT_STORE", "memory")
+os.environ.setdefault("THUMBNAIL_WORKERS", "0")
+os.environ.setdefault("METRICS_DIR", tempfile.mkdtemp(prefix="bench-metrics-"))
+import app as webapp  # noqa: E402
+from metrics import Registry  # noqa: E402
+
+
+def _per_call(fn, n):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def _requests(client, path, n, rounds=5):
+    return statistics.median(_per_call(lambda: client.get(path), n // rounds) for _ in range(rounds))
+
+
+def run(n):
+    reg = Registry()
+    h = reg.histogram("h", "bench", ("endpoint",))
+    c = reg.counter("c", "bench", ("endpoint",))
+    print(f"Histogram.observe: {_per_call(lambda: h.observe(0.004, 'landing'), 200000):.2f} µs")
+    print(f"Counter.inc:       {_per_call(lambda: c.inc('landing', amount=512), 200000):.2f} µs")
+
+    app = webapp.app
+    client = app.test_client()
+    hooks = (webapp._start_timer, webapp._observe_request)
+    print(f"{'path':<8} {'with µs':>9} {'without µs':>11} {'overhead µs':>12}")
+    for path in ("/", "/login"):
+        client.get(path)
+        with_hooks = _requests(client, path, n)
+        app.before_request_funcs[None].remove(hooks[0])
+        app.after_request_funcs[None].remove(hooks[1])
+        try:
+            without = _requests(client, path, n)
+        finally:
+            app.before_request_funcs[None].append(hooks[0])
+            app.after_request_funcs[None].append(hooks[1])
+        print(f"{path:<8} {with_hooks:>9.1f} {without:>11.1f} {with_hooks - without:>12.1f}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--requests", type=int, default=2000)
+    args = ap.parse_args()
+    run(args.requests)
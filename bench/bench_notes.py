@@ -0,0 +1,92 @@
+"""Notes page: full load + template slicing vs. cursor pages and the search index.
+
+    python bench/bench_notes.py [--sizes 100,10000,100000] [--page 20] [--reps 50]
+
+Seeds one patient with N notes on each backend and times, per request:
+
+- load: what the notes page used to do (``load()`` every note, render all);
+- page: the first page and a page deep in the list (``tx.page``);
+- search: a rare word, two common words, two common words that never
+  appear together (the worst case: every posting is checked) and a word
+  prefix (``tx.search``).
+
+Latencies are medians over ``--reps``, in milliseconds.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from records import new_id  # noqa: E402
+from storage import Derived, MemoryStore, SQLiteStore  # noqa: E402
+
+DERIVED = Derived(sort_keys={"notes": lambda n: str(n.get("ts", ""))},
+                  search={"notes": lambda n: n.get("text")})
+WORDS = ("walked", "garden", "lunch", "daughter", "called", "slept", "well", "tired", "music", "park")
+
+
+def _notes(n):
+    return [{"id": new_id(), "mood": "🙂 Calm", "ts": f"2025-{1 + i % 12:02d}-{1 + i % 28:02d} 10:{i % 60:02d}",
+             "text": " ".join(WORDS[(i * k) % len(WORDS)] for k in (1, 3, 7)) + (" piano" if i % 1000 == 0 else "")}
+            for i in range(n)]
+
+
+def _median_ms(fn, reps):
+    samples = []
+    for _ in range(reps):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def _deep_cursor(store, n, size):
+    cursor = None
+    with store.transaction("p", readonly=True) as tx:
+        for _ in range(min(n // size // 2, 50)):
+            _, cursor = tx.page("notes", size, cursor)
+    return cursor
+
+
+def run(sizes, size, reps):
+    tmp = tempfile.mkdtemp(prefix="bench-notes-")
+    try:
+        print(f"{'backend':<8} {'notes':>7} {'load':>8} {'page 1':>8} {'deep':>8} "
+              f"{'rare':>8} {'common':>8} {'miss':>8} {'prefix':>8}")
+        for n in sizes:
+            notes = _notes(n)
+            stores = {"memory": MemoryStore(DERIVED),
+                      "sqlite": SQLiteStore(os.path.join(tmp, f"notes-{n}.db"), DERIVED)}
+            for label, store in stores.items():
+                store.create("p", {"notes": notes})
+                deep = _deep_cursor(store, n, size)
+
+                def read(fn):
+                    def go():
+                        with store.transaction("p", readonly=True) as tx:
+                            fn(tx)
+                    return _median_ms(go, reps)
+
+                row = [_median_ms(lambda: store.load("p")["notes"][-size:], reps),
+                       read(lambda tx: tx.page("notes", size)),
+                       read(lambda tx: tx.page("notes", size, deep)),
+                       read(lambda tx: tx.search("notes", "piano", size)),
+                       read(lambda tx: tx.search("notes", "called well", size)),
+                       read(lambda tx: tx.search("notes", "garden lunch", size)),
+                       read(lambda tx: tx.search("notes", "daugh", size))]
+                print(f"{label:<8} {n:>7} " + " ".join(f"{ms:8.2f}" for ms in row))
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--sizes", default="100,10000,100000")
+    ap.add_argument("--page", type=int, default=20)
+    ap.add_argument("--reps", type=int, default=50)
+    args = ap.parse_args()
+    run([int(s) for s in args.sizes.split(",")], args.page, args.reps)
@@ -0,0 +1,57 @@
+"""Public and gallery pages: rendering every time vs. the page cache.
+
+    python bench/bench_pagecache.py [--requests 500]
+
+Times GET /, /login and /patient/gallery through the Flask test client with
+PAGE_CACHE off, on (gzip body from memory) and on with the client's ETag
+(304, no body). Times are per request, in µs; bytes are per response.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("PATIENT_STORE", "memory")
+os.environ.setdefault("THUMBNAIL_WORKERS", "0")
+os.environ.setdefault("RECAPTCHA_SECRET_KEY", "")
+os.environ.setdefault("ADMISSION_CONTROL", "0")
+os.environ.setdefault("METRICS_DIR", "")
+import app as webapp  # noqa: E402
+
+
+def _median_us(fn, n, rounds=5):
+    out = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        for _ in range(n // rounds):
+            fn()
+        out.append((time.perf_counter() - t0) / (n // rounds) * 1e6)
+    return statistics.median(out)
+
+
+def run(n):
+    client = webapp.app.test_client()
+    client.post("/login", data={"username": "patient", "password": "pass123"})
+    gz = {"Accept-Encoding": "gzip, br"}
+    print(f"{'path':<18} {'render µs':>10} {'cached µs':>10} {'304 µs':>8} {'bytes':>8} {'gzip':>7}")
+    for path in ("/", "/login", "/patient/gallery"):
+        webapp.PAGE_CACHE_ENABLED = False
+        plain = client.get(path)
+        render = _median_us(lambda: client.get(path), n)
+        webapp.PAGE_CACHE_ENABLED = True
+        cached_rv = client.get(path, headers=gz)
+        cached = _median_us(lambda: client.get(path, headers=gz), n)
+        inm = dict(gz, **{"If-None-Match": cached_rv.headers["ETag"]})
+        assert client.get(path, headers=inm).status_code == 304
+        not_modified = _median_us(lambda: client.get(path, headers=inm), n)
+        print(f"{path:<18} {render:>10.1f} {cached:>10.1f} {not_modified:>8.1f} "
+              f"{len(plain.data):>8} {len(cached_rv.data):>7}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--requests", type=int, default=500)
+    args = ap.parse_args()
+    run(args.requests)
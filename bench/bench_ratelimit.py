@@ -0,0 +1,87 @@
+"""Cost of admission control: token takes, refusals and a one-client burst.
+
+    python bench/bench_ratelimit.py [--burst 2000] [--n 2000]
+
+Times RateLimiter.hit on each store, in microseconds per call: an allowed
+take, and a refused one, which this worker answers from its own "blocked
+until" table without touching the store.
+
+Then one client bursts ``--burst`` logins from one address through the
+Flask test client. Reports how many got through, what an admitted login
+and a 429 cost next to a cached page, and whether a login from another
+address, made during the burst, still succeeds.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("RECAPTCHA_SECRET_KEY", "")
+os.environ.setdefault("PATIENT_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="bench-ratelimit-"), "patients.db"))
+os.environ.setdefault("METRICS_DIR", "")
+os.environ.setdefault("THUMBNAIL_WORKERS", "0")
+import app as webapp  # noqa: E402
+from ratelimit import RateLimiter  # noqa: E402
+from storage import MemoryStore, SQLiteStore  # noqa: E402
+
+
+def _per_call_us(fn, n):
+    t0 = time.perf_counter()
+    for i in range(n):
+        fn(i)
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def limiter_costs(n):
+    stores = {"memory": MemoryStore(),
+              "sqlite": SQLiteStore(os.path.join(tempfile.mkdtemp(prefix="bench-ratelimit-"), "b.db"))}
+    for label, store in stores.items():
+        limiter = RateLimiter(store)
+        allowed = _per_call_us(lambda i: limiter.hit(f"k{i}", 1.0, 10), n)
+        limiter.hit("hot", 1 / 3600, 1)
+        refused = _per_call_us(lambda i: limiter.hit("hot", 1 / 3600, 1), n)
+        print(f"hit {label:<7} allowed {allowed:8.1f} µs   refused {refused:6.2f} µs")
+
+
+def _login(client, ip, user="caretaker", password="guest"):
+    return client.post("/login", data={"username": user, "password": password},
+                       environ_base={"REMOTE_ADDR": ip}).status_code
+
+
+def _median_us(samples):
+    return statistics.median(samples) * 1e6
+
+
+def burst(count):
+    client = webapp.app.test_client()
+    client.get("/")
+    landing = []
+    for _ in range(200):
+        t0 = time.perf_counter()
+        client.get("/")
+        landing.append(time.perf_counter() - t0)
+    codes, took, other = {}, {200: [], 302: [], 429: []}, None
+    for i in range(count):
+        t0 = time.perf_counter()
+        code = _login(client, "192.0.2.1", user=f"burst{i}")
+        took.setdefault(code, []).append(time.perf_counter() - t0)
+        codes[code] = codes.get(code, 0) + 1
+        if i == count // 2:
+            other = _login(client, "198.51.100.7")
+    print(f"burst of {count} logins from one address: {codes}")
+    print(f"  admitted login p50 {_median_us(took[302]):8.1f} µs")
+    print(f"  refused (429)  p50 {_median_us(took[429]):8.1f} µs")
+    print(f"  GET / (cached) p50 {_median_us(landing):8.1f} µs   (test client floor)")
+    print(f"  login from another address during the burst: {other}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--burst", type=int, default=2000)
+    ap.add_argument("--n", type=int, default=2000)
+    args = ap.parse_args()
+    limiter_costs(args.n)
+    burst(args.burst)
@@ -0,0 +1,72 @@
+"""reCAPTCHA verification cost: one-off requests.post vs. the pooled verifier.
+
+    python bench/bench_recaptcha.py [--calls 300] [--delay 0.002]
+
+Runs against bench/stub_recaptcha.py (plain HTTP, so this understates the
+TLS handshake the pool also saves in production). Then takes the stub
+down and shows the breaker cutting login latency once it opens.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import uuid
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from recaptcha import RecaptchaVerifier  # noqa: E402
+from stub_recaptcha import start_in_thread  # noqa: E402
+
+
+def legacy_verify(url, token):
+    try:
+        r = requests.post(url, data={"secret": "s", "response": token}, timeout=5)
+        return bool(r.json().get("success"))
+    except Exception:
+        return False
+
+
+def _timed(fn, n):
+    samples = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn(uuid.uuid4().hex)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def _line(label, samples):
+    samples = sorted(samples)
+    print(f"  {label:<34} p50 {statistics.median(samples):7.2f} ms  "
+          f"p95 {samples[int(0.95 * (len(samples) - 1))]:7.2f} ms")
+
+
+def run(calls, delay):
+    server, url = start_in_thread(delay=delay)
+    print(f"stub at {url}, delay {delay * 1000:.1f} ms, {calls} calls")
+    _line("requests.post per call", _timed(lambda t: legacy_verify(url, t), calls))
+    verifier = RecaptchaVerifier("s", url=url)
+    _line("pooled session", _timed(verifier.verify, calls))
+    token = uuid.uuid4().hex
+    verifier.verify(token)
+    _line("replayed token (refused locally)", _timed(lambda _t: verifier.verify(token), calls))
+
+    # Outage: a port nothing listens on behaves like a dead verifier; a
+    # black-holed one would cost the full timeout per call before the breaker.
+    server.shutdown()
+    server.server_close()
+    verifier = RecaptchaVerifier("s", url=url, failure_threshold=5, reset_after=60)
+    samples = _timed(verifier.verify, 50)
+    print(f"verifier down: breaker state after 50 logins = {verifier.breaker.state}")
+    _line("first 5 (breaker closed)", samples[:5])
+    _line("remaining 45 (breaker open)", samples[5:])
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--calls", type=int, default=300)
+    ap.add_argument("--delay", type=float, default=0.002)
+    args = ap.parse_args()
+    run(args.calls, args.delay)
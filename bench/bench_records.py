@@ -0,0 +1,141 @@
+"""Memory per patient: dict records with uuid ids vs. compact records.
+
+    python bench/bench_records.py [--patients 100000]
+
+Seeds every patient with the same small chart (3 tasks, 2 meds, 3 notes, an
+appointment, 2 reminders, 2 activities) and measures with tracemalloc the
+bytes the memory store holds per patient:
+
+- before: the previous layout, rebuilt here: id -> [seq, dict] with
+  ``str(uuid4())`` ids, plus the same counters and sort indexes;
+- after: MemoryStore as it is now (records.py: slots, 16-byte ids).
+
+Then renders one patient's pages 1000 times through the store's read API
+and checks that the store did not grow.
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from records import new_id  # noqa: E402
+from storage import KINDS, Derived, MemoryStore, _oldest_first, _record_id, flag  # noqa: E402
+
+DERIVED = Derived(
+    counters={
+        "tasks_done": ("tasks", flag("done")),
+        "meds_taken": ("meds", lambda r: r.get("taken_day") if r.get("taken_today") else None),
+        "reminders_active": ("reminders", flag("active")),
+    },
+    sort_keys={
+        "meds": lambda r: r.get("time"),
+        "appts": lambda r: r.get("dt"),
+        "reminders": lambda r: r.get("dt") if r.get("active") else None,
+        "notes": lambda r: r.get("ts"),
+    },
+)
+MOODS = ("😀 Cheerful", "🙂 Calm", "😐 Okay")
+
+
+def chart(i, make_id):
+    day = datetime(2025, 1, 1) + timedelta(days=i % 365)
+    stamp = lambda h: (day + timedelta(hours=h)).isoformat(timespec="minutes")
+    return {
+        "mood": MOODS[i % 3],
+        "caretaker": f"caretaker{i % 500}",
+        "tasks": [{"id": make_id(), "title": t, "done": i % 2 == 0}
+                  for t in ("Morning walk", "Breakfast", f"Call family #{i}")],
+        "meds": [{"id": make_id(), "name": n, "time": t, "taken_today": True, "taken_day": day.date().isoformat()}
+                 for n, t in (("Vitamin B12", "09:00"), ("Donepezil", "21:00"))],
+        "notes": [{"id": make_id(), "mood": MOODS[(i + k) % 3], "text": f"note {k} for patient {i}",
+                   "ts": stamp(k).replace("T", " ")} for k in range(3)],
+        "appts": [{"id": make_id(), "title": "GP check-up", "dt": stamp(30)}],
+        "files": [],
+        "reminders": [{"id": make_id(), "title": f"Reminder {k}", "dt": stamp(40 + k), "kind": "family",
+                       "active": True} for k in range(2)],
+        "activities": [{"id": make_id(), "title": t, "done_today": False}
+                       for t in ("Listen to favorite song", "5-min breathing")],
+    }
+
+
+def legacy_doc(doc):
+    """What MemoryStore.create kept per patient before records.py."""
+    kinds, counts, index, seq = {}, {}, {}, 0
+    for kind in KINDS:
+        kinds[kind], index[kind] = {}, []
+        for rec in _oldest_first(kind, doc.get(kind, [])):
+            seq += 1
+            rid = _record_id(rec)
+            kinds[kind][rid] = [seq, dict(rec)]
+            DERIVED.count_changes(counts, kind, None, rec)
+            key = DERIVED.sort_key(kind, rec)
+            if key is not None:
+                index[kind].append((key, seq, rid))
+        index[kind].sort()
+    return {"fields": {k: v for k, v in doc.items() if k not in KINDS}, "kinds": kinds,
+            "counters": counts, "sorted": index, "history": {}, "seq": seq, "version": 1}
+
+
+def measure(label, n, build):
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    t0 = time.perf_counter()
+    held = build(n)
+    secs = time.perf_counter() - t0
+    used = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    print(f"{label:<8} {used / n:10.0f} B/patient   {used / 2**20:8.1f} MiB total   ({secs:.1f} s)")
+    return held, used / n
+
+
+def build_legacy(n):
+    return {f"p{i}": legacy_doc(chart(i, lambda: str(uuid.uuid4()))) for i in range(n)}
+
+
+def build_compact(n):
+    store = MemoryStore(DERIVED)
+    for i in range(n):
+        store.create(f"p{i}", chart(i, new_id))
+    return store
+
+
+def _view(store):
+    data = store.load("p0")
+    for r in data["reminders"]:
+        r["dt_pretty"] = r["dt"]  # what the pages used to do to loaded records
+    with store.transaction("p0", readonly=True) as tx:
+        list(tx.iter_sorted("reminders"))
+        tx.head("notes", 5)
+
+
+def page_views(store, views=1000):
+    """Read paths the patient pages use; the store must not grow."""
+    _view(store)  # first-call allocations (code caches) aren't growth
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for _ in range(views):
+        _view(store)
+    gc.collect()  # context-manager frames are freed in cycles
+    grown = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f"{views} page views: store grew by {grown} bytes")
+
+
+def run(patients):
+    legacy, before = measure("before", patients, build_legacy)
+    del legacy
+    store, after = measure("after", patients, build_compact)
+    print(f"saved    {before - after:10.0f} B/patient   ({100 * (1 - after / before):.0f}%)")
+    page_views(store)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--patients", type=int, default=100000)
+    args = ap.parse_args()
+    run(args.patients)
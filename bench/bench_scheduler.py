@@ -0,0 +1,46 @@
+"""Scheduler tick cost vs. number of tracked reminders.
+
+    python bench/bench_scheduler.py [--tracked 1000,100000,1000000] [--due 10]
+
+Fills a DueQueue with N future entries, then times ticks that each find
+``--due`` entries due, next to a naive scan over every entry. Times are per
+tick, in microseconds; the heap's should stay flat as N grows.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from scheduler import DueQueue  # noqa: E402
+
+
+def run(sizes, due_per_tick, ticks=200):
+    print(f"{'tracked':>9} {'heap tick µs':>13} {'scan tick µs':>13}")
+    for n in sizes:
+        rnd = random.Random(n)
+        q = DueQueue()
+        dues = {}
+        for i in range(n):
+            d = rnd.uniform(0, n / due_per_tick)
+            q.schedule(("patient", "reminders", i), d)
+            dues[i] = d
+        heap, scan = [], []
+        for t in range(1, ticks + 1):
+            t0 = time.perf_counter()
+            q.pop_due(t)
+            heap.append((time.perf_counter() - t0) * 1e6)
+            t0 = time.perf_counter()
+            [k for k, d in dues.items() if t - 1 < d <= t]
+            scan.append((time.perf_counter() - t0) * 1e6)
+        print(f"{n:>9} {statistics.median(heap):>13.1f} {statistics.median(scan):>13.1f}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--tracked", default="1000,100000,1000000")
+    ap.add_argument("--due", type=int, default=10)
+    args = ap.parse_args()
+    run([int(s) for s in args.tracked.split(",")], args.due)
@@ -0,0 +1,78 @@
+"""Toggle/delete latency: legacy list scans vs. the indexed store backends.
+
+    python bench/bench_storage.py [--sizes 10,1000,100000] [--ops 200]
+
+Each size seeds one patient with N tasks, then times ``--ops`` toggles and
+deletes of random records. Latencies are per operation, in microseconds.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from storage import MemoryStore, SQLiteStore  # noqa: E402
+
+
+class LegacyStore:
+    """The pre-store behaviour: a list per kind, scanned on every action."""
+
+    def __init__(self):
+        self.db = {}
+
+    def create(self, username, doc):
+        self.db[username] = {k: list(v) if isinstance(v, list) else v for k, v in doc.items()}
+
+    def toggle(self, username, kind, rid, field):
+        for t in self.db[username][kind]:
+            if t["id"] == rid:
+                t[field] = not t[field]
+                break
+
+    def delete(self, username, kind, rid):
+        self.db[username][kind] = [t for t in self.db[username][kind] if t["id"] != rid]
+
+
+def _seed(n):
+    return {"mood": "🙂 Calm",
+            "tasks": [{"id": str(uuid.uuid4()), "title": f"task {i}", "done": False} for i in range(n)]}
+
+
+def _time_ops(fn, ids):
+    samples = []
+    for rid in ids:
+        t0 = time.perf_counter()
+        fn(rid)
+        samples.append((time.perf_counter() - t0) * 1e6)
+    return statistics.median(samples), max(samples)
+
+
+def run(sizes, ops):
+    tmp = tempfile.mkdtemp(prefix="bench-storage-")
+    print(f"{'backend':<8} {'records':>8} {'toggle p50 µs':>14} {'delete p50 µs':>14}")
+    for n in sizes:
+        doc = _seed(n)
+        ids = [t["id"] for t in doc["tasks"]]
+        sample = random.sample(ids, min(ops, n))
+        backends = {
+            "legacy": LegacyStore(),
+            "memory": MemoryStore(),
+            "sqlite": SQLiteStore(os.path.join(tmp, f"bench-{n}.db")),
+        }
+        for name, store in backends.items():
+            store.create("p", doc)
+            toggle_p50, _ = _time_ops(lambda rid: store.toggle("p", "tasks", rid, "done"), sample)
+            delete_p50, _ = _time_ops(lambda rid: store.delete("p", "tasks", rid), sample)
+            print(f"{name:<8} {n:>8} {toggle_p50:>14.1f} {delete_p50:>14.1f}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--sizes", default="10,1000,100000")
+    ap.add_argument("--ops", type=int, default=200)
+    args = ap.parse_args()
+    run([int(s) for s in args.sizes.split(",")], args.ops)
@@ -0,0 +1,107 @@
+"""Read-your-writes across gunicorn workers.
+
+    python bench/loadtest_workers.py [--workers 8] [--clients 16] [--writes 25]
+
+Starts gunicorn with ``--workers`` sync workers on a fresh SQLite store,
+logs ``--clients`` concurrent sessions in as the demo patient, and has each
+add ``--writes`` medications. After every add the client immediately reloads
+/patient/meds (served by whichever worker picks it up) and checks the new
+med is listed. At the end every one of the clients*writes meds must still be
+there, i.e. no write was lost to a concurrent one. Exits non-zero on any failure.
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_up(base, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(base + "/", timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise SystemExit("gunicorn did not come up")
+
+
+def _login(base):
+    s = requests.Session()
+    r = s.post(base + "/login", data={"username": "patient", "password": "pass123"},
+               allow_redirects=False, timeout=10)
+    r.raise_for_status()
+    return s
+
+
+def _client(base, cid, writes, failures, latencies):
+    s = _login(base)
+    for i in range(writes):
+        title = f"rw-{cid:03d}-{i:04d}"
+        t0 = time.perf_counter()
+        s.post(base + "/patient/action", data={"action": "add_med", "med_name": title, "med_time": "09:00"},
+               allow_redirects=False, timeout=10)
+        page = s.get(base + "/patient/meds", timeout=10).text
+        latencies.append(time.perf_counter() - t0)
+        if title not in page:
+            failures.append(title)
+
+
+def run(workers, clients, writes):
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    env = dict(os.environ,
+               PATIENT_STORE="sqlite",
+               PATIENT_DB_PATH=os.path.join(tempfile.mkdtemp(prefix="loadtest-"), "patients.db"),
+               RECAPTCHA_SECRET_KEY="", ADMISSION_CONTROL="0")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-w", str(workers), "-b", f"127.0.0.1:{port}", "app:app"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_up(base)
+        _login(base)  # create the patient once so clients don't race on the seed
+        failures, latencies = [], []
+        threads = [threading.Thread(target=_client, args=(base, c, writes, failures, latencies))
+                   for c in range(clients)]
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - t0
+
+        page = _login(base).get(base + "/patient/meds", timeout=10).text
+        found = sum(1 for c in range(clients) for i in range(writes) if f"rw-{c:03d}-{i:04d}" in page)
+        latencies.sort()
+        print(f"workers={workers} clients={clients} writes/client={writes}")
+        print(f"  write+read pairs: {len(latencies)} in {elapsed:.2f}s "
+              f"({len(latencies) / elapsed:.0f}/s), p50 {latencies[len(latencies) // 2] * 1000:.1f} ms")
+        print(f"  stale reads: {len(failures)}")
+        print(f"  meds present at end: {found}/{clients * writes}")
+        return not failures and found == clients * writes
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--workers", type=int, default=8)
+    ap.add_argument("--clients", type=int, default=16)
+    ap.add_argument("--writes", type=int, default=25)
+    args = ap.parse_args()
+    sys.exit(0 if run(args.workers, args.clients, args.writes) else 1)
@@ -0,0 +1,76 @@
+"""Local stand-in for Google's siteverify endpoint.
+
+    python bench/stub_recaptcha.py [--port 8765] [--delay 0.05] [--fail-rate 0] [--handshake 0]
+
+Answers POSTs with {"success": true} after ``--delay`` seconds; a
+``--fail-rate`` fraction of requests get a 503 instead. Each new
+connection first waits ``--handshake`` seconds, standing in for TLS setup. Run the app with
+RECAPTCHA_VERIFY_URL=http://127.0.0.1:8765/ to load-test /login.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_server(port=0, delay=0.0, fail_rate=0.0, handshake=0.0):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real endpoint
+        disable_nagle_algorithm = True  # headers and body go out in separate writes
+
+        def setup(self):
+            super().setup()
+            if server.handshake:  # stands in for the TLS handshake on a new connection
+                time.sleep(server.handshake)
+
+        def do_HEAD(self):
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if server.delay:
+                time.sleep(server.delay)
+            if random.random() < server.fail_rate:
+                status, body = 503, b"{}"
+            else:
+                status, body = 200, json.dumps({"success": True}).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            server.hits += 1
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        request_queue_size = 1024  # the default 5 refuses bursts of concurrent logins
+
+    server = Server(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    server.delay, server.fail_rate, server.handshake, server.hits = delay, fail_rate, handshake, 0
+    return server
+
+
+def start_in_thread(**kwargs):
+    """Start a stub on a free port; returns (server, url)."""
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--delay", type=float, default=0.05)
+    ap.add_argument("--fail-rate", type=float, default=0.0)
+    ap.add_argument("--handshake", type=float, default=0.0)
+    args = ap.parse_args()
+    srv = make_server(args.port, args.delay, args.fail_rate, args.handshake)
+    print(f"stub siteverify on http://127.0.0.1:{args.port}/")
+    srv.serve_forever()
@@ -0,0 +1,390 @@
+"""Benchmark suite: every route, through the Flask test client or real gunicorn.
+
+    python bench/suite.py [--target client,gunicorn] [--scale small,large]
+                          [--requests 200] [--concurrency 8] [--workers 4]
+                          [--out results.json] [--compare old.json]
+
+For each scale a fresh SQLite store is seeded (one patient per client with
+``notes`` notes and ``reminders`` reminders, plus ``patients`` more patients
+for the caretaker page) next to a synthetic gallery of ``images`` images,
+and reCAPTCHA goes to bench/stub_recaptcha.py. Then each case (pages,
+/login, every /patient/action action, a /patient/actions batch, uploads)
+gets ``--requests`` requests: one after the other through the test client,
+or spread over ``--concurrency`` clients against ``--workers`` gunicorn
+workers (bench/suite_wsgi.py).
+
+Prints throughput and p50/p95/p99 latency per case. ``--out`` saves them
+as JSON (with the git commit), and ``--compare`` prints the change against
+a saved run, exiting non-zero if a p95 got more than ``--threshold`` worse.
+Uploads land in static/uploads (a few distinct files, deduplicated).
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+sys.path.insert(0, HERE)
+os.environ.setdefault("THUMBNAIL_WORKERS", "0")
+os.environ.setdefault("METRICS_DIR", "")
+os.environ.setdefault("ADMISSION_CONTROL", "0")
+import suite_wsgi  # noqa: E402
+from stub_recaptcha import start_in_thread  # noqa: E402
+from storage import SQLiteStore  # noqa: E402
+
+webapp = suite_wsgi.webapp
+
+SCALES = {
+    "small": {"notes": 50, "reminders": 20, "images": 200, "patients": 20},
+    "large": {"notes": 5000, "reminders": 2000, "images": 10000, "patients": 2000},
+}
+IMAGES_PER_CATEGORY = 100
+UPLOAD_VARIANTS = 8
+
+
+# ----------------- data -----------------
+def _pool(kind, n):
+    now = datetime.now()
+    if kind == "tasks":
+        return [{"id": str(uuid.uuid4()), "title": f"task {i}", "done": False} for i in range(n)]
+    if kind == "meds":
+        return [{"id": str(uuid.uuid4()), "name": f"med {i}", "time": f"{i % 24:02d}:30", "taken_today": False}
+                for i in range(n)]
+    if kind == "activities":
+        return [{"id": str(uuid.uuid4()), "title": f"activity {i}", "done_today": False} for i in range(n)]
+    if kind == "appts":
+        return [{"id": str(uuid.uuid4()), "title": f"appt {i}",
+                 "dt": (now + timedelta(hours=i)).isoformat(timespec="minutes")} for i in range(n)]
+    if kind == "files":  # no blob behind them: deleting one removes nothing
+        return [{"id": str(uuid.uuid4()), "name": f"bench-missing-{uuid.uuid4().hex}.pdf", "size": 0}
+                for _ in range(n)]
+    if kind == "notes":
+        return [{"id": str(uuid.uuid4()), "mood": "🙂 Calm", "text": f"note {i}",
+                 "ts": (now - timedelta(minutes=37 * i)).strftime("%Y-%m-%d %H:%M")} for i in range(n)]
+    if kind == "reminders":
+        return [{"id": str(uuid.uuid4()), "title": f"reminder {i}", "kind": "general", "active": i % 3 != 0,
+                 "dt": (now + timedelta(hours=5 * (i - n // 2))).isoformat(timespec="minutes")} for i in range(n)]
+    raise ValueError(kind)
+
+
+def seed(store, scale, users, per_user):
+    """Seed the store; returns {username: {kind: [ids for toggles/deletes]}}."""
+    pools = {}
+    today = datetime.now().date().isoformat()
+    for i in range(users):
+        doc = {"mood": "🙂 Calm", "caretaker": "caretaker", "day": today}
+        ids = {}
+        for kind in ("tasks", "meds", "activities", "appts", "files", "notes", "reminders"):
+            recs = _pool(kind, per_user + 1)
+            ids[kind] = [r["id"] for r in recs]
+            extra = scale.get(kind, 0)
+            doc[kind] = recs + (_pool(kind, extra) if extra else [])
+        store.create(suite_wsgi.user_name(i), doc)
+        pools[suite_wsgi.user_name(i)] = ids
+    for i in range(scale["patients"]):
+        store.create(f"bench-p{i:05d}", {"mood": "😐 Okay", "caretaker": "caretaker", "day": today,
+                                          "meds": _pool("meds", 3), "reminders": _pool("reminders", 10)})
+    return pools
+
+
+def build_gallery(root, n):
+    cats = max(1, n // IMAGES_PER_CATEGORY)
+    for c in range(cats):
+        d = os.path.join(root, f"cat{c:03d}")
+        os.makedirs(d)
+        for i in range(n // cats):
+            open(os.path.join(d, f"img{i:04d}.png"), "wb").close()
+    return [f"cat{c:03d}" for c in range(cats)]
+
+
+# ----------------- clients -----------------
+class FlaskClient:
+    def __init__(self):
+        self.c = webapp.app.test_client()
+
+    def request(self, method, path, data=None, json=None, upload=None):
+        kw = {}
+        if upload is not None:
+            data = dict(data or {}, file=(io.BytesIO(upload[1]), upload[0]))
+            kw["content_type"] = "multipart/form-data"
+        return self.c.open(path, method=method, data=data, json=json, **kw).status_code
+
+
+class HTTPClient:
+    def __init__(self, base):
+        self.base = base
+        self.s = requests.Session()
+
+    def request(self, method, path, data=None, json=None, upload=None):
+        files = {"file": upload} if upload is not None else None
+        return self.s.request(method, self.base + path, data=data, json=json, files=files,
+                              allow_redirects=False, timeout=60).status_code
+
+
+def _login(client, username, password):
+    status = client.request("POST", "/login", data={"username": username, "password": password,
+                                                   "g-recaptcha-response": uuid.uuid4().hex})
+    if status != 302:
+        raise SystemExit(f"login as {username} failed: {status}")
+
+
+# ----------------- cases -----------------
+# name -> fn(ctx, i) returning (method, path, kwargs); ctx: the client's
+# username, its id pools and the gallery categories.
+def _action(action, **fields):
+    return lambda ctx, i: ("POST", "/patient/action", {"data": dict(fields, action=action)})
+
+
+def _toggle(action, kind, field):
+    return lambda ctx, i: ("POST", "/patient/action", {"data": {"action": action, field: ctx["ids"][kind][-1]}})
+
+
+def _delete(action, kind, field):
+    return lambda ctx, i: ("POST", "/patient/action", {"data": {"action": action, field: ctx["ids"][kind][i]}})
+
+
+def _page(path):
+    return lambda ctx, i: ("GET", path, {})
+
+
+def _upload(ctx, i):
+    payload = b"%PDF-1.4 bench " + str(i % UPLOAD_VARIANTS).encode() + b" " + b"x" * 4096
+    return "POST", "/patient/upload", {"upload": ("bench.pdf", payload)}
+
+
+def _batch(ctx, i):
+    rid = ctx["ids"]["tasks"][-1]
+    ops = [{"action": "toggle_task", "task_id": rid} for _ in range(10)]
+    return "POST", "/patient/actions", {"json": {"ops": ops}}
+
+
+CASES = [
+    ("landing", _page("/")),
+    ("login_page", _page("/login")),
+    ("login", lambda ctx, i: ("POST", "/login", {"data": {
+        "username": ctx["user"], "password": suite_wsgi.PASSWORD, "g-recaptcha-response": uuid.uuid4().hex}})),
+    ("hub", _page("/patient/hub")),
+    ("meds", _page("/patient/meds")),
+    ("mood", _page("/patient/mood")),
+    ("memory", _page("/patient/memory")),
+    ("activities", _page("/patient/activities")),
+    ("dashboard", _page("/patient/dashboard")),
+    ("dashboard_1y", _page("/patient/dashboard?range=1y")),
+    ("gallery", lambda ctx, i: ("GET", "/patient/gallery?category=" + ctx["cats"][i % len(ctx["cats"])], {})),
+    ("customer", lambda ctx, i: ("GET", "/customer?category=" + ctx["cats"][i % len(ctx["cats"])], {})),
+    ("add_task", _action("add_task", task_title="bench task")),
+    ("toggle_task", _toggle("toggle_task", "tasks", "task_id")),
+    ("delete_task", _delete("delete_task", "tasks", "task_id")),
+    ("add_med", _action("add_med", med_name="bench med", med_time="08:15")),
+    ("toggle_med", _toggle("toggle_med", "meds", "med_id")),
+    ("delete_med", _delete("delete_med", "meds", "med_id")),
+    ("set_mood_and_note", _action("set_mood_and_note", mood="😀 Cheerful", note="bench note")),
+    ("delete_note", _delete("delete_note", "notes", "note_id")),
+    ("add_appt", _action("add_appt", appt_title="bench appt", appt_dt="2030-01-01T10:00")),
+    ("delete_appt", _delete("delete_appt", "appts", "appt_id")),
+    ("delete_file", _delete("delete_file", "files", "file_id")),
+    ("add_reminder", _action("add_reminder", rem_title="bench", rem_dt="2030-01-01T10:00", rem_active="1")),
+    ("toggle_reminder", _toggle("toggle_reminder", "reminders", "rem_id")),
+    ("delete_reminder", _delete("delete_reminder", "reminders", "rem_id")),
+    ("add_activity", _action("add_activity", act_title="bench activity")),
+    ("toggle_activity", _toggle("toggle_activity", "activities", "act_id")),
+    ("delete_activity", _delete("delete_activity", "activities", "act_id")),
+    ("set_timezone", lambda ctx, i: ("POST", "/patient/action", {"data": {
+        "action": "set_timezone", "tz": ("Europe/Berlin", "America/New_York")[i % 2]}})),
+    ("batch_10_toggles", _batch),
+    ("upload", _upload),
+    ("caretaker", _page("/caretaker")),
+]
+CARETAKER_CASES = {"caretaker"}
+
+
+# ----------------- running -----------------
+def _pct(sorted_ms, q):
+    return sorted_ms[min(len(sorted_ms) - 1, int(q * len(sorted_ms)))]
+
+
+def run_case(contexts, fn, n):
+    """Run ``n`` requests spread over the contexts' clients, one thread each."""
+    per = [n // len(contexts) + (1 if k < n % len(contexts) else 0) for k in range(len(contexts))]
+    latencies, errors = [], []
+
+    def worker(ctx, count):
+        mine, bad = [], 0
+        for i in range(count):
+            method, path, kw = fn(ctx, i)
+            t0 = time.perf_counter()
+            try:
+                status = ctx["client"].request(method, path, **kw)
+            except requests.RequestException:
+                status = 599
+            mine.append((time.perf_counter() - t0) * 1e3)
+            bad += status >= 400
+        latencies.extend(mine)
+        errors.append(bad)
+
+    threads = [threading.Thread(target=worker, args=(ctx, k)) for ctx, k in zip(contexts, per) if k]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    latencies.sort()
+    return {
+        "n": len(latencies),
+        "errors": sum(errors),
+        "rps": round(len(latencies) / wall, 1),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "p50_ms": round(_pct(latencies, 0.50), 3),
+        "p95_ms": round(_pct(latencies, 0.95), 3),
+        "p99_ms": round(_pct(latencies, 0.99), 3),
+    }
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_gunicorn(env, workers, threads):
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-w", str(workers), "--threads", str(threads),
+         "-b", f"127.0.0.1:{port}", "--pythonpath", HERE, "suite_wsgi:app"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            requests.get(base + "/", timeout=1)
+            return proc, base
+        except requests.RequestException:
+            if proc.poll() is not None:
+                raise SystemExit("gunicorn exited during startup")
+            time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit("gunicorn did not come up")
+
+
+def run_scale(target, scale_name, n, concurrency, workers, verify_url):
+    scale = SCALES[scale_name]
+    users = concurrency if target == "gunicorn" else 1
+    per_user = n // users + 1
+    tmp = tempfile.mkdtemp(prefix=f"bench-suite-{scale_name}-")
+    db_path = os.path.join(tmp, "patients.db")
+    gallery_root = os.path.join(tmp, "gallery")
+    cats = build_gallery(gallery_root, scale["images"])
+    t0 = time.perf_counter()
+    pools = seed(SQLiteStore(db_path, webapp.PATIENT_DERIVED), scale, users, per_user)
+    print(f"[{target}/{scale_name}] seeded in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+
+    proc = None
+    if target == "client":
+        webapp.PATIENT_DB = SQLiteStore(db_path, webapp.PATIENT_DERIVED)
+        webapp.RECAPTCHA.url, webapp.RECAPTCHA.secret = verify_url, "bench"
+        suite_wsgi.configure(users, gallery_root)
+        make_client = FlaskClient
+    else:
+        env = dict(os.environ, PATIENT_STORE="sqlite", PATIENT_DB_PATH=db_path, RECAPTCHA_SECRET_KEY="bench",
+                   RECAPTCHA_VERIFY_URL=verify_url, BENCH_USERS=str(users), BENCH_GALLERY_ROOT=gallery_root,
+                   METRICS_DIR=os.path.join(tmp, "metrics"))
+        proc, base = _start_gunicorn(env, workers, max(1, concurrency // workers + 1))
+        make_client = lambda: HTTPClient(base)  # noqa: E731
+    try:
+        patients, caretakers = [], []
+        for username, ids in pools.items():
+            ctx = {"user": username, "ids": ids, "cats": cats, "client": make_client()}
+            _login(ctx["client"], username, suite_wsgi.PASSWORD)
+            patients.append(ctx)
+            ctx = dict(ctx, client=make_client())
+            _login(ctx["client"], "caretaker", webapp.DEMO_USERS["caretaker"]["password"])
+            caretakers.append(ctx)
+        results = []
+        for name, fn in CASES:
+            r = run_case(caretakers if name in CARETAKER_CASES else patients, fn, n)
+            r.update(target=target, scale=scale_name, case=name)
+            results.append(r)
+            print(f"{target:<9}{scale_name:<7}{name:<20}{r['rps']:>9.1f}{r['p50_ms']:>10.2f}"
+                  f"{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['errors']:>7}")
+        return results
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_path, results, threshold):
+    """Print p95/throughput changes against a saved run; returns the regressions."""
+    with open(old_path) as f:
+        old = {(r["target"], r["scale"], r["case"]): r for r in json.load(f)["results"]}
+    print(f"\nvs. {old_path}")
+    print(f"{'target':<9}{'scale':<7}{'case':<20}{'p95 ms':>16}{'change':>9}{'req/s change':>14}")
+    worse = []
+    for r in results:
+        o = old.get((r["target"], r["scale"], r["case"]))
+        if o is None:
+            continue
+        change = (r["p95_ms"] - o["p95_ms"]) / o["p95_ms"] if o["p95_ms"] else 0.0
+        rps_change = (r["rps"] - o["rps"]) / o["rps"] if o["rps"] else 0.0
+        flag = "  <-- worse" if change > threshold else ""
+        print(f"{r['target']:<9}{r['scale']:<7}{r['case']:<20}{o['p95_ms']:>7.2f} ->{r['p95_ms']:>7.2f}"
+              f"{change:>+9.0%}{rps_change:>+14.0%}{flag}")
+        if flag:
+            worse.append(r)
+    return worse
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--target", default="client", help="client, gunicorn or both (comma separated)")
+    ap.add_argument("--scale", default="small", help=f"comma separated: {', '.join(SCALES)}")
+    ap.add_argument("--requests", type=int, default=200, help="requests per case")
+    ap.add_argument("--concurrency", type=int, default=8, help="concurrent clients (gunicorn)")
+    ap.add_argument("--workers", type=int, default=4, help="gunicorn workers")
+    ap.add_argument("--recaptcha-delay", type=float, default=0.0, help="stub siteverify delay, seconds")
+    ap.add_argument("--out", help="write results as JSON here")
+    ap.add_argument("--compare", help="earlier --out file to compare against")
+    ap.add_argument("--threshold", type=float, default=0.10, help="p95 slowdown that counts as worse")
+    args = ap.parse_args()
+
+    stub, verify_url = start_in_thread(delay=args.recaptcha_delay)
+    print(f"{'target':<9}{'scale':<7}{'case':<20}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>7}")
+    results = []
+    for target in args.target.split(","):
+        for scale in args.scale.split(","):
+            results += run_scale(target, scale, args.requests, args.concurrency, args.workers, verify_url)
+    stub.shutdown()
+
+    if args.out:
+        meta = {"commit": _git_commit(), "time": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(), "requests": args.requests,
+                "concurrency": args.concurrency, "workers": args.workers}
+        with open(args.out, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=1)
+    if args.compare and compare(args.compare, results, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
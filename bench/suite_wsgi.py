@@ -0,0 +1,32 @@
+"""The app as bench/suite.py runs it under gunicorn.
+
+    gunicorn --pythonpath bench suite_wsgi:app
+
+Adds the suite's patients to DEMO_USERS (BENCH_USERS of them, password
+"bench") and, with BENCH_GALLERY_ROOT set, lists that synthetic tree in the
+gallery instead of static/customer_images.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import app as webapp  # noqa: E402
+from gallery import GalleryCatalog  # noqa: E402
+
+PASSWORD = "bench"
+
+
+def user_name(i):
+    return f"bench-u{i:03d}"
+
+
+def configure(users, gallery_root=None):
+    for i in range(users):
+        webapp.DEMO_USERS[user_name(i)] = {"password": PASSWORD, "role": "patient", "caretaker": "caretaker"}
+    if gallery_root:
+        webapp.GALLERY = GalleryCatalog(gallery_root, webapp.ALLOWED_IMAGE_EXTS, webapp.AUDIO_EXTS_PREFERENCE)
+        webapp.GALLERY.refresh()
+
+
+configure(int(os.getenv("BENCH_USERS", "0")), os.getenv("BENCH_GALLERY_ROOT"))
+app = webapp.app
@@ -0,0 +1,131 @@
+"""In-memory index of the picture gallery under static/customer_images.
+
+The catalog maps category -> sorted list of {img, audio, name} items. It is
+built once and then revalidated at most every ``check_interval`` seconds by
+comparing directory mtimes, so ordinary requests never touch the filesystem.
+Adding, removing or renaming a file changes its directory's mtime, and only
+the categories that changed are rescanned.
+"""
+import os
+import threading
+import time
+
+
+class _Snapshot:
+    __slots__ = ("root_mtime", "dir_mtimes", "categories", "images")
+
+    def __init__(self, root_mtime, dir_mtimes, categories, images):
+        self.root_mtime = root_mtime
+        self.dir_mtimes = dir_mtimes
+        self.categories = categories
+        self.images = images
+
+
+_EMPTY = _Snapshot(None, {}, [], {})
+
+
+class GalleryCatalog:
+    def __init__(self, root, image_exts, audio_exts, url_prefix="customer_images", check_interval=2.0):
+        self.root = root
+        self.image_exts = set(image_exts)
+        self.audio_exts = list(audio_exts)
+        self.url_prefix = url_prefix
+        self.check_interval = check_interval
+        # Bumped whenever the catalog content changes; cheap to compare.
+        self.version = 0
+        self._snap = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    # ---- public API ----
+    def categories(self):
+        return self._current().categories
+
+    def images(self, category):
+        """Items for ``category`` (shared list; treat as read-only)."""
+        return self._current().images.get(category, [])
+
+    def checked_version(self):
+        """``version`` after revalidating if it is due (what a fresh listing would see)."""
+        self._current()
+        return self.version
+
+    def all_images(self):
+        for cat in self.categories():
+            yield from self.images(cat)
+
+    def subscribe(self, fn):
+        """Call ``fn(catalog)`` after every change (including the first build)."""
+        self._listeners.append(fn)
+
+    def refresh(self, force=False):
+        """Revalidate against the filesystem now. Returns True if anything changed."""
+        with self._lock:
+            old = self._snap
+            new = self._rescan(None if force else old)
+            self._checked_at = time.monotonic()
+            if new is old:
+                return False
+            self._snap = new
+            self.version += 1
+        for fn in self._listeners:
+            fn(self)
+        return True
+
+    # ---- internals ----
+    def _current(self):
+        snap = self._snap
+        if snap is None or time.monotonic() - self._checked_at >= self.check_interval:
+            self.refresh()
+            snap = self._snap
+        return snap
+
+    def _rescan(self, old):
+        try:
+            root_mtime = os.stat(self.root).st_mtime_ns
+        except OSError:
+            return _EMPTY if old is not _EMPTY else old
+
+        if old is not None and old.root_mtime == root_mtime:
+            names = old.categories
+        else:
+            names = sorted((e.name for e in os.scandir(self.root) if e.is_dir()), key=str.lower)
+
+        dir_mtimes, images, changed = {}, {}, old is None or names != old.categories
+        for cat in names:
+            try:
+                mtime = os.stat(os.path.join(self.root, cat)).st_mtime_ns
+            except OSError:
+                changed = True
+                continue
+            dir_mtimes[cat] = mtime
+            if old is not None and old.dir_mtimes.get(cat) == mtime:
+                images[cat] = old.images[cat]
+            else:
+                images[cat] = self._scan_category(cat)
+                changed = True
+
+        if not changed:
+            return old
+        return _Snapshot(root_mtime, dir_mtimes, [c for c in names if c in dir_mtimes], images)
+
+    def _scan_category(self, category):
+        cat_dir = os.path.join(self.root, category)
+        try:
+            files = {e.name for e in os.scandir(cat_dir) if e.is_file()}
+        except OSError:
+            return []
+        items = []
+        for f in files:
+            base, ext = os.path.splitext(f)
+            if ext.lower() not in self.image_exts:
+                continue
+            audio = next((base + aext for aext in self.audio_exts if base + aext in files), None)
+            items.append({
+                "img": f"{self.url_prefix}/{category}/{f}",
+                "audio": f"{self.url_prefix}/{category}/{audio}" if audio else None,
+                "name": f,
+            })
+        items.sort(key=lambda x: x["name"].lower())
+        return items
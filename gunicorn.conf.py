@@ -0,0 +1,72 @@
+"""gunicorn settings; picked up automatically by ``gunicorn app:app``.
+
+Patient data lives in the shared SQLite store (PATIENT_DB_PATH), so any
+number of workers see the same state. The in-memory store is per process
+and only works with a single worker.
+
+GUNICORN_WORKER_CLASS picks how a worker runs requests:
+
+- ``gthread`` (default): GUNICORN_THREADS at a time per worker. A login
+  waiting on reCAPTCHA or a slow upload holds one of them throughout.
+  Due-reminder pushes (/patient/events) are off, as each open patient tab
+  would hold a thread.
+- ``gevent`` (pinned in requirements.txt): up to GUNICORN_WORKER_CONNECTIONS at
+  a time per worker, in greenlets; anything waiting on the network (the
+  verifier, an upload's body, media, /patient/events) yields. Run about one
+  worker per core, and without --preload (the app must be imported after
+  the worker patches the stdlib).
+"""
+import glob
+import multiprocessing
+import os
+import subprocess
+import sys
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+_cores = multiprocessing.cpu_count()
+workers = int(os.getenv("WEB_CONCURRENCY", _cores if worker_class == "gevent" else _cores * 2 + 1))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+# Threads per worker (gthread). /patient/events is off here (it would hold
+# one per open patient tab); see PATIENT_EVENTS in app.py.
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+# Concurrent requests per worker (gevent).
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
+# Recycle a worker after this many requests (0: never), give or take the
+# jitter so they don't all restart at once. post_worker_init warms each new
+# one up before it takes traffic.
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+# Where workers share metric snapshots; must match METRICS_DIR in app.py.
+_METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "metrics"))
+
+
+def on_starting(server):
+    if os.getenv("PATIENT_STORE", "sqlite") == "memory" and server.cfg.workers > 1:
+        raise RuntimeError("PATIENT_STORE=memory is per-process; use sqlite with more than one worker")
+    if server.cfg.worker_class_str == "gevent" and server.cfg.preload_app:
+        raise RuntimeError("gevent workers must import the app after patching; drop --preload")
+    # Migrate the store once, before any worker opens it: after a change to
+    # PATIENT_DERIVED that is a rebuild over every patient, which would
+    # otherwise hold up the first worker (and the rest wait on its lock).
+    # In a subprocess, so the master never imports the app.
+    if os.getenv("PATIENT_STORE", "sqlite") == "sqlite" and os.getenv("MIGRATE_ON_START", "1") == "1":
+        subprocess.run([sys.executable, "-m", "flask", "--app", "app", "migrate-store"],
+                       cwd=server.cfg.chdir, check=True)
+    # Metric snapshots of a previous run's workers (see metrics.py).
+    for path in glob.glob(os.path.join(_METRICS_DIR, "*.json")) if _METRICS_DIR else ():
+        os.remove(path)
+
+
+def child_exit(server, worker):
+    # Otherwise a recycled (max_requests) worker's counts would be summed
+    # into /admin/metrics for as long as the server runs.
+    from metrics import Registry
+    Registry(_METRICS_DIR).forget(worker.pid)
+
+
+def post_worker_init(worker):
+    # The app module is loaded by now; do its startup (and warm-up, see
+    # app.create_app) before this worker accepts its first connection.
+    from app import create_app
+    create_app()
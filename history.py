@@ -0,0 +1,128 @@
+"""Per-patient time series (mood, medication adherence) with rollups.
+
+Events are only ever appended. Each series keeps its raw (timestamp, value)
+pairs packed into float64 arrays, one chunk per day, and the store keeps one
+rollup row per day and per week next to them::
+
+    (n, total, last, days, day_last_total)
+
+Each event updates its two rows in O(1), so a 7-day, 30-day or 1-year
+sparkline reads at most 52 rows however long the history gets.
+
+- ``"mean"`` series (mood) plot ``total / n``, the average of every event.
+- ``"last"`` series (adherence) plot ``day_last_total / days``, the value
+  each day ended on, averaged over the days in the bucket.
+
+Bulk appends (backfills, imports) are grouped per day with NumPy when it is
+installed, and with a plain loop otherwise.
+
+Days are the patient's local days: pass datetimes in their time zone (see
+``zone``); naive datetimes mean server local time.
+"""
+import array
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+try:
+    import numpy as np
+except ImportError:  # optional: only bulk appends use it
+    np = None
+
+DAY, WEEK = "d", "w"
+# Sparkline ranges: (period, number of points).
+RANGES = {"7d": (DAY, 7), "30d": (DAY, 30), "1y": (WEEK, 52)}
+
+
+def zone(name, default=None):
+    """ZoneInfo for an IANA name; ``default`` (None: server local) if unset or unknown."""
+    if name:
+        try:
+            return ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            pass
+    return default
+
+
+def day_of(when):
+    return when.toordinal()
+
+
+def week_of(day):
+    """Monday-based week number of a day ordinal (day 1 was a Monday)."""
+    return (day - 1) // 7
+
+
+def pack(ts, values):
+    buf = array.array("d")
+    for t, v in zip(ts, values):
+        buf.append(t)
+        buf.append(v)
+    return buf
+
+
+def unpack(buf):
+    """[(ts, value), ...] from a packed array or its bytes."""
+    if not isinstance(buf, array.array):
+        raw, buf = buf, array.array("d")
+        buf.frombytes(raw)
+    return list(zip(buf[::2], buf[1::2]))
+
+
+def daily_chunks(days, values):
+    """Group time-ordered events by day: [(day, n, total, last), ...]."""
+    if np is not None and len(days) > 64:
+        d = np.asarray(days, dtype=np.int64)
+        v = np.asarray(values, dtype=np.float64)
+        starts = np.flatnonzero(np.r_[True, d[1:] != d[:-1]])
+        n = np.diff(np.r_[starts, len(d)])
+        totals = np.add.reduceat(v, starts)
+        lasts = v[starts + n - 1]
+        return list(zip(d[starts].tolist(), n.tolist(), totals.tolist(), lasts.tolist()))
+    out = []
+    for d, v in zip(days, values):
+        if out and out[-1][0] == d:
+            _, n, total, _ = out[-1]
+            out[-1] = (d, n + 1, total + v, v)
+        else:
+            out.append((d, 1, v, v))
+    return out
+
+
+def merge(day_row, week_row, n, total, last):
+    """Fold one day's (n, total, last) into its day and week rows."""
+    if day_row is None:
+        prev_last, new_day = None, (n, total, last, 1, last)
+    else:
+        prev_last = day_row[2]
+        new_day = (day_row[0] + n, day_row[1] + total, last, 1, last)
+    wn, wtotal, _, wdays, wlast_total = week_row or (0, 0.0, None, 0, 0.0)
+    if prev_last is None:
+        wdays, wlast_total = wdays + 1, wlast_total + last
+    else:
+        wlast_total += last - prev_last
+    return new_day, (wn + n, wtotal + total, last, wdays, wlast_total)
+
+
+def value(row, how):
+    return row[1] / row[0] if how == "mean" else row[4] / row[3]
+
+
+def window(range_key, today):
+    """(period, first bucket, number of buckets) ending with ``today``."""
+    period, count = RANGES[range_key]
+    last = day_of(today) if period == DAY else week_of(day_of(today))
+    return period, last - count + 1, count
+
+
+def sparkline(tx, series, how, range_key, today, default):
+    """Points for ``range_key`` ending today; gaps repeat the previous value."""
+    period, first, count = window(range_key, today)
+    rows = dict(tx.rollups(series, period, first, first + count - 1))
+    seed = tx.rollup_before(series, period, first)
+    cur = value(seed, how) if seed is not None else default
+    out = []
+    for bucket in range(first, first + count):
+        row = rows.get(bucket)
+        if row is not None:
+            cur = value(row, how)
+        out.append(round(cur, 1))
+    return out
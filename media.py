@@ -0,0 +1,66 @@
+"""Serving gallery audio/video with Range, strong ETags and proxy offload.
+
+``send_media`` answers conditional GETs (If-None-Match / If-Modified-Since ->
+304) and byte ranges (206) itself, or, in an offload mode, only decides the
+headers and hands the bytes to the front proxy:
+
+- ``"x-sendfile"``: ``X-Sendfile: <absolute path>`` (Apache mod_xsendfile,
+  lighttpd).
+- ``"x-accel"``: ``X-Accel-Redirect: <prefix><rel>`` for nginx, with::
+
+      location /_media/ { internal; alias /path/to/app/static/; }
+
+ETags are SHA-256 based, so they stay the same across workers and deploys.
+Each file is hashed once per (size, mtime).
+"""
+import hashlib
+import mimetypes
+import os
+import threading
+from urllib.parse import quote
+
+from werkzeug.utils import send_file
+
+OFFLOAD_MODES = ("", "x-sendfile", "x-accel")
+
+_etags = {}  # abs path -> (size, mtime_ns, etag)
+_etags_lock = threading.Lock()
+
+
+def strong_etag(path, st):
+    cached = _etags.get(path)
+    if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+        return cached[2]
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            h.update(chunk)
+    etag = h.hexdigest()[:32]
+    with _etags_lock:
+        _etags[path] = (st.st_size, st.st_mtime_ns, etag)
+    return etag
+
+
+def send_media(request, response_class, path, rel, offload="", accel_prefix="/_media/", max_age=86400):
+    """Response for the file at ``path`` (``rel`` is its static-relative name)."""
+    st = os.stat(path)
+    etag = strong_etag(path, st)
+    mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+    if not offload:
+        rv = send_file(path, request.environ, mimetype=mimetype, conditional=True, etag=etag,
+                       max_age=max_age, response_class=response_class)
+    else:
+        rv = response_class(mimetype=mimetype)
+        rv.set_etag(etag)
+        rv.last_modified = int(st.st_mtime)
+        rv.cache_control.public = True
+        rv.cache_control.max_age = max_age
+        if offload == "x-sendfile":
+            rv.headers["X-Sendfile"] = path
+        else:
+            rv.headers["X-Accel-Redirect"] = accel_prefix + quote(rel)
+        # The proxy does ranges; we only turn a matching validator into a 304.
+        rv = rv.make_conditional(request.environ)
+    rv.headers["Accept-Ranges"] = "bytes"
+    return rv
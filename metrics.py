@@ -0,0 +1,214 @@
+"""In-process counters and latency histograms, rendered as Prometheus text.
+
+An observation is a bisect into the bucket bounds and three additions under
+the metric's lock (~1 µs), cheap enough to leave on for every request.
+Series are keyed by label values, so labels must come from small fixed sets
+(endpoint names, action names), never from paths or user input.
+
+Each gunicorn worker counts on its own. With ``share_dir`` set, a worker
+writes its snapshot there at most every ``share_interval`` seconds (from
+``maybe_share``, called after requests) and ``render`` adds up the latest
+snapshot of every live worker, so one scrape sees the whole server. A
+worker's file goes when it exits (``forget``, from gunicorn's child_exit);
+one left by a worker that was killed is dropped at the next render.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; 1 ms .. 10 s.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, doc, labels=()):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self._values = {}  # label values -> float
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(k), v] for k, v in self._values.items()]
+
+    @staticmethod
+    def merge(into, values):
+        return into + values if into is not None else values
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, doc, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(labels)
+            if row is None:
+                row = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[i] += 1
+            row[-1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, *labels)
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(k), list(v)] for k, v in self._values.items()]
+
+    @staticmethod
+    def merge(into, values):
+        return [a + b for a, b in zip(into, values)] if into is not None else list(values)
+
+
+class Registry:
+    def __init__(self, share_dir=None, share_interval=5.0):
+        self.share_dir = share_dir
+        self.share_interval = share_interval
+        self._metrics = {}
+        self._shared_at = 0.0
+
+    def counter(self, name, doc, labels=()):
+        return self._add(Counter(name, doc, labels))
+
+    def histogram(self, name, doc, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, doc, labels, buckets))
+
+    def _add(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"duplicate metric {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self):
+        return {name: m.snapshot() for name, m in self._metrics.items()}
+
+    # ---- sharing between worker processes ----
+    def _share_path(self, pid=None):
+        return os.path.join(self.share_dir, f"{pid or os.getpid()}.json")
+
+    def forget(self, pid):
+        """Drop the snapshot of worker ``pid`` (it has exited)."""
+        if not self.share_dir:
+            return
+        try:
+            os.remove(self._share_path(pid))
+        except FileNotFoundError:
+            pass
+
+    def maybe_share(self, force=False):
+        """Write this process's snapshot if ``share_interval`` has passed."""
+        if not self.share_dir:
+            return
+        now = time.monotonic()
+        if not force and now - self._shared_at < self.share_interval:
+            return
+        self._shared_at = now
+        os.makedirs(self.share_dir, exist_ok=True)
+        path = self._share_path()
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+    def _snapshots(self):
+        """This process's live snapshot plus the last one of every other worker."""
+        yield self.snapshot()
+        if not self.share_dir:
+            return
+        self.maybe_share(force=True)
+        mine = self._share_path()
+        try:
+            names = os.listdir(self.share_dir)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.share_dir, name)
+            if not name.endswith(".json") or path == mine:
+                continue
+            pid = name[:-5]
+            if pid.isdigit() and not _alive(int(pid)):
+                self.forget(int(pid))
+                continue
+            try:
+                with open(path) as f:
+                    yield json.load(f)
+            except (OSError, ValueError):
+                continue
+
+    # ---- exposition ----
+    def render(self):
+        """All metrics in the Prometheus text exposition format (0.0.4)."""
+        totals = {name: {} for name in self._metrics}
+        for snap in self._snapshots():
+            for name, rows in snap.items():
+                metric = self._metrics.get(name)
+                if metric is None:
+                    continue
+                for labels, values in rows:
+                    key = tuple(labels)
+                    totals[name][key] = metric.merge(totals[name].get(key), values)
+        out = []
+        for name, metric in self._metrics.items():
+            out.append(f"# HELP {name} {metric.doc}")
+            out.append(f"# TYPE {name} {metric.kind}")
+            for key, values in sorted(totals[name].items()):
+                labels = _labels(metric.labels, key)
+                if metric.kind == "counter":
+                    out.append(f"{name}{_fmt_labels(labels)} {_num(values)}")
+                    continue
+                cumulative = 0
+                for bound, n in zip(metric.buckets + ("+Inf",), values[:-1]):
+                    cumulative += n
+                    le = bound if bound == "+Inf" else _num(bound)
+                    out.append(f"{name}_bucket{_fmt_labels(labels + [('le', le)])} {cumulative}")
+                out.append(f"{name}_sum{_fmt_labels(labels)} {_num(values[-1])}")
+                out.append(f"{name}_count{_fmt_labels(labels)} {cumulative}")
+        return "\n".join(out) + "\n"
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # exists, someone else's
+        return True
+    return True
+
+
+def _labels(names, values):
+    return [(n, str(v)) for n, v in zip(names, values)]
+
+
+def _fmt_labels(pairs):
+    if not pairs:
+        return ""
+    esc = lambda v: v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+
+def _num(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
@@ -0,0 +1,139 @@
+"""Rendered pages and fragments kept in memory, with validators.
+
+An entry holds the rendered body plus gzip (and, when the ``brotli``
+package is installed, brotli) copies compressed once when it is stored, a
+strong ETag (SHA-256 of the body, the same in every worker) and the time it
+was rendered for Last-Modified. ``respond`` answers If-None-Match /
+If-Modified-Since with a 304 and otherwise sends the best encoding the
+client accepts.
+
+Entries are evicted least recently used first once their bytes (all
+encodings) pass ``max_bytes``. Entries can carry tags; ``invalidate(tag)``
+drops every entry with that tag (e.g. all gallery pages when the catalog
+changes).
+"""
+import gzip
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from werkzeug.http import http_date
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# Rough per-entry cost of the key, headers and bookkeeping.
+ENTRY_OVERHEAD = 256
+
+
+class Entry:
+    __slots__ = ("body", "encoded", "etag", "modified", "http_modified", "mimetype", "size", "tags")
+
+    def __init__(self, body, encoded, etag, modified, mimetype, tags):
+        self.body = body
+        self.encoded = encoded  # content-coding -> bytes
+        self.etag = etag
+        self.modified = modified
+        self.http_modified = http_date(modified)
+        self.mimetype = mimetype
+        self.size = len(body) + sum(len(b) for b in encoded.values()) + ENTRY_OVERHEAD
+        self.tags = tags
+
+
+class PageCache:
+    def __init__(self, max_bytes=32 << 20, min_compress=1024, gzip_level=6, brotli_quality=5):
+        self.max_bytes = max_bytes
+        self.min_compress = min_compress
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.bytes = 0
+        self._entries = OrderedDict()  # key -> Entry, least recently used first
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, body, mimetype="text/html; charset=utf-8", tags=(), compress=True):
+        """Store ``body`` (bytes) under ``key``; returns the new entry."""
+        encoded = {}
+        if compress and len(body) >= self.min_compress:
+            encoded["gzip"] = gzip.compress(body, self.gzip_level, mtime=0)
+            if brotli is not None:
+                encoded["br"] = brotli.compress(body, quality=self.brotli_quality)
+        entry = Entry(body, encoded, hashlib.sha256(body).hexdigest()[:32], int(time.time()),
+                      mimetype, frozenset(tags))
+        if entry.size > self.max_bytes:
+            return entry  # served once, never kept
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old.size
+            self._entries[key] = entry
+            self.bytes += entry.size
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted.size
+        return entry
+
+    def fragment(self, key, render, tags=()):
+        """Cached text of a page fragment; ``render()`` builds it on a miss."""
+        entry = self.get(key)
+        if entry is None:
+            entry = self.put(key, render().encode("utf-8"), tags=tags, compress=False)
+        return entry.body.decode("utf-8")
+
+    def invalidate(self, tag):
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if tag in e.tags]:
+                self.bytes -= self._entries.pop(key).size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def respond(self, request, entry, response_class, private=False):
+        """Response for ``entry``: 304 if the client's copy is current, else the body."""
+        coding = _pick_coding(request, entry)
+        if "If-None-Match" in request.headers:
+            inm = request.if_none_match
+            fresh = inm.star_tag or any(inm.contains(entry.etag + sfx) for sfx in ("", "-gzip", "-br"))
+        else:
+            ims = request.if_modified_since
+            fresh = ims is not None and entry.modified <= ims.timestamp()
+        headers = [
+            ("ETag", f'"{entry.etag}-{coding}"' if coding else f'"{entry.etag}"'),
+            ("Last-Modified", entry.http_modified),
+            # Revalidate every time (cheap: a 304), so a change shows up at once.
+            ("Cache-Control", "private, no-cache" if private else "public, no-cache"),
+            ("Vary", "Accept-Encoding, Cookie" if private else "Accept-Encoding"),
+        ]
+        if fresh:
+            return response_class(status=304, headers=headers)
+        if coding:
+            headers.append(("Content-Encoding", coding))
+        return response_class(entry.encoded[coding] if coding else entry.body, headers=headers,
+                              content_type=entry.mimetype)
+
+
+def _pick_coding(request, entry):
+    header = request.headers.get("Accept-Encoding", "")
+    if not entry.encoded or ("gzip" not in header and "br" not in header):
+        return None
+    accept = request.accept_encodings
+    best, best_q = None, 0
+    for coding in ("br", "gzip"):
+        q = accept[coding]
+        if coding in entry.encoded and q > best_q:
+            best, best_q = coding, q
+    return best
@@ -0,0 +1,90 @@
+"""Admission control for expensive endpoints.
+
+- ``RateLimiter``: token buckets (per client IP, per user ...) kept in the
+  patient store, so all workers draw from the same buckets. Once a bucket
+  is empty this worker remembers until when, and turns further requests
+  away with a dict lookup instead of a store round trip.
+- ``AdmissionGate``: at most ``limit`` expensive requests in progress per
+  worker; the next one is refused at once instead of queueing for a slot
+  the cheap pages also need.
+- ``client_ip``: the address the request came from. ``X-Forwarded-For``
+  is only believed for hops added by a trusted proxy (``TRUSTED_PROXIES``),
+  so a client can't pick its own rate-limit key.
+"""
+import ipaddress
+import threading
+import time
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+# Expired "blocked until" entries are swept once there are this many.
+MAX_BLOCKED = 10000
+
+
+def parse_rate(text):
+    """``"10/minute"`` -> (0.1666 tokens per second, burst of 10)."""
+    count, _, period = text.partition("/")
+    seconds = PERIODS[period.strip().rstrip("s") or "second"]
+    count = int(count)
+    return count / seconds, count
+
+
+def parse_networks(text):
+    """Comma-separated addresses / CIDR blocks -> tuple of networks."""
+    return tuple(ipaddress.ip_network(part.strip(), strict=False) for part in text.split(",") if part.strip())
+
+
+def _trusted(addr, networks):
+    try:
+        ip = ipaddress.ip_address(addr)
+    except ValueError:
+        return False
+    return any(ip in net for net in networks)
+
+
+def client_ip(environ, trusted=()):
+    """The first address, from the right, that isn't one of our proxies."""
+    addr = environ.get("REMOTE_ADDR", "")
+    if not trusted or not _trusted(addr, trusted):
+        return addr
+    hops = [h.strip() for h in environ.get("HTTP_X_FORWARDED_FOR", "").split(",") if h.strip()]
+    for hop in reversed(hops):
+        addr = hop
+        if not _trusted(hop, trusted):
+            break
+    return addr
+
+
+class AdmissionGate:
+    def __init__(self, limit):
+        self.limit = limit
+        self._slots = threading.BoundedSemaphore(limit)
+
+    def enter(self):
+        """True if a slot was free (call ``leave()`` when done); never waits."""
+        return self._slots.acquire(blocking=False)
+
+    def leave(self):
+        self._slots.release()
+
+
+class RateLimiter:
+    def __init__(self, store, clock=time.time):
+        self.store = store
+        self.clock = clock
+        self._blocked = {}  # key -> time its bucket has a token again
+
+    def hit(self, key, rate, burst):
+        """Take a token for ``key``. Returns 0 if allowed, else seconds to wait."""
+        now = self.clock()
+        until = self._blocked.get(key)
+        if until is not None:
+            if until > now:
+                return until - now
+            self._blocked.pop(key, None)
+        taken, wait = self.store.take_tokens(key, rate, burst, now=now)
+        if taken:
+            return 0
+        if len(self._blocked) >= MAX_BLOCKED:
+            self._blocked = {k: t for k, t in self._blocked.items() if t > now}
+        self._blocked[key] = now + wait
+        return wait
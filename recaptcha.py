@@ -0,0 +1,148 @@
+"""reCAPTCHA verification with connection reuse, a spent-token cache and a breaker.
+
+- One ``requests.Session`` per process keeps TCP/TLS connections to the
+  verifier alive between logins instead of a fresh handshake each time;
+  ``warm()`` opens the first one at worker start.
+- A token is good for one verification. Once the verifier has answered for
+  it (either way) it is remembered as spent for ``cache_ttl`` seconds, so a
+  replayed or double-submitted token is refused without a round trip; a
+  success is never served from the cache.
+- After ``failure_threshold`` consecutive errors (timeouts, 5xx, garbage) the
+  circuit opens for ``reset_after`` seconds and logins stop waiting on the
+  verifier; ``fail_open`` decides whether they are let through meanwhile.
+  One trial call is allowed when the window ends (half-open).
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+GOOGLE_VERIFY_URL = "https://www.google.com/recaptcha/api/siteverify"
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_after=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self._opened_at >= self.reset_after else "open"
+
+    def allow(self):
+        """True if a call may go out now."""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class RecaptchaVerifier:
+    def __init__(self, secret, url=GOOGLE_VERIFY_URL, timeout=(1.0, 3.0), fail_open=False,
+                 cache_ttl=120.0, cache_size=10000, failure_threshold=5, reset_after=30.0,
+                 pool_size=10):
+        self.secret = secret
+        self.url = url
+        self.timeout = timeout
+        self.fail_open = fail_open
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.pool_size = pool_size
+        self.breaker = CircuitBreaker(failure_threshold, reset_after)
+        self._spent = OrderedDict()  # sha256(token) -> expires_at
+        self._cache_lock = threading.Lock()
+        self._session = None
+        self._session_pid = None
+
+    def session(self):
+        # Sockets must not be shared with a forked child, so one per process.
+        if self._session is None or self._session_pid != os.getpid():
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            s.mount("https://", adapter)
+            s.mount("http://", adapter)
+            self._session, self._session_pid = s, os.getpid()
+        return self._session
+
+    def warm(self):
+        """Open a kept-alive connection (TCP + TLS) before the first login needs one.
+
+        Best effort: a failure here doesn't count against the breaker.
+        """
+        if not self.secret:
+            return False
+        try:
+            self.session().head(self.url, timeout=self.timeout)
+        except requests.RequestException:
+            return False
+        return True
+
+    def verify(self, token, remote_ip=None):
+        """Return True/False based on reCAPTCHA verification."""
+        if not self.secret:
+            return True
+        if not token:
+            return False
+        key = hashlib.sha256(token.encode()).hexdigest()
+        if self._is_spent(key):
+            return False
+        if not self.breaker.allow():
+            return self.fail_open
+
+        payload = {"secret": self.secret, "response": token}
+        if remote_ip:
+            payload["remoteip"] = remote_ip
+        try:
+            r = self.session().post(self.url, data=payload, timeout=self.timeout)
+            r.raise_for_status()
+            ok = bool(r.json().get("success"))
+        except (requests.RequestException, ValueError):
+            self.breaker.failure()
+            return self.fail_open
+        self.breaker.success()
+        self._spend(key)
+        return ok
+
+    def _is_spent(self, key):
+        with self._cache_lock:
+            expires = self._spent.get(key)
+            if expires is None:
+                return False
+            if expires < time.monotonic():
+                del self._spent[key]
+                return False
+            return True
+
+    def _spend(self, key):
+        with self._cache_lock:
+            self._spent[key] = time.monotonic() + self.cache_ttl
+            self._spent.move_to_end(key)
+            while len(self._spent) > self.cache_size:
+                self._spent.popitem(last=False)
@@ -0,0 +1,139 @@
+"""Compact records for the in-memory store.
+
+A record used to be a dict with a 36-character uuid string for an id. Here
+each kind has a ``__slots__`` class with one slot per known field (a field
+that was never set is an empty slot; anything unexpected goes to
+``extra``), ids are held as their 16 raw bytes and short strings repeated
+across records (days, times, moods) are interned.
+
+Records are read-only: the store builds a new one on every update, and
+callers only ever get ``to_dict()`` copies, so nothing a page computes for
+display can end up in stored data.
+
+Outside the store ids are text. ``new_id()`` makes the 22-character
+base64url form, which ``pack_id`` turns into 16 bytes and ``unpack_id``
+back again; any other id (an upload's SHA-256, an older uuid string) is
+kept exactly as given.
+"""
+import base64
+import binascii
+import os
+import sys
+
+ID_BYTES = 16
+
+# The fields each kind is created with.
+FIELDS = {
+    "tasks": ("id", "title", "done"),
+    "meds": ("id", "name", "time", "taken_today", "taken_day"),
+    "notes": ("id", "mood", "text", "ts"),
+    "appts": ("id", "title", "dt"),
+    "files": ("id", "name", "path", "size"),
+    "reminders": ("id", "title", "dt", "kind", "active"),
+    "activities": ("id", "title", "done_today", "done_day"),
+}
+# Small vocabularies shared by many records: one copy of each value.
+INTERNED = frozenset({"time", "taken_day", "done_day", "mood", "kind"})
+
+_MISSING = object()
+
+
+def new_id():
+    """A fresh random id, as text."""
+    return base64.urlsafe_b64encode(os.urandom(ID_BYTES)).rstrip(b"=").decode("ascii")
+
+
+def pack_id(rid):
+    """16 bytes for an id made by ``new_id``; any other id unchanged."""
+    if type(rid) is str and len(rid) == 22:
+        try:
+            raw = base64.urlsafe_b64decode(rid + "==")
+        except (binascii.Error, ValueError):
+            return rid
+        if len(raw) == ID_BYTES and unpack_id(raw) == rid:
+            return raw
+    return rid
+
+
+def unpack_id(key):
+    if type(key) is bytes:
+        return base64.urlsafe_b64encode(key).rstrip(b"=").decode("ascii")
+    return key
+
+
+class Record:
+    __slots__ = ("seq", "extra")
+    record_kind = None
+    fields = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError("records are read-only; use replace()")
+
+    def get(self, name, default=None):
+        if name in self.fields:
+            value = getattr(self, name, _MISSING)
+            if value is _MISSING:
+                return default
+            return unpack_id(value) if name == "id" else value
+        return self.extra.get(name, default) if self.extra else default
+
+    def __getitem__(self, name):
+        value = self.get(name, _MISSING)
+        if value is _MISSING:
+            raise KeyError(name)
+        return value
+
+    def __contains__(self, name):
+        return self.get(name, _MISSING) is not _MISSING
+
+    def to_dict(self):
+        out = {}
+        for name in self.fields:
+            value = getattr(self, name, _MISSING)
+            if value is not _MISSING:
+                out[name] = unpack_id(value) if name == "id" else value
+        if self.extra:
+            out.update(self.extra)
+        return out
+
+    def replace(self, **changes):
+        """A copy with ``changes`` applied; unchanged values (and the id) are shared."""
+        out = object.__new__(type(self))
+        for name in self.fields:
+            value = getattr(self, name, _MISSING)
+            if value is not _MISSING:
+                object.__setattr__(out, name, value)
+        object.__setattr__(out, "seq", self.seq)
+        object.__setattr__(out, "extra", dict(self.extra) if self.extra else None)
+        _assign(out, changes)
+        return out
+
+
+def _record_type(kind, fields):
+    return type(f"{kind.title()}Record", (Record,), {"__slots__": fields, "record_kind": kind, "fields": fields})
+
+
+TYPES = {kind: _record_type(kind, fields) for kind, fields in FIELDS.items()}
+
+
+def pack(kind, rec, seq=0):
+    """The compact form of the dict ``rec``."""
+    cls = TYPES.get(kind) or TYPES.setdefault(kind, _record_type(kind, ()))
+    out = object.__new__(cls)
+    object.__setattr__(out, "seq", seq)
+    object.__setattr__(out, "extra", None)
+    _assign(out, rec)
+    return out
+
+
+def _assign(out, values):
+    put = object.__setattr__
+    for name, value in values.items():
+        if name not in out.fields:
+            if out.extra is None:
+                put(out, "extra", {})
+            out.extra[name] = value
+        elif name == "id":
+            put(out, name, pack_id(value))
+        else:
+            put(out, name, sys.intern(value) if name in INTERNED and type(value) is str else value)
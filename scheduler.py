@@ -0,0 +1,253 @@
+"""Due reminders and medication times, pushed to open pages.
+
+``DueQueue`` is a min-heap of (due, seq, key). Rescheduling or cancelling
+never searches the heap: ``_live`` holds each key's current due time and
+heap entries that no longer match it are dropped when they reach the top.
+A tick therefore costs O(due items · log n), however many patients are
+tracked.
+
+``ReminderScheduler`` runs one background thread per process. A patient's
+upcoming reminders and med times are loaded (from the store's sort-key
+index, not a full load) when they open an event stream, and kept current
+from the store's commit notifications. Writes made by other workers are
+picked up by comparing the patient's version every ``check_interval``
+seconds. Reminders fire once; med times repeat daily. Both are wall-clock
+times in the patient's zone (fields["tz"]).
+"""
+import heapq
+import itertools
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+from history import zone
+
+# Reminders loaded up to this long after their time still fire.
+GRACE = 60.0
+
+
+class DueQueue:
+    def __init__(self):
+        self._heap = []
+        self._live = {}  # key -> due
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._live)
+
+    def schedule(self, key, due):
+        self._live[key] = due
+        heapq.heappush(self._heap, (due, next(self._seq), key))
+        if len(self._heap) > 2 * len(self._live) + 64:
+            self._compact()
+
+    def cancel(self, key):
+        self._live.pop(key, None)
+
+    def next_due(self):
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now):
+        """[(key, due), ...] for every entry due at or before ``now``."""
+        out = []
+        while self._heap and self._heap[0][0] <= now:
+            due, _, key = heapq.heappop(self._heap)
+            if self._live.get(key) == due:
+                del self._live[key]
+                out.append((key, due))
+        return out
+
+    def _drop_stale(self):
+        while self._heap and self._live.get(self._heap[0][2]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def _compact(self):
+        self._heap = [e for e in self._heap if self._live.get(e[2]) == e[0]]
+        heapq.heapify(self._heap)
+
+
+def reminder_due(rec, now, tz=None):
+    """Epoch seconds a reminder fires at, or None (inactive, bad date, past)."""
+    if not rec.get("active"):
+        return None
+    try:
+        at = datetime.fromisoformat(rec["dt"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    due = (at if at.tzinfo else at.replace(tzinfo=tz)).timestamp()
+    return due if due >= now - GRACE else None
+
+
+def med_due(rec, now, tz=None):
+    """Next time a med is due: today at its time, or tomorrow once past/taken."""
+    try:
+        hh, mm = rec["time"].split(":")
+        at = datetime.fromtimestamp(now, tz).replace(hour=int(hh), minute=int(mm), second=0, microsecond=0)
+    except (KeyError, AttributeError, ValueError):
+        return None
+    taken = rec.get("taken_today") and rec.get("taken_day") == at.date().isoformat()
+    if at.timestamp() <= now or taken:
+        at += timedelta(days=1)
+    return at.timestamp()
+
+
+def _event(kind, rec):
+    if kind == "meds":
+        return {"type": "med", "id": rec["id"], "name": rec.get("name"), "time": rec.get("time")}
+    return {"type": "reminder", "id": rec["id"], "title": rec.get("title"),
+            "dt": rec.get("dt"), "kind": rec.get("kind")}
+
+
+class ReminderScheduler:
+    def __init__(self, store, default_tz=None, check_interval=10.0, clock=time.time):
+        self.store = store
+        self.default_tz = default_tz
+        self.check_interval = check_interval
+        self.clock = clock
+        self._due = DueQueue()
+        self._records = {}   # (username, kind, id) -> record
+        self._keys = {}      # username -> {keys}
+        self._versions = {}  # username -> store version the entries reflect
+        self._zones = {}     # username -> tzinfo (None: server local)
+        self._streams = {}   # username -> {queue}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        store.subscribe(self._on_commit)
+
+    # ---- event streams ----
+    def open_stream(self, username):
+        """A queue that receives this patient's due events until closed."""
+        q = queue.SimpleQueue()
+        with self._cond:
+            self._streams.setdefault(username, set()).add(q)
+            tracked = username in self._versions
+        if not tracked:
+            self.load(username)
+        self._ensure_thread()
+        return q
+
+    def close_stream(self, username, q):
+        with self._cond:
+            streams = self._streams.get(username, set())
+            streams.discard(q)
+            if not streams:
+                self._streams.pop(username, None)
+                self._forget(username)
+
+    # ---- tracking ----
+    def load(self, username):
+        """(Re)read a patient's upcoming reminders and med times."""
+        now = self.clock()
+        with self.store.transaction(username, readonly=True) as tx:
+            version = tx.version
+            tz = zone(tx.fields().get("tz"), self.default_tz)
+            start = datetime.fromtimestamp(now - GRACE, tz).strftime("%Y-%m-%dT%H:%M:%S")
+            entries = [("reminders", r) for r in tx.iter_sorted("reminders", start)]
+            entries += [("meds", m) for m in tx.iter_sorted("meds")]
+        with self._cond:
+            self._forget(username)
+            self._zones[username] = tz
+            for kind, rec in entries:
+                self._track(username, kind, rec, now)
+            self._versions[username] = version
+            self._cond.notify()
+
+    def _track(self, username, kind, rec, now):
+        key = (username, kind, rec["id"])
+        self._due.cancel(key)
+        self._records.pop(key, None)
+        tz = self._zones.get(username)
+        due = med_due(rec, now, tz) if kind == "meds" else reminder_due(rec, now, tz)
+        if due is not None:
+            self._due.schedule(key, due)
+            self._records[key] = rec
+            self._keys.setdefault(username, set()).add(key)
+
+    def _forget(self, username):
+        for key in self._keys.pop(username, ()):
+            self._due.cancel(key)
+            self._records.pop(key, None)
+        self._versions.pop(username, None)
+        self._zones.pop(username, None)
+
+    def _on_commit(self, username, tx):
+        with self._cond:
+            if username not in self._versions:
+                return
+            if self._versions[username] != tx.version - 1 or tx.fields_changed:
+                stale = True  # someone else wrote in between, or the zone may have moved
+            else:
+                stale = False
+                now = self.clock()
+                for (kind, rid), rec in tx.changes.items():
+                    if kind not in ("reminders", "meds"):
+                        continue
+                    if rec is None:
+                        self._due.cancel((username, kind, rid))
+                        self._records.pop((username, kind, rid), None)
+                    else:
+                        self._track(username, kind, rec, now)
+                self._versions[username] = tx.version
+                self._cond.notify()
+        if stale:
+            self.load(username)
+
+    # ---- ticking ----
+    def tick(self, now=None):
+        """Deliver everything due by ``now``; returns the events fired."""
+        now = self.clock() if now is None else now
+        fired = []
+        with self._cond:
+            for key, due in self._due.pop_due(now):
+                username, kind, _ = key
+                rec = self._records.pop(key, None)
+                if rec is None:
+                    continue
+                event = _event(kind, rec)
+                fired.append((username, event))
+                for q in self._streams.get(username, ()):
+                    q.put(event)
+                if kind == "meds":  # same time tomorrow
+                    nxt = (datetime.fromtimestamp(due, self._zones.get(username)) + timedelta(days=1)).timestamp()
+                    self._due.schedule(key, nxt)
+                    self._records[key] = rec
+                else:
+                    self._keys.get(username, set()).discard(key)
+        return fired
+
+    def _check_versions(self):
+        with self._cond:
+            tracked = dict(self._versions)
+        for username, version in tracked.items():
+            try:
+                current = self.store.version(username)
+            except KeyError:
+                continue
+            if current != version:
+                self.load(username)
+
+    def _ensure_thread(self):
+        # Threads don't survive a fork, so one per process.
+        with self._cond:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="reminder-scheduler", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        checked = time.monotonic()
+        while True:
+            with self._cond:
+                nxt = self._due.next_due()
+                wait = self.check_interval if nxt is None else min(self.check_interval, nxt - self.clock())
+                if wait > 0:
+                    self._cond.wait(wait)
+            self.tick()
+            if time.monotonic() - checked >= self.check_interval:
+                self._check_versions()
+                checked = time.monotonic()
@@ -0,0 +1,73 @@
+// Batched patient actions: checkbox toggles are queued for a moment and sent
+// together to /patient/actions as JSON instead of one form post + full page
+// reload each. The batch is all-or-nothing, so on any failure the page is
+// reloaded to show what the server actually has.
+window.PatientActions = (function () {
+  const URL = "/patient/actions";
+  const DELAY_MS = 250;
+  let queue = [];   // [{op, form}]
+  let timer = null;
+
+  function opFromForm(form) {
+    const op = {};
+    new FormData(form).forEach((v, k) => { op[k] = v; });
+    return op;
+  }
+
+  function markDone(form, done) {
+    const label = form.querySelector(".form-check-label");
+    if (label) label.classList.toggle("text-decoration-line-through", done);
+    const row = form.closest("[data-state]");
+    if (row) row.setAttribute("data-state", done ? "done" : "active");
+  }
+
+  async function flush() {
+    timer = null;
+    const batch = queue;
+    queue = [];
+    if (!batch.length) return;
+    try {
+      const r = await fetch(URL, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        credentials: "same-origin",
+        body: JSON.stringify({ ops: batch.map((q) => q.op) }),
+      });
+      if (!r.ok) throw new Error(r.status);
+      const res = await r.json();
+      const byId = {};
+      res.changed.forEach((c) => { byId[c.id] = c.record; });
+      batch.forEach(({ op, form }) => {
+        const id = op.task_id || op.act_id;
+        const rec = byId[id];
+        if (rec) markDone(form, !!(rec.done || rec.done_today));
+      });
+    } catch (e) {
+      window.location.reload();
+    }
+  }
+
+  // Returns true if the change was queued (so the caller skips submit()).
+  function queueForm(form) {
+    if (!window.fetch) return false;
+    queue.push({ op: opFromForm(form), form });
+    if (!timer) timer = setTimeout(flush, DELAY_MS);
+    return true;
+  }
+
+  // "Today" is the patient's local day, so tell the server this browser's
+  // time zone whenever it differs from the one last sent.
+  try {
+    const tz = Intl.DateTimeFormat().resolvedOptions().timeZone;
+    if (window.fetch && tz && localStorage.getItem("patientTz") !== tz) {
+      fetch(URL, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        credentials: "same-origin",
+        body: JSON.stringify({ ops: [{ action: "set_timezone", tz }] }),
+      }).then((r) => { if (r.ok) localStorage.setItem("patientTz", tz); });
+    }
+  } catch (e) { /* no Intl / storage: server default zone applies */ }
+
+  return { queue: queueForm, flush };
+})();
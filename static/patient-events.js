@@ -0,0 +1,26 @@
+// Due reminders and med times, pushed by the server (/patient/events).
+// Shows a small toast; EventSource reconnects by itself when the stream ends.
+(function () {
+  if (!window.EventSource) return;
+  const box = document.createElement("div");
+  box.className = "toast-container position-fixed bottom-0 end-0 p-3";
+  document.body.appendChild(box);
+
+  function show(text) {
+    const el = document.createElement("div");
+    el.className = "toast align-items-center text-bg-light border-0 shadow show";
+    el.setAttribute("role", "alert");
+    el.innerHTML = '<div class="d-flex"><div class="toast-body"></div>' +
+      '<button type="button" class="btn-close me-2 m-auto" aria-label="Close"></button></div>';
+    el.querySelector(".toast-body").textContent = text;
+    el.querySelector(".btn-close").onclick = () => el.remove();
+    box.appendChild(el);
+    setTimeout(() => el.remove(), 60000);
+  }
+
+  const src = new EventSource("/patient/events");
+  src.addEventListener("due", (e) => {
+    const ev = JSON.parse(e.data);
+    show(ev.type === "med" ? `💊 Time for ${ev.name} (${ev.time})` : `🔔 ${ev.title}`);
+  });
+})();
@@ -0,0 +1,1424 @@
+"""Patient data storage.
+
+Two interchangeable backends sit behind the same small API:
+
+- ``SQLiteStore`` (default): one WAL-mode database file. Records are keyed by
+  (username, kind, id), so a toggle or delete is a primary-key lookup instead
+  of a scan over the whole list.
+- ``MemoryStore``: the original in-process dict, kept for tests and demos.
+  Each collection is an id -> record dict, so lookups are O(1) here too.
+  Records are held in the compact form from records.py (slots, 16-byte
+  ids) and handed out as plain dict copies.
+
+All writes for one patient happen inside ``store.transaction(username)``;
+the one-shot helpers (``add``, ``toggle``, ``delete`` ...) open their own.
+Every write transaction bumps the patient's ``version``. Passing
+``expected_version=`` makes the write conditional (optimistic concurrency):
+if another worker changed the patient first, ``ConflictError`` is raised
+and nothing is written.
+
+``tx.changes`` maps (kind, id) -> new record (None once deleted) for every
+record the transaction wrote, and ``tx.on_commit(fn)`` defers side effects
+such as removing a file until the write is durable; ``tx.on_rollback(fn)``
+undoes one taken early (a file moved aside) if the write is abandoned. ``store.subscribe(fn)``
+calls ``fn(username, tx)`` after every committed write in this process.
+
+A ``Derived.summary`` function, if given, is re-run at the end of every write
+transaction and its (group, body) kept per patient; ``store.summaries(group)``
+returns one group's rows (e.g. a caretaker's patients) without touching any
+other patient.
+
+``tx.adjust_ref(key, delta)`` keeps global reference counts (e.g. uploaded
+blobs shared between patients) in the same transaction as the patient write.
+
+``store.take_tokens(key, rate, burst)`` is a token bucket kept in the store,
+so every worker sharing the database draws from the same one (see
+ratelimit.py).
+
+``tx.record(series, when, value)`` appends to a per-patient time series
+(mood, adherence ...) and keeps its day/week rollups current; see history.py.
+
+``store.create_many(docs, fill)`` creates a batch of patients in one write
+transaction, for bulk imports (see transfer.py).
+
+A ``Derived`` spec lists counters and sort keys that the store keeps up to
+date on every write, so readers such as the dashboard can ask for "tasks
+done" or "next three reminders" without walking every record.
+
+``tx.page(kind, limit, cursor)`` returns one page of a collection in display
+order plus the cursor of the next page (None on the last), so a page costs
+the same however long the history is. ``Derived.search`` names the text of
+each kind to index: the store keeps a per-patient inverted index (token ->
+records) current on every add, update and delete, and ``tx.search(kind,
+query, limit, cursor)`` pages through the records containing every word of
+the query (the last word may be a prefix, for search as you type).
+
+Only the SQLite backend is shared between processes, so it is the one to
+use under multi-worker gunicorn. Under gevent workers pass
+``cooperative=True``: waiting for another process's write lock then sleeps
+in Python (a greenlet switch) instead of inside SQLite, which would stall
+every request in the worker.
+"""
+import bisect
+import copy
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from itertools import islice
+
+import history
+import records
+from history import DAY, WEEK
+
+# Record collections kept per patient, in the shape the templates expect.
+KINDS = ("tasks", "meds", "notes", "appts", "files", "reminders", "activities")
+# These are shown newest first (they used to be built with list.insert(0, ...)).
+NEWEST_FIRST = {"notes", "files", "reminders"}
+# SQLite search: a word with at most this many postings drives the query.
+RARE_POSTINGS = 2000
+# Buckets that have refilled are dropped once every this many takes.
+PRUNE_BUCKETS_EVERY = 1000
+# Default counter group; flag() counters and per-kind totals count into it.
+ALL = "all"
+
+
+class ConflictError(Exception):
+    """The patient changed since the version the caller read."""
+
+    def __init__(self, username, expected, actual):
+        super().__init__(f"{username}: expected version {expected}, found {actual}")
+        self.username = username
+        self.expected = expected
+        self.actual = actual
+
+
+def _record_id(rec):
+    return rec.get("id") or rec["name"]
+
+
+def _record_key(rec):
+    """Id a records.Record is indexed under: the very bytes its ``id`` slot holds."""
+    key = getattr(rec, "id", None)
+    return key if key is not None else records.pack_id(_record_id(rec))
+
+
+def _bucket_level(state, now, rate, burst):
+    """Tokens in a bucket left as ``state`` = (tokens, at); a new bucket is full."""
+    if state is None:
+        return burst
+    return min(burst, state[0] + max(0.0, now - state[1]) * rate)
+
+
+def _oldest_first(kind, recs):
+    return list(reversed(recs)) if kind in NEWEST_FIRST else list(recs)
+
+
+def _tokens(text):
+    """Words of ``text`` as the search index keeps them (case-folded)."""
+    return re.findall(r"\w+", text.casefold()) if text else []
+
+
+def _query_tokens(query):
+    """Distinct words of a query, in order (the last one is matched as a prefix)."""
+    return list(dict.fromkeys(_tokens(query)))
+
+
+def _from_cursor(seqs, cursor, newest_first):
+    """Items of the ascending ``seqs`` in display order, after ``cursor``."""
+    if newest_first:
+        i = bisect.bisect_left(seqs, cursor) if cursor is not None else len(seqs)
+        return (seqs[j] for j in range(i - 1, -1, -1))
+    i = bisect.bisect_right(seqs, cursor) if cursor is not None else 0
+    return (seqs[j] for j in range(i, len(seqs)))
+
+
+def _contains(seqs, seq):
+    i = bisect.bisect_left(seqs, seq)
+    return i < len(seqs) and seqs[i] == seq
+
+
+def _paged(rows, limit):
+    """Split ``limit + 1`` (cursor, record) rows into (records, next cursor)."""
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return [rec for _, rec in rows], rows[-1][0] if more else None
+
+
+# ----------------- derived data -----------------
+def flag(field):
+    """Counter function counting records whose ``field`` is truthy."""
+    return lambda rec: ALL if rec.get(field) else None
+
+
+def _total(rec):
+    return ALL
+
+
+class Derived:
+    """Counters and sort keys maintained alongside every write.
+
+    ``counters``: {name: (kind, fn)} where ``fn(record)`` returns the group
+    the record counts towards, or None. Every kind also gets a total under
+    its own name. ``sort_keys``: {kind: fn} where ``fn(record)`` returns a
+    string key, or None to leave the record out of the index.
+    ``summary``: ``fn(tx)`` returning (group, JSON-able body), re-run after
+    each write. ``search``: {kind: fn} where ``fn(record)`` returns the text
+    to index for ``tx.search``. Bump ``version`` whenever a function changes
+    so existing data is rebuilt.
+    """
+
+    def __init__(self, counters=None, sort_keys=None, summary=None, search=None, version=1):
+        self.counters = {kind: (kind, _total) for kind in KINDS}
+        self.counters.update(counters or {})
+        self.sort_keys = dict(sort_keys or {})
+        self.summary = summary
+        self.search = dict(search or {})
+        self.version = version
+        self._by_kind = {kind: [(name, fn) for name, (k, fn) in self.counters.items() if k == kind]
+                         for kind in KINDS}
+
+    def sort_key(self, kind, rec):
+        fn = self.sort_keys.get(kind)
+        return fn(rec) if fn is not None and rec is not None else None
+
+    def terms(self, kind, rec):
+        """Set of search tokens of ``rec`` (empty if ``kind`` isn't indexed)."""
+        fn = self.search.get(kind)
+        return set(_tokens(fn(rec))) if fn is not None and rec is not None else set()
+
+    def count_changes(self, counts, kind, old, new):
+        """Apply the counter change of ``old`` -> ``new`` (either may be None)."""
+        changed = False
+        for name, fn in self._by_kind[kind]:
+            g_old = fn(old) if old is not None else None
+            g_new = fn(new) if new is not None else None
+            if g_old == g_new:
+                continue
+            groups = counts.setdefault(name, {})
+            if g_old is not None:
+                n = groups.get(g_old, 0) - 1
+                if n > 0:
+                    groups[g_old] = n
+                else:
+                    groups.pop(g_old, None)
+            if g_new is not None:
+                groups[g_new] = groups.get(g_new, 0) + 1
+            changed = True
+        return changed
+
+
+class _StoreBase:
+    """One-shot helpers shared by both backends."""
+
+    def subscribe(self, fn):
+        """Call ``fn(username, tx)`` after each committed write transaction."""
+        self._listeners.append(fn)
+
+    def _notify(self, username, tx):
+        if tx.changes or tx.fields_changed:
+            for fn in self._listeners:
+                fn(username, tx)
+
+    def load(self, username, skip=()):
+        with self.transaction(username, readonly=True) as tx:
+            return tx.load(skip)
+
+    def get(self, username, kind, rid):
+        with self.transaction(username, readonly=True) as tx:
+            return tx.get(kind, rid)
+
+    def version(self, username):
+        with self.transaction(username, readonly=True) as tx:
+            return tx.version
+
+    def add(self, username, kind, rec):
+        with self.transaction(username) as tx:
+            return tx.add(kind, rec)
+
+    def update(self, username, kind, rid, **changes):
+        with self.transaction(username) as tx:
+            return tx.update(kind, rid, **changes)
+
+    def toggle(self, username, kind, rid, field):
+        with self.transaction(username) as tx:
+            return tx.toggle(kind, rid, field)
+
+    def delete(self, username, kind, rid):
+        with self.transaction(username) as tx:
+            return tx.delete(kind, rid)
+
+    def set_fields(self, username, **fields):
+        with self.transaction(username) as tx:
+            tx.set_fields(**fields)
+
+    def take_tokens(self, key, rate, burst, cost=1.0, now=None):
+        """Take ``cost`` tokens from bucket ``key`` (``burst`` deep, refilled at
+        ``rate`` per second) if it has them. Returns (taken, seconds until it would)."""
+        now = time.time() if now is None else now
+        self._takes += 1
+        if self._takes % PRUNE_BUCKETS_EVERY == 0:
+            self._prune_buckets(now)
+        return self._take(key, rate, burst, cost, now)
+
+
+class _TxnBase:
+    def _init_changes(self):
+        self.changes = {}
+        self.fields_changed = False
+        self._commit_hooks = []
+        self._rollback_hooks = []
+
+    def on_commit(self, fn):
+        """Run ``fn()`` once the transaction has committed (never on rollback)."""
+        self._commit_hooks.append(fn)
+
+    def on_rollback(self, fn):
+        """Run ``fn()`` if the transaction rolls back instead."""
+        self._rollback_hooks.append(fn)
+
+    def _committed(self):
+        for fn in self._commit_hooks:
+            fn()
+
+    def _rolled_back(self):
+        for fn in reversed(self._rollback_hooks):
+            fn()
+
+    def _summarize(self):
+        if self._dirty and self._derived.summary is not None:
+            group, body = self._derived.summary(self)
+            self._put_summary(group, body)
+
+    def toggle(self, kind, rid, field):
+        rec = self.get(kind, rid)
+        if rec is None:
+            return None
+        return self.update(kind, rid, **{field: not rec.get(field)})
+
+    def count(self, name, group=ALL):
+        return self.counters().get(name, {}).get(group, 0)
+
+    # ---- time series ----
+    def record(self, series, when, value):
+        self.record_many(series, [when], [value])
+
+    def record_many(self, series, whens, values):
+        """Append events to ``series`` and fold them into its rollups."""
+        events = sorted(zip(whens, values), key=lambda e: e[0])
+        if not events:
+            return
+        self._changed()
+        vals = [float(v) for _, v in events]
+        i = 0
+        for day, n, total, last in history.daily_chunks([history.day_of(w) for w, _ in events], vals):
+            ts = [w.timestamp() for w, _ in events[i:i + n]]
+            self._fold_day(series, day, ts, vals[i:i + n], n, total, last)
+            i += n
+
+    def record_days(self, series, days):
+        """Append events already dated to day ordinals (an import):
+        [(day, [(ts, value), ...]), ...], in time order."""
+        week = week_row = None
+        for day, events in days:
+            if not events:
+                continue
+            self._changed()
+            vals = [float(v) for _, v in events]
+            self._append_events(series, day, history.pack([t for t, _ in events], vals))
+            if history.week_of(day) != week:
+                if week is not None:
+                    self._put_rollup(series, WEEK, week, week_row)
+                week = history.week_of(day)
+                week_row = self._rollup(series, WEEK, week)
+            day_row, week_row = history.merge(
+                self._rollup(series, DAY, day), week_row, len(vals), sum(vals), vals[-1])
+            self._put_rollup(series, DAY, day, day_row)
+        if week is not None:
+            self._put_rollup(series, WEEK, week, week_row)
+
+    def _fold_day(self, series, day, ts, vals, n, total, last):
+        self._append_events(series, day, history.pack(ts, vals))
+        week = history.week_of(day)
+        day_row, week_row = history.merge(
+            self._rollup(series, DAY, day), self._rollup(series, WEEK, week), n, total, last)
+        self._put_rollup(series, DAY, day, day_row)
+        self._put_rollup(series, WEEK, week, week_row)
+
+
+# ----------------- in-memory backend -----------------
+class _MemoryTxn(_TxnBase):
+    # Each collection maps packed id -> records.Record; dict order is
+    # insertion order and ``rec.seq`` lets a rolled-back delete find its old
+    # position again. doc["sorted"][kind] is a sorted list of (sort_key, seq,
+    # packed id). Records are never edited in place, only replaced.
+    # doc["order"][kind] is (seqs, ids): parallel seq-sorted arrays for
+    # paging from a cursor, and doc["terms"][kind] maps a search token to the
+    # sorted seqs of the records containing it.
+    def __init__(self, doc, refs, derived, summaries=None, username=None):
+        self._doc = doc
+        self._refs = refs
+        self._derived = derived
+        self._summaries = summaries
+        self._user = username
+        self._undo = []
+        self._dirty = False
+        self._init_changes()
+
+    @property
+    def version(self):
+        return self._doc["version"]
+
+    def _changed(self):
+        if not self._dirty:
+            self._dirty = True
+            self._doc["version"] += 1
+            self._undo.append(lambda: self._doc.__setitem__("version", self._doc["version"] - 1))
+
+    def _index(self, kind, rid, seq, old, new, undo=True):
+        self._derived.count_changes(self._doc["counters"], kind, old, new)
+        k_old, k_new = self._derived.sort_key(kind, old), self._derived.sort_key(kind, new)
+        if k_old != k_new:
+            index = self._doc["sorted"][kind]
+            if k_old is not None:
+                i = bisect.bisect_left(index, (k_old, seq, rid))
+                if i < len(index) and index[i] == (k_old, seq, rid):
+                    del index[i]
+            if k_new is not None:
+                bisect.insort(index, (k_new, seq, rid))
+        if (old is None) != (new is None):
+            seqs, keys = self._doc["order"][kind]
+            i = bisect.bisect_left(seqs, seq)
+            if new is not None:
+                seqs.insert(i, seq)
+                keys.insert(i, rid)
+            else:
+                del seqs[i], keys[i]
+        t_old, t_new = self._derived.terms(kind, old), self._derived.terms(kind, new)
+        if t_old != t_new:
+            terms = self._doc["terms"][kind]
+            for token in t_old - t_new:
+                postings = terms[token]
+                del postings[bisect.bisect_left(postings, seq)]
+                if not postings:
+                    del terms[token]
+            for token in t_new - t_old:
+                bisect.insort(terms.setdefault(token, array("q")), seq)
+        if undo:
+            self._undo.append(lambda: self._index(kind, rid, seq, new, old, undo=False))
+
+    def load(self, skip=()):
+        """Everything, as one dict; kinds in ``skip`` are left empty."""
+        out = copy.deepcopy(self._doc["fields"])
+        for kind in KINDS:
+            recs = [r.to_dict() for r in self._doc["kinds"][kind].values()] if kind not in skip else []
+            out[kind] = recs[::-1] if kind in NEWEST_FIRST else recs
+        return out
+
+    def fields(self):
+        return dict(self._doc["fields"])
+
+    def counters(self):
+        return self._doc["counters"]
+
+    def get(self, kind, rid):
+        rec = self._doc["kinds"][kind].get(records.pack_id(rid))
+        return rec.to_dict() if rec is not None else None
+
+    def head(self, kind, n):
+        """First ``n`` records in display order."""
+        recs = self._doc["kinds"][kind]
+        it = reversed(recs.values()) if kind in NEWEST_FIRST else iter(recs.values())
+        out = []
+        for rec in it:
+            if len(out) >= n:
+                break
+            out.append(rec.to_dict())
+        return out
+
+    def iter_sorted(self, kind, start=None):
+        """Records with a sort key, in key order, from ``start`` on."""
+        index = self._doc["sorted"][kind]
+        recs = self._doc["kinds"][kind]
+        i = bisect.bisect_left(index, (start,)) if start is not None else 0
+        while i < len(index):
+            yield recs[index[i][2]].to_dict()
+            i += 1
+
+    def count_sorted(self, kind, start, stop=None):
+        """Number of records with ``start <= sort key < stop``."""
+        index = self._doc["sorted"][kind]
+        hi = bisect.bisect_left(index, (stop,)) if stop is not None else len(index)
+        return hi - bisect.bisect_left(index, (start,))
+
+    def _row(self, kind, seq):
+        seqs, keys = self._doc["order"][kind]
+        return seq, self._doc["kinds"][kind][keys[bisect.bisect_left(seqs, seq)]].to_dict()
+
+    def page(self, kind, limit, cursor=None):
+        """Up to ``limit`` records in display order after ``cursor``, and the next cursor."""
+        seqs = self._doc["order"][kind][0]
+        after = _from_cursor(seqs, cursor, kind in NEWEST_FIRST)
+        return _paged([self._row(kind, seq) for seq in islice(after, limit + 1)], limit)
+
+    def search(self, kind, query, limit, cursor=None):
+        """Like ``page``, for the records containing every word of ``query``."""
+        words = _query_tokens(query)
+        if not words:
+            return [], None
+        terms = self._doc["terms"][kind]
+        postings = [terms.get(w, ()) for w in words[:-1]]
+        # The vocabulary is one patient's words, so the prefix scan is short.
+        matches = [p for token, p in terms.items() if token.startswith(words[-1])]
+        postings.append(matches[0] if len(matches) == 1 else sorted(set().union(*matches)))
+        postings.sort(key=len)  # walk the rarest word, probe the others
+        rows = []
+        for seq in _from_cursor(postings[0], cursor, kind in NEWEST_FIRST):
+            if all(_contains(p, seq) for p in postings[1:]):
+                rows.append(self._row(kind, seq))
+                if len(rows) > limit:
+                    break
+        return _paged(rows, limit)
+
+    def add(self, kind, rec):
+        recs = self._doc["kinds"][kind]
+        rid = _record_id(rec)
+        self._doc["seq"] += 1
+        new = records.pack(kind, rec, self._doc["seq"])
+        key = _record_key(new)
+        prev = recs.get(key)
+        self._changed()
+        recs[key] = new
+        if prev is None:
+            self._undo.append(lambda: recs.pop(key, None))
+        else:
+            self._undo.append(lambda: recs.__setitem__(key, prev))
+            self._index(kind, key, prev.seq, prev, None)
+        self._index(kind, key, new.seq, None, new)
+        out = self.changes[(kind, rid)] = new.to_dict()
+        return dict(out)
+
+    def update(self, kind, rid, **changes):
+        recs = self._doc["kinds"][kind]
+        key = records.pack_id(rid)
+        old = recs.get(key)
+        if old is None:
+            return None
+        self._changed()
+        new = recs[key] = old.replace(**changes)
+        self._undo.append(lambda: recs.__setitem__(key, old))
+        self._index(kind, key, old.seq, old, new)
+        out = self.changes[(kind, rid)] = new.to_dict()
+        return dict(out)
+
+    def delete(self, kind, rid):
+        recs = self._doc["kinds"][kind]
+        key = records.pack_id(rid)
+        if key not in recs:
+            return None
+        self._changed()
+        old = recs.pop(key)
+
+        def undo():
+            recs[key] = old
+            ordered = sorted(recs.items(), key=lambda kv: kv[1].seq)
+            recs.clear()
+            recs.update(ordered)
+        self._undo.append(undo)
+        self._index(kind, key, old.seq, old, None)
+        self.changes[(kind, rid)] = None
+        return old.to_dict()
+
+    def set_fields(self, **fields):
+        self._changed()
+        old = self._doc["fields"]
+        self._doc["fields"] = {**old, **fields}
+        self._undo.append(lambda: self._doc.__setitem__("fields", old))
+        self.fields_changed = True
+
+    def adjust_ref(self, key, delta):
+        old = self._refs.get(key, 0)
+        n = max(0, old + delta)
+        if n:
+            self._refs[key] = n
+        else:
+            self._refs.pop(key, None)
+        self._undo.append(lambda: self._refs.__setitem__(key, old) if old else self._refs.pop(key, None))
+        return n
+
+    def _series(self, series):
+        hist = self._doc["history"]
+        if series not in hist:
+            hist[series] = {"events": {}, DAY: {}, WEEK: {}, "keys": {DAY: [], WEEK: []}}
+            self._undo.append(lambda: hist.pop(series, None))
+        return hist[series]
+
+    def _append_events(self, series, day, buf):
+        events = self._series(series)["events"]
+        old = events.get(day)
+        if old is None:
+            events[day] = buf
+            self._undo.append(lambda: events.pop(day, None))
+        else:
+            n = len(old)
+            old.extend(buf)
+            self._undo.append(lambda: old.__delitem__(slice(n, None)))
+
+    def _rollup(self, series, period, bucket):
+        s = self._doc["history"].get(series)
+        return s[period].get(bucket) if s is not None else None
+
+    def _put_rollup(self, series, period, bucket, row):
+        s = self._series(series)
+        rows, keys = s[period], s["keys"][period]
+        old = rows.get(bucket)
+        rows[bucket] = row
+        if old is None:
+            bisect.insort(keys, bucket)
+
+            def undo():
+                rows.pop(bucket, None)
+                keys.remove(bucket)
+        else:
+            def undo():
+                rows[bucket] = old
+        self._undo.append(undo)
+
+    def rollups(self, series, period, first, last):
+        """[(bucket, row), ...] for first <= bucket <= last."""
+        s = self._doc["history"].get(series)
+        if s is None:
+            return []
+        keys = s["keys"][period]
+        lo, hi = bisect.bisect_left(keys, first), bisect.bisect_right(keys, last)
+        return [(b, s[period][b]) for b in keys[lo:hi]]
+
+    def rollup_before(self, series, period, bucket):
+        """The latest row before ``bucket``, or None."""
+        s = self._doc["history"].get(series)
+        if s is None:
+            return None
+        keys = s["keys"][period]
+        i = bisect.bisect_left(keys, bucket)
+        return s[period][keys[i - 1]] if i else None
+
+    def series(self):
+        """Names of the patient's time series."""
+        return sorted(self._doc["history"])
+
+    def events(self, series, first_day, last_day):
+        """Raw (timestamp, value) events between two day ordinals."""
+        return [e for _, events in self.day_events(series, first_day, last_day) for e in events]
+
+    def day_events(self, series, first_day, last_day):
+        """[(day, [(timestamp, value), ...]), ...] between two day ordinals."""
+        return [(day, history.unpack(self._doc["history"][series]["events"][day]))
+                for day, _ in self.rollups(series, DAY, first_day, last_day)]
+
+    def _put_summary(self, group, body):
+        self._undo.append(self._summaries.put(self._user, group, body))
+
+    def _rollback(self):
+        while self._undo:
+            self._undo.pop()()
+
+
+class _SummaryIndex:
+    """username -> (group, body), plus group -> {usernames}."""
+
+    def __init__(self):
+        self.rows = {}
+        self.groups = {}
+
+    def put(self, username, group, body):
+        """Store a row; returns a function that undoes it."""
+        old = self.rows.get(username)
+        self._set(username, (group, body))
+        return lambda: self._set(username, old)
+
+    def _set(self, username, row):
+        old = self.rows.pop(username, None)
+        if old is not None:
+            self.groups.get(old[0], set()).discard(username)
+        if row is not None:
+            self.rows[username] = row
+            self.groups.setdefault(row[0], set()).add(username)
+
+
+class MemoryStore(_StoreBase):
+    """Process-local store; data is lost on restart. Use for tests only."""
+
+    def __init__(self, derived=None):
+        self.derived = derived or Derived()
+        self._db = {}
+        self._refs = {}
+        self._summary_index = _SummaryIndex()
+        self._buckets = {}  # key -> [tokens, at, full_at]
+        self._takes = 0
+        self._lock = threading.RLock()
+        self._listeners = []
+
+    def exists(self, username):
+        return username in self._db
+
+    def usernames(self, after=None, limit=None):
+        """Usernames in order; ``after``/``limit`` page through them."""
+        with self._lock:
+            names = sorted(self._db)
+        i = bisect.bisect_right(names, after) if after is not None else 0
+        return names[i:i + limit] if limit is not None else names[i:]
+
+    def summaries(self, group):
+        """[(username, body), ...] for everyone whose summary is in ``group``.
+
+        Bodies are shared with the store (it replaces them, never edits them),
+        so treat them as read-only.
+        """
+        with self._lock:
+            rows = self._summary_index.rows
+            return [(u, rows[u][1]) for u in self._summary_index.groups.get(group, ())]
+
+    def create(self, username, doc):
+        """Insert ``doc`` for ``username`` unless it exists. True if created."""
+        with self._lock:
+            if username in self._db:
+                return False
+            kinds, counts, index, order, terms = {}, {}, {}, {}, {}
+            seq = 0
+            for kind in KINDS:
+                kinds[kind], index[kind], order[kind], terms[kind] = {}, [], (array("q"), []), {}
+                for rec in _oldest_first(kind, doc.get(kind, [])):
+                    seq += 1
+                    packed = records.pack(kind, rec, seq)
+                    rid = _record_key(packed)
+                    kinds[kind][rid] = packed
+                    self.derived.count_changes(counts, kind, None, packed)
+                    key = self.derived.sort_key(kind, packed)
+                    if key is not None:
+                        index[kind].append((key, seq, rid))
+                    order[kind][0].append(seq)
+                    order[kind][1].append(rid)
+                    for token in self.derived.terms(kind, packed):
+                        terms[kind].setdefault(token, array("q")).append(seq)
+                index[kind].sort()
+            self._db[username] = {
+                "fields": {k: v for k, v in doc.items() if k not in KINDS},
+                "kinds": kinds,
+                "counters": counts,
+                "sorted": index,
+                "order": order,
+                "terms": terms,
+                "history": {},
+                "seq": seq,
+                "version": 1,
+            }
+            tx = _MemoryTxn(self._db[username], self._refs, self.derived, self._summary_index, username)
+            tx._dirty = True
+            tx._summarize()
+            return True
+
+    def create_many(self, docs, fill=None):
+        """``create`` each (username, doc) in one go, then ``fill(username, tx)``
+        for every new patient (history, reference counts). All or nothing;
+        returns the usernames created."""
+        created, txs = [], []
+        with self._lock:
+            try:
+                for username, doc in docs:
+                    if not self.create(username, doc):
+                        continue
+                    created.append(username)
+                    if fill is not None:
+                        tx = _MemoryTxn(self._db[username], self._refs, self.derived, self._summary_index, username)
+                        txs.append(tx)
+                        fill(username, tx)
+                        tx._summarize()
+            except BaseException:
+                for tx in reversed(txs):
+                    tx._rollback()
+                    tx._rolled_back()
+                for username in created:
+                    del self._db[username]
+                    self._summary_index._set(username, None)
+                raise
+        for tx in txs:
+            tx._committed()
+        return created
+
+    def _take(self, key, rate, burst, cost, now):
+        with self._lock:
+            tokens = _bucket_level(self._buckets.get(key), now, rate, burst)
+            if tokens < cost:
+                return False, (cost - tokens) / rate
+            tokens -= cost
+            self._buckets[key] = [tokens, now, now + (burst - tokens) / rate]
+        return True, 0.0
+
+    def _prune_buckets(self, now):
+        with self._lock:
+            self._buckets = {k: b for k, b in self._buckets.items() if b[2] > now}
+
+    @contextmanager
+    def transaction(self, username, expected_version=None, readonly=False):
+        with self._lock:
+            if username not in self._db:
+                raise KeyError(username)
+            tx = _MemoryTxn(self._db[username], self._refs, self.derived, self._summary_index, username)
+            if expected_version is not None and tx.version != expected_version:
+                raise ConflictError(username, expected_version, tx.version)
+            try:
+                yield tx
+                tx._summarize()
+            except BaseException:
+                tx._rollback()
+                tx._rolled_back()
+                raise
+        tx._committed()
+        self._notify(username, tx)
+
+
+# ----------------- SQLite backend -----------------
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    username TEXT    PRIMARY KEY,
+    fields   TEXT    NOT NULL,
+    version  INTEGER NOT NULL DEFAULT 1,
+    counters TEXT    NOT NULL DEFAULT '{}'
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS records (
+    username TEXT    NOT NULL,
+    kind     TEXT    NOT NULL,
+    id       TEXT    NOT NULL,
+    seq      INTEGER NOT NULL,
+    body     TEXT    NOT NULL,
+    sort_key TEXT,
+    PRIMARY KEY (username, kind, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS records_by_seq ON records (username, kind, seq);
+-- Search index (Derived.search): one row per record and distinct token.
+CREATE TABLE IF NOT EXISTS terms (
+    username TEXT NOT NULL,
+    kind     TEXT NOT NULL,
+    token    TEXT NOT NULL,
+    id       TEXT NOT NULL,
+    PRIMARY KEY (username, kind, token, id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS refcounts (
+    key TEXT    PRIMARY KEY,
+    n   INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS history (
+    username TEXT    NOT NULL,
+    series   TEXT    NOT NULL,
+    day      INTEGER NOT NULL,
+    events   BLOB    NOT NULL,  -- packed float64 (timestamp, value) pairs
+    PRIMARY KEY (username, series, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollups (
+    username       TEXT    NOT NULL,
+    series         TEXT    NOT NULL,
+    period         TEXT    NOT NULL,  -- 'd' (day ordinal) | 'w' (week number)
+    bucket         INTEGER NOT NULL,
+    n              INTEGER NOT NULL,
+    total          REAL    NOT NULL,
+    last           REAL    NOT NULL,
+    days           INTEGER NOT NULL,
+    day_last_total REAL    NOT NULL,
+    PRIMARY KEY (username, series, period, bucket)
+) WITHOUT ROWID;
+-- rev changes on every write (REPLACE deletes and re-inserts), so readers can
+-- keep decoded bodies and only fetch the ones that moved.
+CREATE TABLE IF NOT EXISTS summaries (
+    rev      INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL UNIQUE,
+    grp      TEXT,
+    body     TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS summaries_by_grp ON summaries (grp, username, rev);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+) WITHOUT ROWID;
+-- Token buckets (store.take_tokens); a row is dropped once full_at passes.
+CREATE TABLE IF NOT EXISTS buckets (
+    key     TEXT PRIMARY KEY,
+    tokens  REAL NOT NULL,
+    at      REAL NOT NULL,
+    full_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+# Columns added after the first release, for databases created before them.
+_MIGRATIONS = (
+    ("patients", "version", "INTEGER NOT NULL DEFAULT 1"),
+    ("patients", "counters", "TEXT NOT NULL DEFAULT '{}'"),
+    ("records", "sort_key", "TEXT"),
+)
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS records_by_key ON records (username, kind, sort_key, seq)
+    WHERE sort_key IS NOT NULL;
+"""
+
+
+def _dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+class _SQLiteTxn(_TxnBase):
+    def __init__(self, conn, username, version, derived):
+        self._conn = conn
+        self._user = username
+        self._derived = derived
+        self._dirty = False
+        self._counts = None
+        self._counts_dirty = False
+        self.version = version
+        self._init_changes()
+
+    def _changed(self):
+        if not self._dirty:
+            self._dirty = True
+            self.version += 1
+            self._conn.execute(
+                "UPDATE patients SET version = ? WHERE username = ?", (self.version, self._user))
+
+    def _count(self, kind, old, new):
+        if self._derived.count_changes(self.counters(), kind, old, new):
+            self._counts_dirty = True
+
+    def _flush(self):
+        self._summarize()
+        if self._counts_dirty:
+            self._conn.execute("UPDATE patients SET counters = ? WHERE username = ?",
+                               (_dumps(self._counts), self._user))
+            self._counts_dirty = False
+
+    def load(self, skip=()):
+        """Everything, as one dict; kinds in ``skip`` are left empty."""
+        out = self.fields()
+        for kind in KINDS:
+            out[kind] = []
+        rows = self._conn.execute(
+            "SELECT kind, body FROM records WHERE username = ? AND kind NOT IN "
+            f"({','.join('?' * len(skip))}) ORDER BY kind, seq", (self._user, *skip))
+        for kind, body in rows:
+            out[kind].append(json.loads(body))
+        for kind in NEWEST_FIRST:
+            out[kind].reverse()
+        return out
+
+    def fields(self):
+        row = self._conn.execute(
+            "SELECT fields FROM patients WHERE username = ?", (self._user,)).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def counters(self):
+        if self._counts is None:
+            row = self._conn.execute(
+                "SELECT counters FROM patients WHERE username = ?", (self._user,)).fetchone()
+            self._counts = json.loads(row[0]) if row else {}
+        return self._counts
+
+    def get(self, kind, rid):
+        row = self._conn.execute(
+            "SELECT body FROM records WHERE username = ? AND kind = ? AND id = ?",
+            (self._user, kind, rid)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def head(self, kind, n):
+        """First ``n`` records in display order."""
+        order = "DESC" if kind in NEWEST_FIRST else "ASC"
+        rows = self._conn.execute(
+            f"SELECT body FROM records WHERE username = ? AND kind = ? ORDER BY seq {order} LIMIT ?",
+            (self._user, kind, n))
+        return [json.loads(body) for (body,) in rows]
+
+    def iter_sorted(self, kind, start=None):
+        """Records with a sort key, in key order, from ``start`` on."""
+        rows = self._conn.execute(
+            "SELECT body FROM records WHERE username = ? AND kind = ? AND sort_key >= ? "
+            "ORDER BY sort_key, seq", (self._user, kind, start if start is not None else ""))
+        for (body,) in rows:
+            yield json.loads(body)
+
+    def count_sorted(self, kind, start, stop=None):
+        """Number of records with ``start <= sort key < stop``."""
+        sql = "SELECT COUNT(*) FROM records WHERE username = ? AND kind = ? AND sort_key >= ?"
+        args = (self._user, kind, start)
+        if stop is not None:
+            sql, args = sql + " AND sort_key < ?", args + (stop,)
+        (n,) = self._conn.execute(sql, args).fetchone()
+        return n
+
+    def page(self, kind, limit, cursor=None):
+        """Up to ``limit`` records in display order after ``cursor``, and the next cursor."""
+        return self._page(kind, limit, cursor)
+
+    def search(self, kind, query, limit, cursor=None):
+        """Like ``page``, for the records containing every word of ``query``."""
+        words = _query_tokens(query)
+        if not words:
+            return [], None
+        groups = [[w] for w in words[:-1]] + [self._expand(kind, words[-1])]
+        if not groups[-1]:
+            return [], None
+        # Walking the records in order and probing each word suits common
+        # words; a rare one is cheaper to start from and sort.
+        sizes = [self._postings(kind, g) for g in groups]
+        rarest = sizes.index(min(sizes))
+        ids = None
+        if sizes[rarest] <= RARE_POSTINGS:
+            ids = self._terms_sql("SELECT DISTINCT id FROM terms", kind, groups.pop(rarest))
+        where, args = "", []
+        for tokens in groups:
+            marks = ", ".join("?" * len(tokens))
+            where += (" AND EXISTS (SELECT 1 FROM terms WHERE terms.username = records.username"
+                      f" AND terms.kind = records.kind AND terms.token IN ({marks}) AND terms.id = records.id)")
+            args += tokens
+        return self._page(kind, limit, cursor, where, args, ids)
+
+    def _expand(self, kind, prefix):
+        """The indexed words starting with ``prefix``, one index seek each."""
+        found, start = [], prefix
+        sql = ("SELECT token FROM terms WHERE username = ? AND kind = ? AND token >= ? AND token < ? "
+               "ORDER BY token LIMIT 1")
+        while True:
+            row = self._conn.execute(sql, (self._user, kind, start, prefix + "\U0010ffff")).fetchone()
+            if row is None:
+                return found
+            found.append(row[0])
+            start = row[0] + "\0"
+
+    def _terms_sql(self, select, kind, tokens):
+        marks = ", ".join("?" * len(tokens))
+        return f"{select} WHERE username = ? AND kind = ? AND token IN ({marks})", [self._user, kind, *tokens]
+
+    def _postings(self, kind, tokens):
+        """Postings of ``tokens``, counted no further than ``RARE_POSTINGS + 1``."""
+        sql, args = self._terms_sql("SELECT 1 FROM terms", kind, tokens)
+        (n,) = self._conn.execute(f"SELECT COUNT(*) FROM ({sql} LIMIT ?)", args + [RARE_POSTINGS + 1]).fetchone()
+        return n
+
+    def _page(self, kind, limit, cursor, where="", args=(), ids=None):
+        """``ids``: (sql, args) selecting the candidate ids, when that side is smaller."""
+        desc = kind in NEWEST_FIRST
+        if ids is None:
+            sql, params = "SELECT seq, body FROM records WHERE username = ? AND kind = ?", [self._user, kind]
+        else:
+            sql = (f"SELECT seq, body FROM ({ids[0]}) AS m CROSS JOIN records"
+                   " ON records.username = ? AND records.kind = ? AND records.id = m.id WHERE 1")
+            params = [*ids[1], self._user, kind]
+        sql += where
+        params += args
+        if cursor is not None:
+            sql += " AND seq < ?" if desc else " AND seq > ?"
+            params.append(cursor)
+        rows = self._conn.execute(f"{sql} ORDER BY seq {'DESC' if desc else 'ASC'} LIMIT ?", params + [limit + 1])
+        return _paged([(seq, json.loads(body)) for seq, body in rows], limit)
+
+    def _index_terms(self, kind, rid, old, new):
+        t_old, t_new = self._derived.terms(kind, old), self._derived.terms(kind, new)
+        if t_old - t_new:
+            self._conn.executemany(
+                "DELETE FROM terms WHERE username = ? AND kind = ? AND token = ? AND id = ?",
+                [(self._user, kind, t, rid) for t in t_old - t_new])
+        if t_new - t_old:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO terms (username, kind, token, id) VALUES (?, ?, ?, ?)",
+                [(self._user, kind, t, rid) for t in t_new - t_old])
+
+    def add(self, kind, rec):
+        self._changed()
+        prev = self.get(kind, _record_id(rec))
+        (seq,) = self._conn.execute(
+            "SELECT COALESCE(MAX(seq), 0) + 1 FROM records WHERE username = ? AND kind = ?",
+            (self._user, kind)).fetchone()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO records (username, kind, id, seq, body, sort_key) VALUES (?, ?, ?, ?, ?, ?)",
+            (self._user, kind, _record_id(rec), seq, _dumps(rec), self._derived.sort_key(kind, rec)))
+        self._count(kind, prev, rec)
+        self._index_terms(kind, _record_id(rec), prev, rec)
+        self.changes[(kind, _record_id(rec))] = dict(rec)
+        return dict(rec)
+
+    def update(self, kind, rid, **changes):
+        old = self.get(kind, rid)
+        if old is None:
+            return None
+        rec = {**old, **changes}
+        self._changed()
+        self._conn.execute(
+            "UPDATE records SET body = ?, sort_key = ? WHERE username = ? AND kind = ? AND id = ?",
+            (_dumps(rec), self._derived.sort_key(kind, rec), self._user, kind, rid))
+        self._count(kind, old, rec)
+        self._index_terms(kind, rid, old, rec)
+        self.changes[(kind, rid)] = dict(rec)
+        return rec
+
+    def delete(self, kind, rid):
+        rec = self.get(kind, rid)
+        if rec is None:
+            return None
+        self._changed()
+        self._conn.execute(
+            "DELETE FROM records WHERE username = ? AND kind = ? AND id = ?",
+            (self._user, kind, rid))
+        self._count(kind, rec, None)
+        self._index_terms(kind, rid, rec, None)
+        self.changes[(kind, rid)] = None
+        return rec
+
+    def _append_events(self, series, day, buf):
+        row = self._conn.execute(
+            "SELECT events FROM history WHERE username = ? AND series = ? AND day = ?",
+            (self._user, series, day)).fetchone()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO history (username, series, day, events) VALUES (?, ?, ?, ?)",
+            (self._user, series, day, (row[0] if row else b"") + buf.tobytes()))
+
+    def _rollup(self, series, period, bucket):
+        return self._conn.execute(
+            "SELECT n, total, last, days, day_last_total FROM rollups "
+            "WHERE username = ? AND series = ? AND period = ? AND bucket = ?",
+            (self._user, series, period, bucket)).fetchone()
+
+    def _put_rollup(self, series, period, bucket, row):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO rollups (username, series, period, bucket, n, total, last, days, day_last_total) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", (self._user, series, period, bucket) + tuple(row))
+
+    def rollups(self, series, period, first, last):
+        """[(bucket, row), ...] for first <= bucket <= last."""
+        rows = self._conn.execute(
+            "SELECT bucket, n, total, last, days, day_last_total FROM rollups "
+            "WHERE username = ? AND series = ? AND period = ? AND bucket BETWEEN ? AND ? ORDER BY bucket",
+            (self._user, series, period, first, last))
+        return [(r[0], r[1:]) for r in rows]
+
+    def rollup_before(self, series, period, bucket):
+        """The latest row before ``bucket``, or None."""
+        return self._conn.execute(
+            "SELECT n, total, last, days, day_last_total FROM rollups "
+            "WHERE username = ? AND series = ? AND period = ? AND bucket < ? ORDER BY bucket DESC LIMIT 1",
+            (self._user, series, period, bucket)).fetchone()
+
+    def series(self):
+        """Names of the patient's time series."""
+        rows = self._conn.execute(
+            "SELECT DISTINCT series FROM rollups WHERE username = ? ORDER BY series", (self._user,))
+        return [r[0] for r in rows]
+
+    def events(self, series, first_day, last_day):
+        """Raw (timestamp, value) events between two day ordinals."""
+        return [e for _, events in self.day_events(series, first_day, last_day) for e in events]
+
+    def day_events(self, series, first_day, last_day):
+        """[(day, [(timestamp, value), ...]), ...] between two day ordinals."""
+        rows = self._conn.execute(
+            "SELECT day, events FROM history WHERE username = ? AND series = ? AND day BETWEEN ? AND ? ORDER BY day",
+            (self._user, series, first_day, last_day))
+        return [(day, history.unpack(blob)) for day, blob in rows]
+
+    def _put_summary(self, group, body):
+        self._conn.execute("INSERT OR REPLACE INTO summaries (username, grp, body) VALUES (?, ?, ?)",
+                           (self._user, group, _dumps(body)))
+
+    def adjust_ref(self, key, delta):
+        row = self._conn.execute("SELECT n FROM refcounts WHERE key = ?", (key,)).fetchone()
+        n = max(0, (row[0] if row else 0) + delta)
+        if n:
+            self._conn.execute("INSERT OR REPLACE INTO refcounts (key, n) VALUES (?, ?)", (key, n))
+        else:
+            self._conn.execute("DELETE FROM refcounts WHERE key = ?", (key,))
+        return n
+
+    def set_fields(self, **fields):
+        merged = self.fields()
+        merged.update(fields)
+        self._changed()
+        self._conn.execute(
+            "UPDATE patients SET fields = ? WHERE username = ?", (_dumps(merged), self._user))
+        self.fields_changed = True
+
+
+class SQLiteStore(_StoreBase):
+    """Durable store backed by a single SQLite file in WAL mode.
+
+    Safe to share between gunicorn workers: each process keeps its own pool
+    of connections (one per concurrent thread or greenlet), writers
+    serialise on SQLite's file lock, and readers never block them thanks to
+    WAL.
+
+    Opening the store migrates it (``migrate``) unless ``migrate=False``.
+    When the ``derived`` spec's version has changed that is a rebuild over
+    every patient; ``flask migrate-store`` (run by gunicorn.conf.py before
+    the workers start) does it once instead of at the first worker's start.
+    """
+
+    def __init__(self, path, derived=None, timeout=5.0, cooperative=False, migrate=True,
+                 migrate_timeout=600.0):
+        self.path = path
+        self.derived = derived or Derived()
+        self.timeout = timeout
+        self.cooperative = cooperative
+        self.migrate_timeout = migrate_timeout
+        self._idle = []  # pooled connections of process _idle_pid
+        self._idle_pid = os.getpid()
+        self._listeners = []
+        self._summary_cache = {}  # username -> (rev, decoded body)
+        self._takes = 0
+        if migrate:
+            self.migrate()
+
+    def migrate(self):
+        """Create or upgrade the tables, and rebuild the derived data if it was
+        built by another ``derived.version``. Returns True if it rebuilt.
+
+        Any number of processes may open the store at once: the rebuild runs
+        under the write lock and rechecks the version there, so the first one
+        does it and the others wait for it (up to ``migrate_timeout``), then
+        find nothing left to do.
+        """
+        with self._connection() as conn:
+            conn.executescript(_SCHEMA)
+            for table, column, decl in _MIGRATIONS:
+                cols = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+                if column not in cols:
+                    try:
+                        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+                    except sqlite3.OperationalError as exc:
+                        if "duplicate column" not in str(exc):  # else another process added it
+                            raise
+            conn.executescript(_INDEXES)
+            if self._derived_current(conn):
+                return False
+        return self._rebuild_derived()
+
+    def _derived_current(self, conn):
+        row = conn.execute("SELECT value FROM meta WHERE key = 'derived_version'").fetchone()
+        return row is not None and row[0] == str(self.derived.version)
+
+    def _open(self):
+        parent = os.path.dirname(self.path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=self.timeout,
+                               isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.timeout * 1000)}")
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        # A connection must never cross a fork (gunicorn --preload), so the
+        # pool is dropped in a new process.
+        if self._idle_pid != os.getpid():
+            self._idle, self._idle_pid = [], os.getpid()
+        idle = self._idle
+        try:
+            conn = idle.pop()
+        except IndexError:
+            conn = self._open()
+        try:
+            yield conn
+        finally:
+            idle.append(conn)
+
+    def _begin_immediate(self, conn, timeout=None):
+        """Take the write lock, polling with time.sleep (gevent-friendly)."""
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        delay = 0.001
+        conn.execute("PRAGMA busy_timeout=0")
+        try:
+            while True:
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                    return
+                except sqlite3.OperationalError as exc:
+                    if "locked" not in str(exc) or time.monotonic() >= deadline:
+                        raise
+                time.sleep(delay)
+                delay = min(delay * 2, 0.05)
+        finally:
+            conn.execute(f"PRAGMA busy_timeout={int(self.timeout * 1000)}")
+
+    @contextmanager
+    def _write(self, readonly=False, timeout=None):
+        with self._connection() as conn:
+            if readonly:
+                conn.execute("BEGIN")
+            elif self.cooperative or timeout is not None:
+                self._begin_immediate(conn, timeout)
+            else:
+                conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _rebuild_derived(self):
+        """Recompute counters, sort keys, search terms and summaries for everyone
+        (spec changed). Returns False if another process got there first."""
+        with self._write(timeout=self.migrate_timeout) as conn:
+            if self._derived_current(conn):
+                return False
+            usernames = [u for (u,) in conn.execute("SELECT username FROM patients").fetchall()]
+            conn.execute("DELETE FROM terms")
+            for username in usernames:
+                counts = {}
+                rows = conn.execute("SELECT kind, id, body FROM records WHERE username = ?",
+                                    (username,)).fetchall()
+                for kind, rid, body in rows:
+                    rec = json.loads(body)
+                    self.derived.count_changes(counts, kind, None, rec)
+                    conn.execute(
+                        "UPDATE records SET sort_key = ? WHERE username = ? AND kind = ? AND id = ?",
+                        (self.derived.sort_key(kind, rec), username, kind, rid))
+                    conn.executemany("INSERT INTO terms (username, kind, token, id) VALUES (?, ?, ?, ?)",
+                                     [(username, kind, t, rid) for t in self.derived.terms(kind, rec)])
+                conn.execute("UPDATE patients SET counters = ? WHERE username = ?",
+                             (_dumps(counts), username))
+            for username in usernames:
+                self._summarize_now(conn, username)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('derived_version', ?)",
+                         (str(self.derived.version),))
+        return True
+
+    def exists(self, username):
+        with self._connection() as conn:
+            row = conn.execute("SELECT 1 FROM patients WHERE username = ?", (username,)).fetchone()
+        return row is not None
+
+    def usernames(self, after=None, limit=None):
+        """Usernames in order; ``after``/``limit`` page through them."""
+        with self._connection() as conn:
+            rows = conn.execute("SELECT username FROM patients WHERE username > ? ORDER BY username LIMIT ?",
+                                (after if after is not None else "", limit if limit is not None else -1)).fetchall()
+        return [r[0] for r in rows]
+
+    def create(self, username, doc):
+        """Insert ``doc`` for ``username`` unless it exists. True if created."""
+        with self._write() as conn:
+            return self._insert(conn, username, doc)
+
+    def create_many(self, docs, fill=None):
+        """``create`` each (username, doc) in one write transaction, then
+        ``fill(username, tx)`` for every new patient (history, reference
+        counts) in the same one. All or nothing; returns the usernames created."""
+        created, txs = [], []
+        try:
+            with self._write() as conn:
+                for username, doc in docs:
+                    if not self._insert(conn, username, doc):
+                        continue
+                    created.append(username)
+                    if fill is not None:
+                        tx = _SQLiteTxn(conn, username, 1, self.derived)
+                        txs.append(tx)
+                        fill(username, tx)
+                        tx._flush()
+        except BaseException:
+            for tx in reversed(txs):
+                tx._rolled_back()
+            raise
+        for tx in txs:
+            tx._committed()
+        return created
+
+    def _insert(self, conn, username, doc):
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO patients (username, fields) VALUES (?, ?)",
+            (username, _dumps({k: v for k, v in doc.items() if k not in KINDS})))
+        if cur.rowcount == 0:
+            return False
+        counts = {}
+        for kind in KINDS:
+            recs = _oldest_first(kind, doc.get(kind, []))
+            for rec in recs:
+                self.derived.count_changes(counts, kind, None, rec)
+            conn.executemany(
+                "INSERT INTO records (username, kind, id, seq, body, sort_key) VALUES (?, ?, ?, ?, ?, ?)",
+                [(username, kind, _record_id(r), seq, _dumps(r), self.derived.sort_key(kind, r))
+                 for seq, r in enumerate(recs, 1)])
+            conn.executemany(
+                "INSERT OR IGNORE INTO terms (username, kind, token, id) VALUES (?, ?, ?, ?)",
+                [(username, kind, t, _record_id(r)) for r in recs for t in self.derived.terms(kind, r)])
+        conn.execute("UPDATE patients SET counters = ? WHERE username = ?", (_dumps(counts), username))
+        self._summarize_now(conn, username)
+        return True
+
+    def _summarize_now(self, conn, username):
+        tx = _SQLiteTxn(conn, username, None, self.derived)
+        tx._dirty = True
+        tx._summarize()
+
+    def summaries(self, group):
+        """[(username, body), ...] for everyone whose summary is in ``group``.
+
+        Only bodies written since this process last read them are fetched and
+        decoded; treat them as read-only.
+        """
+        cache = self._summary_cache
+        with self._connection() as conn:
+            revs = conn.execute("SELECT username, rev FROM summaries WHERE grp IS ?", (group,)).fetchall()
+            stale = [u for u, rev in revs if cache.get(u, (None,))[0] != rev]
+            for i in range(0, len(stale), 500):
+                chunk = stale[i:i + 500]
+                for u, rev, body in conn.execute(
+                        f"SELECT username, rev, body FROM summaries WHERE grp IS ? AND username IN "
+                        f"({','.join('?' * len(chunk))})", [group] + chunk):
+                    cache[u] = (rev, json.loads(body))
+        # a patient moved out of the group between the two reads is left out
+        return [(u, cache[u][1]) for u, rev in revs if u in cache and cache[u][0] >= rev]
+
+    def _take(self, key, rate, burst, cost, now):
+        with self._write() as conn:
+            row = conn.execute("SELECT tokens, at FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = _bucket_level(row, now, rate, burst)
+            if tokens < cost:
+                return False, (cost - tokens) / rate
+            tokens -= cost
+            conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, at, full_at) VALUES (?, ?, ?, ?)",
+                         (key, tokens, now, now + (burst - tokens) / rate))
+        return True, 0.0
+
+    def _prune_buckets(self, now):
+        with self._write() as conn:
+            conn.execute("DELETE FROM buckets WHERE full_at <= ?", (now,))
+
+    @contextmanager
+    def transaction(self, username, expected_version=None, readonly=False):
+        # Write transactions take the lock up front (BEGIN IMMEDIATE), so the
+        # version check below and the writes that follow are atomic.
+        tx = None
+        try:
+            with self._write(readonly) as conn:
+                row = conn.execute("SELECT version FROM patients WHERE username = ?", (username,)).fetchone()
+                if row is None:
+                    raise KeyError(username)
+                if expected_version is not None and row[0] != expected_version:
+                    raise ConflictError(username, expected_version, row[0])
+                tx = _SQLiteTxn(conn, username, row[0], self.derived)
+                yield tx
+                tx._flush()
+        except BaseException:
+            if tx is not None:
+                tx._rolled_back()
+            raise
+        tx._committed()
+        self._notify(username, tx)
+
+
+def open_store(backend, path=None, derived=None, cooperative=False):
+    """Build the configured backend: ``"sqlite"`` (default) or ``"memory"``."""
+    if backend == "memory":
+        return MemoryStore(derived)
+    if backend == "sqlite":
+        return SQLiteStore(path, derived, cooperative=cooperative)
+    raise ValueError(f"unknown patient store backend: {backend!r}")
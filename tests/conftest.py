@@ -0,0 +1,36 @@
+"""Shared fixtures: the app on a throwaway store, with nothing shared or outbound."""
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+_TMP = tempfile.mkdtemp(prefix="tests-")
+for key, value in {
+    "PATIENT_STORE": "memory",
+    "RECAPTCHA_SECRET_KEY": "",
+    "ADMISSION_CONTROL": "0",
+    "METRICS_DIR": "",
+    "THUMBNAIL_WORKERS": "0",
+    "WARM_UP": "0",
+    "ASSET_CACHE_DIR": os.path.join(_TMP, "assets"),
+    "JINJA_CACHE_DIR": os.path.join(_TMP, "jinja"),
+}.items():
+    os.environ.setdefault(key, value)
+
+
+@pytest.fixture
+def webapp():
+    import app as webapp
+    webapp.create_app()
+    return webapp
+
+
+@pytest.fixture
+def patient(webapp):
+    """Test client logged in as the demo patient."""
+    client = webapp.app.test_client()
+    r = client.post("/login", data={"username": "patient", "password": "pass123"})
+    assert r.status_code == 302
+    return client
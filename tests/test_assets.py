@@ -0,0 +1,66 @@
+"""Fingerprinted static URLs never reach outside static/ or hash non-files."""
+import hashlib
+import os
+
+import pytest
+from flask import Response
+from werkzeug.test import EnvironBuilder
+
+from assets import AssetManifest, fingerprint
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def _fallback(filename):
+    return "fallback", filename
+
+
+def _send(manifest, filename):
+    request = EnvironBuilder(path="/static/" + filename).get_request()
+    return manifest.send(request, Response, filename, _fallback)
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    root = tmp_path / "static"
+    root.mkdir()
+    (root / "site.css").write_text("body { color: red }")
+    (tmp_path / "secret.txt").write_text("not for you")
+    m = AssetManifest(str(root), str(tmp_path / "cache"))
+    m.load()
+    return m
+
+
+def test_fingerprinted_file_is_served(manifest):
+    rv = _send(manifest, manifest.url("site.css"))
+    assert isinstance(rv, Response) and rv.status_code == 200
+    assert "immutable" in rv.headers["Cache-Control"]
+
+
+def test_traversal_falls_through(manifest, tmp_path):
+    digest = hashlib.sha256(b"not for you").hexdigest()
+    for name in ("../secret.txt", "a/../../secret.txt", "/etc/../" + str(tmp_path / "secret.txt")):
+        assert _send(manifest, fingerprint(name, digest))[0] == "fallback"
+    assert set(manifest._files) == {"site.css"}
+
+
+def test_non_regular_files_are_never_hashed(manifest, tmp_path):
+    root = tmp_path / "static"
+    os.symlink("/dev/zero", root / "zero.bin")
+    os.mkfifo(root / "pipe.txt")
+    assert _send(manifest, "zero.aaaaaaaaaaaa.bin")[0] == "fallback"
+    assert _send(manifest, "pipe.aaaaaaaaaaaa.txt")[0] == "fallback"
+    assert manifest.url("zero.bin") == "zero.bin"
+    assert manifest.url("pipe.txt") == "pipe.txt"
+    assert manifest.load() == (1, 0)
+
+
+def test_app_static_traversal_is_404(webapp):
+    client = webapp.app.test_client()
+    with open(os.path.join(ROOT, "app.py"), "rb") as fh:
+        digest = hashlib.sha256(fh.read()).hexdigest()
+    for name in ("../app.py", "%2e%2e/app.py", "..%2fapp.py"):
+        rv = client.get("/static/" + fingerprint(name, digest))
+        assert rv.status_code == 404, name
+    assert client.get("/static/../../../../dev/zero.aaaaaaaaaaaa").status_code == 404
+    assert not any(rel.startswith("..") or rel.startswith("/") for rel in webapp.ASSETS._files)
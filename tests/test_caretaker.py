@@ -0,0 +1,22 @@
+"""The caretaker summary's next reminder doesn't run out between writes."""
+from datetime import datetime
+
+from records import new_id
+from storage import MemoryStore
+
+
+def test_next_reminder_after_the_first_few_pass(webapp, monkeypatch):
+    class Clock(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime(2030, 1, 1, 9, 0, tzinfo=tz)
+
+    store = MemoryStore(webapp.PATIENT_DERIVED)
+    monkeypatch.setattr(webapp, "datetime", Clock)
+    store.create("pat", {"caretaker": "carer", "reminders": [
+        {"id": new_id(), "title": f"at {h}", "dt": f"2030-01-01T{h:02d}:00", "kind": "general", "active": True}
+        for h in range(10, 20)]})
+    (username, summary), = store.summaries("carer")
+    later = ("2030-01-01", "18:30", "2030-01-01T18:30")
+    assert webapp._summary_next(summary, later) == ["2030-01-01T19:00", "at 19"]
+    assert webapp._summary_next(summary, ("2030-01-01", "20:00", "2030-01-01T20:00")) is None
@@ -0,0 +1,30 @@
+"""Metric labels stay within fixed sets; dead workers' snapshots aren't summed."""
+import json
+import os
+import subprocess
+import sys
+
+from metrics import Registry
+
+
+def test_unknown_methods_share_one_series(webapp):
+    client = webapp.app.test_client()
+    for i in range(50):
+        client.open("/", method=f"BOGUS{i}")
+    client.get("/")
+    methods = {labels[1] for labels in webapp.HTTP_LATENCY._values}
+    assert methods <= webapp.HTTP_METHODS | {"other"}
+    assert "other" in methods
+
+
+def test_dead_workers_snapshots_are_dropped(tmp_path):
+    reg = Registry(share_dir=str(tmp_path))
+    hits = reg.counter("hits_total", "test")
+    hits.inc()
+    dead = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"],
+                          capture_output=True, text=True).stdout.strip()
+    (tmp_path / f"{dead}.json").write_text(json.dumps({"hits_total": [[[], 1000]]}))
+    assert "hits_total 1\n" in reg.render()
+    assert not (tmp_path / f"{dead}.json").exists()
+    reg.forget(os.getpid())
+    assert not (tmp_path / f"{os.getpid()}.json").exists()
@@ -0,0 +1,21 @@
+import re
+
+
+def _note(client, text):
+    r = client.post("/patient/action", data={"action": "set_mood_and_note", "mood": "🙂 Calm", "note": text})
+    assert r.status_code == 302
+
+
+def test_mood_page_pages_and_searches_notes(patient, webapp):
+    for i in range(webapp.NOTES_PAGE_SIZE + 3):
+        _note(patient, f"walked {i} in the park" if i % 2 else f"lunch {i} with family")
+    first = patient.get("/patient/mood").get_data(as_text=True)
+    assert first.count('name="note_id"') == webapp.NOTES_PAGE_SIZE
+    older = re.search(r'href="(/patient/mood\?cursor=\d+)"', first)
+    assert older, "no Older link"
+    rest = patient.get(older.group(1)).get_data(as_text=True)
+    assert rest.count('name="note_id"') == 3
+
+    found = patient.get("/patient/mood?q=park").get_data(as_text=True)
+    assert "walked 1 in the park" in found and "lunch" not in found
+    assert "No notes match" in patient.get("/patient/mood?q=zebra").get_data(as_text=True)
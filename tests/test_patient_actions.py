@@ -0,0 +1,56 @@
+import pytest
+
+
+def _batch(client, *ops, **body):
+    return client.post("/patient/actions", json={"ops": list(ops), **body})
+
+
+@pytest.mark.parametrize("value", [True, False, ["x"], {"x": 1}])
+def test_non_string_field_is_rejected(patient, value):
+    r = _batch(patient, {"action": "add_task", "task_title": "fine"}, {"action": "add_task", "task_title": value})
+    assert r.status_code == 400
+    assert r.json == {"ok": False, "error": "field task_title must be a string or a number", "op": 1}
+
+
+def test_rejected_batch_writes_nothing(patient, webapp):
+    before = webapp.PATIENT_DB.version("patient")
+    _batch(patient, {"action": "add_task", "task_title": "first"}, {"action": "add_task", "task_title": None},
+           {"action": "add_task", "task_title": 3}, {"action": "add_task", "task_title": [1]})
+    assert webapp.PATIENT_DB.version("patient") == before
+
+
+def test_numbers_and_null_become_strings(patient):
+    r = _batch(patient, {"action": "add_task", "task_title": 42}, {"action": "add_task", "task_title": None})
+    assert r.status_code == 200
+    titles = [c["record"]["title"] for c in r.json["changed"] if c["kind"] == "tasks"]
+    assert titles == ["42"]  # an empty title is refused by the handler, not the batch
+
+
+@pytest.mark.parametrize("active, expected", [(True, True), (False, False)])
+def test_checkbox_field_accepts_booleans(patient, active, expected):
+    r = _batch(patient, {"action": "add_reminder", "rem_title": "Call Anna", "rem_dt": "2030-01-01T10:00",
+                         "rem_active": active})
+    assert r.status_code == 200
+    (rec,) = [c["record"] for c in r.json["changed"] if c["kind"] == "reminders"]
+    assert rec["active"] is expected
+
+
+@pytest.mark.parametrize("body", [None, [], {"ops": []}, {"ops": "add_task"}, {"ops": [1]},
+                                  {"ops": [{"action": "nope"}]}, {"ops": [{"task_title": "x"}]},
+                                  {"ops": [{"action": {"a": 1}}]}, {"ops": [{"action": ["add_task"]}]},
+                                  {"ops": [{"action": 1}]}, {"ops": [{"action": None}]}])
+def test_malformed_batches_are_rejected(patient, body):
+    r = patient.post("/patient/actions", json=body)
+    assert r.status_code == 400
+    assert r.json["ok"] is False
+
+
+def test_unhashable_action_is_rejected_like_an_unknown_one(patient):
+    r = _batch(patient, {"action": "add_task", "task_title": "x"}, {"action": {"a": 1}})
+    assert r.status_code == 400
+    assert r.json == {"ok": False, "error": "unknown action", "op": 1}
+
+
+def test_version_must_be_an_integer(patient):
+    r = _batch(patient, {"action": "add_task", "task_title": "x"}, version=True)
+    assert r.status_code == 400
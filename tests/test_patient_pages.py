@@ -0,0 +1,15 @@
+"""Pages that show one kind only decode that kind."""
+import pytest
+
+
+@pytest.mark.parametrize("page,kind", [("/patient/meds", "meds"), ("/patient/activities", "activities")])
+def test_page_loads_only_its_kind(patient, webapp, monkeypatch, page, kind):
+    load, skipped = webapp.PATIENT_DB.load, []
+
+    def spy(username, skip=()):
+        skipped.append(set(skip))
+        return load(username, skip=skip)
+
+    monkeypatch.setattr(webapp.PATIENT_DB, "load", spy)
+    assert patient.get(page).status_code == 200
+    assert skipped == [set(webapp.KINDS) - {kind}]
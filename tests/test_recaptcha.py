@@ -0,0 +1,67 @@
+"""A solved token is good for one login: never replayed from the cache."""
+import os
+
+import requests
+
+from recaptcha import RecaptchaVerifier
+
+
+class _Session:
+    """Stands in for requests.Session: answers ``success`` and counts posts."""
+
+    def __init__(self, success=True, fail=False):
+        self.success, self.fail, self.posts = success, fail, 0
+
+    def post(self, url, data=None, timeout=None):
+        self.posts += 1
+        if self.fail:
+            raise requests.ConnectionError("down")
+        session = self
+
+        class Response:
+            def raise_for_status(self):
+                pass
+
+            def json(self):
+                return {"success": session.success}
+
+        return Response()
+
+
+def _verifier(session, **kwargs):
+    v = RecaptchaVerifier("secret", **kwargs)
+    v._session, v._session_pid = session, os.getpid()
+    return v
+
+
+def test_solved_token_is_not_replayed():
+    s = _Session()
+    v = _verifier(s)
+    assert v.verify("tok") is True
+    assert v.verify("tok") is False
+    assert s.posts == 1
+    assert v.verify("other") is True
+
+
+def test_rejected_token_is_refused_without_a_round_trip():
+    s = _Session(success=False)
+    v = _verifier(s)
+    assert v.verify("tok") is False
+    assert v.verify("tok") is False
+    assert s.posts == 1
+
+
+def test_spent_tokens_expire():
+    s = _Session()
+    v = _verifier(s, cache_ttl=-1)
+    assert v.verify("tok") is True
+    assert v.verify("tok") is True
+    assert s.posts == 2
+
+
+def test_transport_error_does_not_spend_the_token():
+    s = _Session(fail=True)
+    v = _verifier(s)
+    assert v.verify("tok") is False
+    s.fail = False
+    assert v.verify("tok") is True
@@ -0,0 +1,217 @@
+"""Derived data (counters, sort keys, search index, summaries) against a full
+recompute, on both backends: after mixed writes, rollbacks and rebuilds."""
+import random
+import threading
+
+import pytest
+
+from records import new_id
+from storage import ALL, KINDS, NEWEST_FIRST, Derived, MemoryStore, SQLiteStore, _tokens, flag
+
+
+def _spec(version=1, search=True):
+    return Derived(
+        counters={"tasks_done": ("tasks", flag("done")),
+                  "notes_mood": ("notes", lambda n: n.get("mood"))},
+        sort_keys={"notes": lambda n: n.get("ts"), "tasks": lambda t: t.get("title")},
+        summary=lambda tx: (ALL, {"tasks_done": tx.count("tasks_done")}),
+        search={"notes": lambda n: n.get("text")} if search else None,
+        version=version,
+    )
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryStore(_spec())
+    return SQLiteStore(str(tmp_path / "p.db"), _spec())
+
+
+WORDS = ["garden", "walk", "tea", "book", "music", "gardening", "nap"]
+MOODS = ["calm", "low", "cheerful"]
+
+
+def _note(rnd, i):
+    return {"id": new_id(), "mood": rnd.choice(MOODS), "ts": f"2025-01-01 {i:05d}",
+            "text": " ".join(rnd.sample(WORDS, 3))}
+
+
+def _task(rnd, i):
+    return {"id": new_id(), "title": f"task {i:05d}", "done": rnd.random() < 0.5}
+
+
+def _mixed_writes(store, username, rnd, n=200):
+    for i in range(n):
+        op = rnd.random()
+        with store.transaction(username) as tx:
+            doc = tx.load()
+            if op < 0.35 or not (doc["notes"] and doc["tasks"]):
+                tx.add("notes", _note(rnd, i))
+                tx.add("tasks", _task(rnd, i))
+            elif op < 0.55:
+                n = rnd.choice(doc["notes"])
+                tx.update("notes", n["id"], text=" ".join(rnd.sample(WORDS, 2)), mood=rnd.choice(MOODS))
+            elif op < 0.75:
+                tx.toggle("tasks", rnd.choice(doc["tasks"])["id"], "done")
+            elif op < 0.9:
+                tx.delete("notes", rnd.choice(doc["notes"])["id"])
+            else:
+                tx.delete("tasks", rnd.choice(doc["tasks"])["id"])
+
+
+def _recompute(derived, doc):
+    counts = {}
+    for kind in KINDS:
+        for rec in doc[kind]:
+            derived.count_changes(counts, kind, None, rec)
+    return {name: groups for name, groups in counts.items() if groups}
+
+
+def _matches(derived, recs, query):
+    words = list(dict.fromkeys(_tokens(query)))
+    out = set()
+    for rec in recs:
+        terms = derived.terms("notes", rec)
+        if all(w in terms for w in words[:-1]) and any(t.startswith(words[-1]) for t in terms):
+            out.add(rec["id"])
+    return out
+
+
+def _assert_consistent(store, username):
+    derived = store.derived
+    with store.transaction(username, readonly=True) as tx:
+        doc = tx.load()
+        counters = {name: groups for name, groups in tx.counters().items() if groups}
+        assert counters == _recompute(derived, doc)
+        for kind in ("notes", "tasks"):
+            keys = [derived.sort_key(kind, r) for r in tx.iter_sorted(kind)]
+            assert keys == sorted(derived.sort_key(kind, r) for r in doc[kind])
+            page, cursor = tx.page(kind, 10 ** 6)
+            assert cursor is None
+            assert [r["id"] for r in page] == [r["id"] for r in doc[kind]]
+        for query in ("garden", "gard", "walk tea", "tea walk", "book m", "nap"):
+            found, _ = tx.search("notes", query, 10 ** 6)
+            assert {r["id"] for r in found} == _matches(derived, doc["notes"], query), query
+    rows = dict(store.summaries(ALL))
+    assert rows[username] == {"tasks_done": counters.get("tasks_done", {}).get(ALL, 0)}
+
+
+def test_mixed_writes_match_a_recompute(store):
+    rnd = random.Random(7)
+    store.create("alice", {"tz": "UTC"})
+    store.create("bob", {"notes": [_note(rnd, i) for i in range(20)], "tasks": [_task(rnd, i) for i in range(20)]})
+    _assert_consistent(store, "bob")
+    _mixed_writes(store, "alice", rnd)
+    _mixed_writes(store, "bob", rnd)
+    _assert_consistent(store, "alice")
+    _assert_consistent(store, "bob")
+
+
+def test_rollback_restores_derived_data(store):
+    rnd = random.Random(11)
+    store.create("alice", {"notes": [_note(rnd, i) for i in range(30)], "tasks": [_task(rnd, i) for i in range(30)]})
+    with store.transaction("alice", readonly=True) as tx:
+        before, counters, version = tx.load(), tx.counters(), tx.version
+        before_hits = tx.search("notes", "garden", 100)[0]
+    with pytest.raises(RuntimeError):
+        with store.transaction("alice") as tx:
+            doc = tx.load()
+            tx.add("notes", _note(rnd, 99))
+            tx.update("notes", doc["notes"][0]["id"], text="nothing like before")
+            tx.delete("notes", doc["notes"][5]["id"])
+            tx.delete("tasks", doc["tasks"][3]["id"])
+            tx.toggle("tasks", doc["tasks"][4]["id"], "done")
+            tx.set_fields(tz="Europe/Paris")
+            raise RuntimeError("abort")
+    with store.transaction("alice", readonly=True) as tx:
+        assert tx.load() == before
+        assert tx.counters() == counters
+        assert tx.version == version
+        assert tx.search("notes", "garden", 100)[0] == before_hits
+    _assert_consistent(store, "alice")
+
+
+def test_search_follows_edits_and_deletes(store):
+    rid = new_id()
+    store.create("alice", {"notes": [{"id": rid, "mood": "calm", "ts": "1", "text": "Walked in the Garden"}]})
+    store.update("alice", "notes", rid, text="read a book")
+    with store.transaction("alice", readonly=True) as tx:
+        assert tx.search("notes", "garden", 10) == ([], None)
+        assert [r["id"] for r in tx.search("notes", "book", 10)[0]] == [rid]
+    store.delete("alice", "notes", rid)
+    with store.transaction("alice", readonly=True) as tx:
+        assert tx.search("notes", "book", 10) == ([], None)
+
+
+def _seed(path, version, patients=50, search=True):
+    rnd = random.Random(3)
+    store = SQLiteStore(path, _spec(version, search))
+    store.create_many([(f"p{i:03d}", {"notes": [_note(rnd, k) for k in range(10)],
+                                      "tasks": [_task(rnd, k) for k in range(5)]}) for i in range(patients)])
+    return store
+
+
+def test_derived_version_bump_rebuilds(tmp_path):
+    path = str(tmp_path / "p.db")
+    _seed(path, 1, search=False)
+    store = SQLiteStore(path, _spec(2), migrate=False)
+    with store.transaction("p000", readonly=True) as tx:
+        assert tx.search("notes", "garden", 10) == ([], None)  # not indexed under v1
+    assert store.migrate() is True
+    assert store.migrate() is False
+    for username in store.usernames():
+        _assert_consistent(store, username)
+    assert SQLiteStore(path, _spec(2), migrate=False).migrate() is False
+
+
+def test_concurrent_rebuilds(tmp_path):
+    path = str(tmp_path / "p.db")
+    _seed(path, 1, patients=300)
+    results, errors = [], []
+
+    def open_store():
+        # A busy timeout far shorter than the rebuild: waiters must not give up.
+        try:
+            results.append(SQLiteStore(path, _spec(2), timeout=0.01, migrate=False).migrate())
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=open_store) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert sorted(results) == [False] * 5 + [True]
+    store = SQLiteStore(path, _spec(2))
+    for username in store.usernames(limit=20):
+        _assert_consistent(store, username)
+
+
+def test_newest_first_kinds_page_in_order(store):
+    assert "notes" in NEWEST_FIRST
+    rnd = random.Random(5)
+    store.create("alice", {})
+    ids = [store.add("alice", "notes", _note(rnd, i))["id"] for i in range(12)]
+    with store.transaction("alice", readonly=True) as tx:
+        first, cursor = tx.page("notes", 5)
+        rest, end = tx.page("notes", 100, cursor)
+    assert end is None
+    assert [r["id"] for r in first + rest] == ids[::-1]
+
+
+def test_commit_and_rollback_hooks(store):
+    store.create("alice", {})
+    calls = []
+    with store.transaction("alice") as tx:
+        tx.add("tasks", _task(random.Random(1), 1))
+        tx.on_commit(lambda: calls.append("commit"))
+        tx.on_rollback(lambda: calls.append("rollback"))
+    assert calls == ["commit"]
+    calls.clear()
+    with pytest.raises(RuntimeError):
+        with store.transaction("alice") as tx:
+            tx.on_commit(lambda: calls.append("commit"))
+            tx.on_rollback(lambda: calls.append("rollback"))
+            raise RuntimeError("abort")
+    assert calls == ["rollback"]
@@ -0,0 +1,74 @@
+"""No .upload-* temp file outlives its request, however the upload ends."""
+import io
+import os
+
+import pytest
+
+
+@pytest.fixture
+def folders(webapp, tmp_path, monkeypatch):
+    monkeypatch.setattr(webapp, "UPLOAD_FOLDER", str(tmp_path / "uploads"))
+    monkeypatch.setattr(webapp.UploadRequest, "upload_tmp_dir", str(tmp_path / "uploads" / ".tmp"))
+    return tmp_path / "uploads"
+
+
+def _upload(client, name, data=b"%PDF-1.4 test"):
+    return client.post("/patient/upload", data={"file": (io.BytesIO(data), name)},
+                       content_type="multipart/form-data")
+
+
+def _temps(folders):
+    tmp = folders / ".tmp"
+    return os.listdir(tmp) if tmp.exists() else []
+
+
+def test_stored_and_duplicate(patient, folders):
+    assert _upload(patient, "a.pdf").status_code == 302
+    assert _upload(patient, "b.pdf").status_code == 302
+    blobs = [f for _, _, files in os.walk(folders) for f in files]
+    assert len(blobs) == 1
+    assert _temps(folders) == []
+
+
+def _blobs(folders):
+    return [f for d, _, files in os.walk(folders) if not d.endswith(".tmp") for f in files]
+
+
+def test_delete_after_reupload_removes_the_blob(webapp, patient, folders):
+    data = b"%PDF-1.4 " + os.urandom(8)
+    _upload(patient, "reupload.pdf", data)
+    assert len(_blobs(folders)) == 1
+    _upload(patient, "b.pdf", data)
+    (rec,) = [f for f in webapp.PATIENT_DB.load("patient")["files"] if f["name"] == "reupload.pdf"]
+    assert "refs" not in rec
+    r = patient.post("/patient/action", data={"action": "delete_file", "file_id": rec["id"]})
+    assert r.status_code == 302
+    assert rec["id"] not in {f["id"] for f in webapp.PATIENT_DB.load("patient")["files"]}
+    assert _blobs(folders) == []
+
+
+def test_rolled_back_delete_keeps_the_blob(webapp, patient, folders):
+    _upload(patient, "rollback.pdf", b"%PDF-1.4 " + os.urandom(8))
+    (rec,) = [f for f in webapp.PATIENT_DB.load("patient")["files"] if f["name"] == "rollback.pdf"]
+    with pytest.raises(RuntimeError):
+        with webapp.PATIENT_DB.transaction("patient") as tx:
+            webapp._delete_file(tx, {"file_id": rec["id"]})
+            assert _blobs(folders) == []  # gone while the write lock is held
+            raise RuntimeError("batch failed")
+    assert len(_blobs(folders)) == 1
+    assert rec["id"] in {f["id"] for f in webapp.PATIENT_DB.load("patient")["files"]}
+    assert os.listdir(folders / ".tmp") == []
+
+
+def test_rejected_type(patient, folders):
+    assert _upload(patient, "a.exe").status_code == 302
+    assert _temps(folders) == []
+
+
+def test_error_after_parse(webapp, patient, folders, monkeypatch):
+    def boom(*args, **kwargs):
+        raise RuntimeError("store down")
+
+    monkeypatch.setattr(webapp.PATIENT_DB, "transaction", boom)
+    assert _upload(patient, "a.pdf").status_code == 500
+    assert _temps(folders) == []
@@ -0,0 +1,196 @@
+"""Responsive derivatives (resized WebP + fallback) for gallery images.
+
+Originals stay where they are; derivatives go to ``static/derived`` named by
+the SHA-256 of the source bytes, so an unchanged image is never reprocessed
+and renaming or copying it costs nothing. Work runs in a process pool off
+the request path; until an image is ready the gallery just shows the
+original. ``manifest.json`` remembers (size, mtime) -> hash so a restart
+doesn't have to re-read every file.
+
+Needs Pillow. Without it the pipeline is disabled and nothing changes.
+"""
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    from PIL import Image
+except ImportError:  # optional: gallery falls back to the originals
+    Image = None
+
+WIDTHS = (320, 640, 960)
+WEBP_QUALITY = 80
+
+
+def _file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _derive(src, out_root, out_prefix, widths):
+    """Build every variant of ``src``; runs in a pool process.
+
+    Returns (hash, srcset) where srcset is {mime: [{"src", "w"}, ...]}.
+    """
+    digest = _file_hash(src)
+    shard = os.path.join(out_root, digest[:2])
+    sidecar = os.path.join(shard, digest + ".json")
+    if os.path.exists(sidecar):
+        with open(sidecar, encoding="utf-8") as fh:
+            return digest, json.load(fh)
+
+    os.makedirs(shard, exist_ok=True)
+    with Image.open(src) as im:
+        im.load()
+        has_alpha = im.mode in ("RGBA", "LA", "P")
+        im = im.convert("RGBA" if has_alpha else "RGB")
+        fallback_fmt, fallback_ext, fallback_mime = (
+            ("PNG", "png", "image/png") if has_alpha else ("JPEG", "jpg", "image/jpeg"))
+        # Never upscale; an image narrower than every width gets one variant.
+        targets = sorted({min(w, im.width) for w in widths})
+        srcset = {"image/webp": [], fallback_mime: []}
+        for w in targets:
+            h = max(1, round(im.height * w / im.width))
+            small = im.resize((w, h), Image.LANCZOS) if w != im.width else im
+            for fmt, ext, mime, opts in (
+                    ("WEBP", "webp", "image/webp", {"quality": WEBP_QUALITY, "method": 4}),
+                    (fallback_fmt, fallback_ext, fallback_mime, {"optimize": True})):
+                name = f"{digest}-{w}.{ext}"
+                tmp = os.path.join(shard, f".{name}.{os.getpid()}")
+                small.save(tmp, fmt, **opts)
+                os.replace(tmp, os.path.join(shard, name))
+                srcset[mime].append({"src": f"{out_prefix}/{digest[:2]}/{name}", "w": w})
+
+    tmp = f"{sidecar}.{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(srcset, fh)
+    os.replace(tmp, sidecar)
+    return digest, srcset
+
+
+class ThumbnailPipeline:
+    def __init__(self, static_root, out_prefix="derived", widths=WIDTHS, workers=2):
+        self.static_root = static_root
+        self.out_prefix = out_prefix
+        self.out_root = os.path.join(static_root, out_prefix)
+        self.widths = tuple(widths)
+        self.workers = workers
+        self.enabled = Image is not None
+        self._manifest_path = os.path.join(self.out_root, "manifest.json")
+        self._ready = {}  # rel -> {"key", "hash", "srcset"}; see load()
+        # Bumped whenever an image's srcset changes (for caches of rendered pages).
+        self.version = 0
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+
+    def load(self):
+        """Pick up the derivatives earlier runs built (their manifest)."""
+        ready = self._load_manifest()
+        with self._lock:
+            self._ready = {**ready, **self._ready}
+        return len(self._ready)
+
+    # ---- request path ----
+    def srcset(self, rel):
+        entry = self._ready.get(rel)
+        return entry["srcset"] if entry else None
+
+    def decorate(self, item):
+        """Gallery item plus its ``srcset`` if derivatives are ready."""
+        srcset = self.srcset(item["img"])
+        return {**item, "srcset": srcset} if srcset else item
+
+    # ---- background generation ----
+    def submit(self, rels):
+        """Queue any image that is new or changed since it was last derived."""
+        if not self.enabled or self.workers <= 0:
+            return
+        for rel in self._stale(rels):
+            with self._lock:
+                if rel in self._pending:
+                    continue
+                self._pending.add(rel)
+                fut = self._executor().submit(
+                    _derive, os.path.join(self.static_root, rel), self.out_root, self.out_prefix, self.widths)
+            fut.add_done_callback(lambda f, rel=rel: self._done(rel, f))
+
+    def warm(self, rels, workers=None, force=False, progress=None):
+        """Derive everything now, in parallel, and wait. Returns (built, failed)."""
+        if not self.enabled:
+            raise RuntimeError("Pillow is not installed")
+        todo = list(rels) if force else self._stale(rels)
+        built = failed = 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futs = {pool.submit(_derive, os.path.join(self.static_root, rel), self.out_root,
+                                self.out_prefix, self.widths): rel for rel in todo}
+            for fut in as_completed(futs):
+                if self._record(futs[fut], fut):
+                    built += 1
+                else:
+                    failed += 1
+                if progress:
+                    progress(built + failed, len(todo))
+        self._save_manifest()
+        return built, failed
+
+    # ---- internals ----
+    def _executor(self):
+        if self._pool is None or self._pool_pid != os.getpid():
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            self._pool_pid = os.getpid()
+        return self._pool
+
+    def _stat_key(self, rel):
+        try:
+            st = os.stat(os.path.join(self.static_root, rel))
+        except OSError:
+            return None
+        return [st.st_size, st.st_mtime_ns]
+
+    def _stale(self, rels):
+        out = []
+        for rel in rels:
+            entry = self._ready.get(rel)
+            if entry is None or entry["key"] != self._stat_key(rel):
+                out.append(rel)
+        return out
+
+    def _record(self, rel, fut):
+        try:
+            digest, srcset = fut.result()
+        except Exception:
+            return False
+        self._ready[rel] = {"key": self._stat_key(rel), "hash": digest, "srcset": srcset}
+        self.version += 1
+        return True
+
+    def _done(self, rel, fut):
+        with self._lock:
+            self._record(rel, fut)
+            self._pending.discard(rel)
+            idle = not self._pending
+        if idle:
+            self._save_manifest()
+
+    def _load_manifest(self):
+        try:
+            with open(self._manifest_path, encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self):
+        with self._lock:
+            snapshot = dict(self._ready)
+        os.makedirs(self.out_root, exist_ok=True)
+        tmp = f"{self._manifest_path}.{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(snapshot, fh)
+        os.replace(tmp, self._manifest_path)
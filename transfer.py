@@ -0,0 +1,144 @@
+"""Bulk export and import of patient data, as NDJSON (one JSON object per line).
+
+An export is a header line, then for each patient (in username order) a
+patient line, one line per record and one line per day of each time series::
+
+    {"format": "patients-ndjson", "version": 1}
+    {"patient": "alice", "fields": {"tz": "Europe/Paris", ...}}
+    {"kind": "notes", "record": {"id": "...", "text": "...", ...}}
+    {"series": "mood", "day": 739012, "events": [[1735725600.0, 4.0], ...]}
+
+``export_lines`` is a generator: it reads ``page`` usernames, records or
+days at a time, each in its own short read transaction, so memory stays
+flat however many patients there are and no lock is held while a slow
+client drains the response.
+
+``import_lines`` creates the patients the store doesn't have yet, ``batch``
+patients per write transaction (``store.create_many``); patients that
+already exist are skipped, so an interrupted import can simply be re-run.
+Only one patient's lines are held at a time, plus the pending batch.
+
+Uploaded files themselves are not part of the export: copy the upload
+folder alongside it. ``refs(kind, rec)`` names the reference counts a
+record holds (e.g. its upload blob) so the import can restore them.
+"""
+import json
+from datetime import date
+
+from history import DAY
+from storage import KINDS
+
+FORMAT = "patients-ndjson"
+VERSION = 1
+# Usernames, records or days read per read transaction on export.
+PAGE = 500
+# Patients created per write transaction on import.
+BATCH = 200
+LAST_DAY = date.max.toordinal()
+
+
+def _line(obj):
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False) + "\n"
+
+
+def export_lines(store, page=PAGE):
+    """Yield the whole store as NDJSON lines."""
+    yield _line({"format": FORMAT, "version": VERSION})
+    after = None
+    while True:
+        names = store.usernames(after=after, limit=page)
+        if not names:
+            return
+        for username in names:
+            yield from _patient_lines(store, username, page)
+        after = names[-1]
+
+
+def _patient_lines(store, username, page):
+    with store.transaction(username, readonly=True) as tx:
+        fields, series = tx.fields(), tx.series()
+    yield _line({"patient": username, "fields": fields})
+    for kind in KINDS:
+        cursor = None
+        while True:
+            with store.transaction(username, readonly=True) as tx:
+                recs, cursor = tx.page(kind, page, cursor)
+            for rec in recs:
+                yield _line({"kind": kind, "record": rec})
+            if cursor is None:
+                break
+    for name in series:
+        with store.transaction(username, readonly=True) as tx:
+            days = [day for day, _ in tx.rollups(name, DAY, 0, LAST_DAY)]
+        for i in range(0, len(days), page):
+            chunk = days[i:i + page]
+            with store.transaction(username, readonly=True) as tx:
+                chunk = tx.day_events(name, chunk[0], chunk[-1])
+            for day, events in chunk:
+                yield _line({"series": name, "day": day, "events": events})
+
+
+class _Patient:
+    def __init__(self, username, fields):
+        self.username = username
+        self.doc = dict(fields, **{kind: [] for kind in KINDS})
+        self.history = {}  # series -> [(day, events), ...]
+
+
+def import_lines(store, lines, batch=BATCH, refs=None, progress=None):
+    """Create the patients in an export (``lines``: str or bytes) that ``store``
+    lacks. Calls ``progress(seen, created)`` after each batch; returns
+    (created, skipped). Raises ValueError on a malformed line."""
+    pending, created, seen, patient = [], 0, 0, None
+
+    def fill(username, tx):
+        p = by_name[username]
+        for series, days in p.history.items():
+            tx.record_days(series, days)
+        if refs is not None:
+            for kind in KINDS:
+                for rec in p.doc[kind]:
+                    for key in refs(kind, rec):
+                        tx.adjust_ref(key, +1)
+
+    def flush():
+        nonlocal created, seen, by_name
+        by_name = {p.username: p for p in pending}
+        created += len(store.create_many([(p.username, p.doc) for p in pending], fill))
+        seen += len(pending)
+        pending.clear()
+        if progress is not None:
+            progress(seen, created)
+
+    by_name = {}
+    header = False
+    for n, raw in enumerate(lines, 1):
+        if not raw.strip():
+            continue
+        try:
+            item = json.loads(raw)
+            if not header:
+                if item.get("format") != FORMAT or item.get("version") != VERSION:
+                    raise ValueError(f"not a {FORMAT} v{VERSION} export")
+                header = True
+            elif "patient" in item:
+                if patient is not None:
+                    pending.append(patient)
+                    if len(pending) >= batch:
+                        flush()
+                patient = _Patient(item["patient"], item.get("fields") or {})
+            elif patient is None:
+                raise ValueError("data before the first patient")
+            elif "kind" in item:
+                patient.doc[item["kind"]].append(item["record"])
+            elif "series" in item:
+                patient.history.setdefault(item["series"], []).append((int(item["day"]), item["events"]))
+            else:
+                raise ValueError("unknown line")
+        except (KeyError, TypeError, ValueError) as exc:
+            raise ValueError(f"line {n}: {exc}") from exc
+    if patient is not None:
+        pending.append(patient)
+    if pending:
+        flush()
+    return created, seen - created
@@ -0,0 +1,130 @@
+"""Content-addressed storage for patient uploads.
+
+Werkzeug streams each uploaded file part into a ``HashingTempFile`` as it
+parses the request, so the SHA-256 is known as soon as the body has been
+read, without a second pass over the data. The file is then renamed (no
+copy) into a sharded tree::
+
+    uploads/ab/cd/abcd...ef.pdf
+
+Every temp file a request opens is discarded when the request is closed
+(Flask does that as the request context is popped, whatever the view did
+or raised), so an upload that is rejected, fails or is never looked at
+doesn't leave a ``.upload-*`` file behind; one that was stored has
+already been renamed away.
+
+A blob whose last reference goes is moved aside (``set_aside``) inside the
+deleting write transaction, while it holds the store's write lock, and
+only removed once that commits. So an upload of the same content always
+either records its reference before the blob is moved (and the delete
+leaves it alone) or finds it gone and stores it again; it never counts on
+a file about to be unlinked.
+
+Identical files are stored once, however many times or by however many
+patients they are uploaded. Bodies over ``MAX_CONTENT_LENGTH`` are refused
+with 413 before any of the body is read.
+"""
+import hashlib
+import os
+import tempfile
+import uuid
+
+from flask import Request
+
+
+class HashingTempFile:
+    """Writable/readable temp file that hashes everything written to it."""
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self._fh = tempfile.NamedTemporaryFile(dir=directory, prefix=".upload-", delete=False)
+        self.name = self._fh.name
+        self._sha = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self._sha.update(data)
+        self.size += len(data)
+        return self._fh.write(data)
+
+    def hexdigest(self):
+        return self._sha.hexdigest()
+
+    def discard(self):
+        self._fh.close()
+        try:
+            os.unlink(self.name)
+        except FileNotFoundError:
+            pass
+
+    def __getattr__(self, name):  # read/seek/tell/flush/close ...
+        return getattr(self._fh, name)
+
+
+class UploadRequest(Request):
+    """Request whose file parts on upload endpoints go to ``HashingTempFile``."""
+
+    upload_endpoints = set()
+    upload_tmp_dir = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._upload_tmps = []
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint in self.upload_endpoints and self.upload_tmp_dir:
+            tmp = HashingTempFile(self.upload_tmp_dir)
+            self._upload_tmps.append(tmp)
+            return tmp
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            while self._upload_tmps:
+                self._upload_tmps.pop().discard()
+
+
+def blob_path(digest, ext):
+    """Sharded relative path for a blob: ``ab/cd/<digest><ext>``."""
+    return f"{digest[:2]}/{digest[2:4]}/{digest}{ext}"
+
+
+def set_aside(root, rel, tmp_dir):
+    """Rename ``root/rel`` into ``tmp_dir`` (atomic, same filesystem).
+
+    Returns ``(drop, restore)``: ``drop()`` deletes it for good, ``restore()``
+    puts it back; None if there was nothing to move.
+    """
+    path = os.path.join(root, rel)
+    os.makedirs(tmp_dir, exist_ok=True)
+    aside = os.path.join(tmp_dir, f".deleted-{uuid.uuid4().hex}{os.path.splitext(rel)[1]}")
+    try:
+        os.replace(path, aside)
+    except FileNotFoundError:
+        return None
+
+    def drop():
+        try:
+            os.remove(aside)
+        except FileNotFoundError:
+            pass
+
+    def restore():
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(aside, path)  # same bytes as anything stored there since
+    return drop, restore
+
+
+def store_blob(tmp, root, rel):
+    """Move ``tmp`` to ``root/rel`` unless an identical blob is already there."""
+    dest = os.path.join(root, rel)
+    if os.path.exists(dest):
+        tmp.discard()
+        return False
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp.close()
+    os.chmod(tmp.name, 0o644)  # NamedTemporaryFile creates 0600
+    os.replace(tmp.name, dest)
+    return True